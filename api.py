@@ -1,27 +1,265 @@
-from fastapi import FastAPI
+import asyncio
+import gc
+import io
+import json
+import os
+import tempfile
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from llm_handler import chat_with_phi, reset_conversation
+import car_database
+from batch_recommend import BATCH_CHUNK_SIZE, BATCH_TOP_K, chunks, read_leads, recommend_chunk
+from car_database import (
+    LISTING_FIELDS, SEARCH_PAGE_SIZE, SORT_FIELDS, catalog_manager, search_page,
+    start_catalog_watch,
+)
+from catalog_ingest import _oid
+from llm_handler import achat_with_phi, astream_chat_with_phi, db_executor, reset_conversation, scheduler
+from prefetch import prefetcher
+from response_cache import cache_stats, llm_cache, pitch_cache
+from intent_classifier import get_intent_classifier
+from semantic_search import get_semantic_index
+from turn_log import close_turn_log, turn_log_stats
+import telemetry
+
+# Set APP_PRELOAD=1 when workers are forked from a parent that imported the
+# app (gunicorn --preload): the catalog, its derived indexes, the semantic
+# index and the intent model are then loaded once in the parent and frozen
+# out of the garbage collector, so workers share them copy-on-write instead
+# of each building its own copy. Use CAR_CATALOG_SOURCE=snapshot for a catalog read straight
+# from the memory-mapped file written by catalog_ingest.py.
+APP_PRELOAD = os.getenv("APP_PRELOAD", "0") == "1"
+
+
+def preload():
+    catalog_manager.current()
+    get_semantic_index()
+    get_intent_classifier()
+    # A MongoDB client must not cross a fork; workers open their own
+    car_database.close()
+    gc.freeze()
+
+
+if APP_PRELOAD:
+    preload()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Open MongoDB and load the first catalog snapshot (and its indexes)
+    # before serving, then keep it fresh in the background
+    loop = asyncio.get_running_loop()
+    if car_database.mongo_required():
+        await loop.run_in_executor(db_executor, car_database.connect)
+    await loop.run_in_executor(db_executor, catalog_manager.current)
+    await loop.run_in_executor(db_executor, get_semantic_index)
+    await loop.run_in_executor(db_executor, get_intent_classifier)
+    start_catalog_watch()
+    yield
+    catalog_manager.stop()
+    prefetcher.shutdown()
+    # Flush buffered turn records before the MongoDB client closes
+    close_turn_log()
+    car_database.close()
+
 
 app = FastAPI(
     title="Maruti Suzuki Car Salesman API",
     description="API backend for your Maruti Suzuki chatbot",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan
 )
 
 # Request and Response models
 class ChatRequest(BaseModel):
     user_message: str
+    # Omit on the first turn; reuse the session_id from the response afterwards
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     bot_response: str
+    session_id: str
+
+class ResetRequest(BaseModel):
+    session_id: str
+
+class SamplingRequest(BaseModel):
+    # Fraction of turns whose stages are timed, 0..1
+    rate: float
+
+class SearchQuery(BaseModel):
+    fuel_type: Optional[str] = None
+    car_type: Optional[str] = None
+    drive_type: Optional[str] = None
+    model: Optional[str] = None
+    seats: Optional[int] = None
+    family_size: Optional[int] = None
+    budget_min: Optional[float] = None
+    budget_max: Optional[float] = None
+    min_mileage: Optional[float] = None
+    max_mileage: Optional[float] = None
+    # Preference that sort=score ranks against (closeness to the budget)
+    budget: Optional[float] = None
+    sort: str = "price"
+    # asc or desc; defaults to cheapest, most efficient and best scored first
+    order: Optional[str] = None
+    # Clamped to 1..SEARCH_MAX_PAGE_SIZE
+    limit: int = SEARCH_PAGE_SIZE
+    # next_cursor of the previous page
+    cursor: Optional[str] = None
+
+# Default order per sort key
+SEARCH_DESCENDING = {"price": False, "mileage": True, "score": True}
+
+telemetry.register_gauge("llm_queue_depth", "LLM requests waiting for a slot.", lambda: scheduler.queued)
+telemetry.register_gauge("llm_in_flight", "LLM generations running.", lambda: scheduler.in_flight)
+telemetry.register_gauge("llm_requests_shed", "LLM requests shed so far because the queue was full.", lambda: scheduler.shed)
+telemetry.register_gauge("llm_cache_hit_rate", "LLM reply cache hit rate.", lambda: llm_cache.stats()["hit_rate"])
+telemetry.register_gauge("pitch_cache_hit_rate", "Sales pitch cache hit rate.", lambda: pitch_cache.stats()["hit_rate"])
+telemetry.register_gauge("prefetch_hit_rate", "Share of budget and pick steps served from a prefetch.", lambda: prefetcher.stats()["hit_rate"])
+telemetry.register_gauge("prefetch_cancelled", "Prefetches cancelled before they ran.", lambda: prefetcher.cancelled)
+telemetry.register_gauge("turn_log_pending", "Turn records waiting to be written.", lambda: turn_log_stats().get("pending", 0))
+telemetry.register_gauge("turn_log_dropped", "Turn records dropped because the buffer was full.", lambda: turn_log_stats().get("dropped", 0))
+telemetry.register_gauge("turn_log_failed", "Turn records lost to failed writes.", lambda: turn_log_stats().get("failed", 0))
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
-    bot_reply = chat_with_phi(request.user_message)
-    return ChatResponse(bot_response=bot_reply)
+    session_id = request.session_id or uuid.uuid4().hex
+    bot_reply = await achat_with_phi(request.user_message, session_id)
+    return ChatResponse(bot_response=bot_reply, session_id=session_id)
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Server-sent events: {"type": "token"} chunks as the reply is produced,
+    {"type": "replace"} when the partial reply must be discarded and
+    replaced, and a final {"type": "done"} carrying the session_id.
+    """
+    session_id = request.session_id or uuid.uuid4().hex
+
+    async def events():
+        async for kind, text in astream_chat_with_phi(request.user_message, session_id):
+            yield f"data: {json.dumps({'type': kind, 'content': text})}\n\n"
+        yield f"data: {json.dumps({'type': 'done', 'session_id': session_id})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 
 @app.post("/reset")
-async def reset_endpoint():
-    reset_conversation()
+async def reset_endpoint(request: ResetRequest):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(db_executor, reset_conversation, request.session_id)
     return {"message": "Conversation reset successfully!"}
+
+
+# Batch bodies up to this size stay in memory; larger ones spool to disk
+BATCH_SPOOL_BYTES = 1 << 20
+
+
+def _recommend_next(leads, k):
+    """Result lines for the next chunk of leads, or None after the last one."""
+    item = next(leads, None)
+    if item is None:
+        return None
+    start, chunk = item
+    lines, _ = recommend_chunk(chunk, start, k)
+    return lines
+
+
+@app.post("/recommend/batch")
+async def recommend_batch_endpoint(request: Request, k: int = Query(BATCH_TOP_K, ge=1)):
+    """
+    Lead records as JSONL, or as CSV with a header row when the content type
+    is text/csv. Streams one JSONL result line per lead, in input order.
+    """
+    fmt = "csv" if request.headers.get("content-type", "").startswith("text/csv") else "jsonl"
+    # The body is spooled as it arrives and parsed one chunk at a time, so
+    # neither the body nor its records are ever held in memory whole
+    spool = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_BYTES)
+    async for data in request.stream():
+        spool.write(data)
+    spool.seek(0)
+    leads = chunks(read_leads(io.TextIOWrapper(spool, encoding="utf-8", newline=""), fmt), BATCH_CHUNK_SIZE)
+    loop = asyncio.get_running_loop()
+
+    async def results():
+        try:
+            while (out := await loop.run_in_executor(db_executor, _recommend_next, leads, k)) is not None:
+                for line in out:
+                    yield line + "\n"
+        finally:
+            spool.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@app.get("/search")
+async def search_endpoint(query: SearchQuery = Depends()):
+    """
+    One page of matching cars, sorted by price, mileage or score, as
+    {"results": [...], "next_cursor": ...}. Pass next_cursor back with the
+    same filters for the next page; it is null after the last one.
+    """
+    if query.sort not in SORT_FIELDS:
+        raise HTTPException(400, f"sort must be one of {', '.join(SORT_FIELDS)}")
+    if query.order not in (None, "asc", "desc"):
+        raise HTTPException(400, "order must be asc or desc")
+    descending = SEARCH_DESCENDING[query.sort] if query.order is None else query.order == "desc"
+    params = query.model_dump(exclude_none=True)
+    filters = {key: value for key, value in params.items()
+               if key not in ("budget", "sort", "order", "limit", "cursor")}
+    prefs = {key: params[key] for key in ("budget", "family_size") if key in params}
+    loop = asyncio.get_running_loop()
+    try:
+        cars, next_cursor = await loop.run_in_executor(
+            db_executor, search_page, filters, query.sort, descending, query.limit, query.cursor, prefs,
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    def body():
+        # Written one car at a time, listing fields only
+        yield '{"results": ['
+        for i, car in enumerate(cars):
+            result = {"id": _oid(car), **{field: car[field] for field in LISTING_FIELDS if field in car}}
+            if "score" in car:
+                result["score"] = car["score"]
+            yield ("," if i else "") + json.dumps(result, ensure_ascii=False)
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
+    return StreamingResponse(body(), media_type="application/json")
+
+
+@app.get("/stats")
+async def stats_endpoint():
+    """LLM queue depth, wait times and shed counts, reply cache and prefetch hit rates."""
+    return {
+        "scheduler": scheduler.metrics(), "cache": cache_stats(), "prefetch": prefetcher.stats(),
+        "turn_log": turn_log_stats(),
+        "catalog": catalog_manager.current().info(),
+    }
+
+
+@app.post("/catalog/reload")
+async def catalog_reload_endpoint():
+    """Re-read the catalog source now; swaps only if the content changed."""
+    loop = asyncio.get_running_loop()
+    swapped = await loop.run_in_executor(db_executor, catalog_manager.refresh)
+    return {"swapped": swapped, **catalog_manager.current().info()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus scrape endpoint: stage histograms, branch counters, LLM queue gauges."""
+    return PlainTextResponse(telemetry.exposition(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/metrics/sampling")
+async def sampling_endpoint(request: SamplingRequest):
+    telemetry.set_sample_rate(request.rate)
+    return {"rate": telemetry.get_sample_rate()}
@@ -0,0 +1,262 @@
+"""
+Bulk recommendations for leads exported from the dealership CRM.
+
+Every lead (family size, fuel, body type, budget) gets the shortlist the
+chat's budget step would show: the same search_cars filters, evaluated
+against the in-memory catalog, and the same rank_cars scores, computed for
+a whole chunk of leads at once as (leads x variants) matrices. Results are
+written as JSONL, one line per lead, in input order.
+
+    python batch_recommend.py leads.csv --output recommendations.jsonl --workers 4
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice, repeat
+
+import numpy as np
+
+from car_database import catalog_manager
+from entity_extractor_manager import extract_budget, extract_car_type, extract_fuel_type
+from ranking import RECOMMENDATION_WEIGHTS, CarColumns, score_batch, top_k_batch
+from telemetry import timed
+
+# Leads scored per matrix; bounds memory at chunk x variants floats
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "2048"))
+# As many cars as the chat lists after the budget step
+BATCH_TOP_K = int(os.getenv("BATCH_TOP_K", "6"))
+# Same 10% flexibility as the chat's budget step
+BUDGET_FLEXIBILITY = 1.1
+
+LEAD_ID_FIELDS = ("id", "lead_id")
+
+RESULT_FIELDS = (
+    "Model", "Variant", "Model_Variant", "Fuel_Type", "Body_Type", "Seating_Capacity",
+    "Ex-Showroom_Price", "Ex-Showroom_Price_Value", "ARAI_Certified_Mileage",
+)
+
+
+def _serialized(car):
+    # A variant's result object without its closing brace; the per-lead
+    # score is appended when a line is written
+    return json.dumps({field: car.get(field) for field in RESULT_FIELDS}, ensure_ascii=False, default=str)[:-1]
+
+
+# Ranking columns and serialized results, rebuilt with every catalog snapshot
+catalog_manager.register_derived(
+    "batch", lambda catalog: (catalog, CarColumns(catalog.documents), [_serialized(car) for car in catalog.documents])
+)
+
+
+# === Leads ===
+def read_leads(stream, fmt="jsonl"):
+    """
+    Lead records from a CSV (with a header row) or JSONL stream. A line that
+    is not valid JSON is yielded as a ValueError so it gets an error result
+    without stopping the batch.
+    """
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield ValueError(f"invalid JSON: {e}")
+            continue
+        yield record if isinstance(record, dict) else ValueError("a lead must be a JSON object")
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _family_size(value):
+    if _blank(value):
+        return None
+    try:
+        size = int(float(value))
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid family_size: {value!r}")
+    if size <= 0:
+        raise ValueError(f"invalid family_size: {value!r}")
+    return size
+
+
+def _budget(value):
+    if _blank(value):
+        return None
+    if isinstance(value, (int, float)):
+        budget = value
+    else:
+        text = str(value).strip()
+        try:
+            budget = float(text.replace(",", ""))
+        except ValueError:
+            # "10 lakh", "800k": parsed like a chat message
+            budget = extract_budget(text)
+    if not budget or budget <= 0:
+        raise ValueError(f"invalid budget: {value!r}")
+    return int(budget)
+
+
+@lru_cache(maxsize=1024)
+def _category(text, extract):
+    # Known values map to the chat's canonical ones; anything else is a literal
+    return extract(text) or re.escape(text)
+
+
+def parse_lead(record):
+    """
+    (prefs, filters) for one lead record, as the chat's budget step builds
+    them from its user_info. Raises ValueError for unusable values; missing
+    ones simply do not filter.
+    """
+    family_size = _family_size(record.get("family_size"))
+    budget = _budget(record.get("budget"))
+    fuel_type = record.get("fuel_type")
+    fuel_type = None if _blank(fuel_type) else _category(str(fuel_type).strip(), extract_fuel_type)
+    car_type = record.get("car_type")
+    car_type = None if _blank(car_type) else _category(str(car_type).strip(), extract_car_type)
+
+    filters = {}
+    if family_size is not None:
+        filters["seats"] = family_size
+    if fuel_type is not None:
+        filters["fuel_type"] = fuel_type
+    if car_type is not None:
+        filters["car_type"] = car_type
+    if budget is not None:
+        filters["budget_max"] = budget * BUDGET_FLEXIBILITY
+    return {"family_size": family_size, "budget": budget}, filters
+
+
+def _lead_id(record, position):
+    if isinstance(record, dict):
+        for field in LEAD_ID_FIELDS:
+            if not _blank(record.get(field)):
+                return record[field]
+    return position
+
+
+# === Scoring ===
+@timed("batch_recommend")
+def recommend_chunk(records, start=0, k=BATCH_TOP_K):
+    """
+    (JSONL result lines, number of rejected leads) for a chunk of lead
+    records; start numbers leads without an id.
+    """
+    catalog, columns, serialized = catalog_manager.derived("batch")
+    lines = [None] * len(records)
+    leads = []
+    rejected = 0
+    for offset, record in enumerate(records):
+        lead_id = _lead_id(record, start + offset)
+        try:
+            if isinstance(record, Exception):
+                raise record
+            prefs, filters = parse_lead(record)
+        except ValueError as e:
+            lines[offset] = json.dumps({"id": lead_id, "error": str(e)}, ensure_ascii=False, default=str)
+            rejected += 1
+            continue
+        leads.append((offset, lead_id, prefs, filters))
+
+    if leads:
+        mask = catalog.mask_batch([filters for _, _, _, filters in leads])
+        prefs = {
+            key: np.array([[np.nan if p[key] is None else p[key]] for _, _, p, _ in leads], dtype=np.float64)
+            for key in ("family_size", "budget")
+        }
+        scores = score_batch(columns, prefs, RECOMMENDATION_WEIGHTS)
+        best = top_k_batch(scores, mask, k)
+        best_scores = np.round(np.take_along_axis(scores, np.maximum(best, 0), axis=1), 4).tolist()
+        best = best.tolist()
+        matches = mask.sum(axis=1).tolist()
+        for row, (offset, lead_id, _, _) in enumerate(leads):
+            recommendations = ", ".join(
+                f'{serialized[i]}, "score": {score}}}' for i, score in zip(best[row], best_scores[row]) if i >= 0
+            )
+            lines[offset] = (
+                f'{{"id": {json.dumps(lead_id, ensure_ascii=False, default=str)}, '
+                f'"matches": {matches[row]}, "recommendations": [{recommendations}]}}'
+            )
+    return lines, rejected
+
+
+def chunks(records, size=BATCH_CHUNK_SIZE):
+    """(start, records) chunks of an iterable of lead records."""
+    iterator = iter(records)
+    start = 0
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+def recommend_lines(records, k=BATCH_TOP_K, workers=1, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    (result lines, rejected leads) per chunk for every lead record, in input
+    order. workers > 1 spreads chunks over a process pool; the catalog is
+    loaded first so forked workers inherit it.
+    """
+    if workers <= 1:
+        for start, chunk in chunks(records, chunk_size):
+            yield recommend_chunk(chunk, start, k)
+        return
+
+    catalog_manager.derived("batch")
+    starts, pending = [], []
+    for start, chunk in chunks(records, chunk_size):
+        starts.append(start)
+        pending.append(chunk)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(recommend_chunk, pending, starts, repeat(k))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommend cars for a JSONL or CSV file of CRM leads")
+    parser.add_argument("leads", help="lead file (.csv or .jsonl), or - for stdin")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="input format (default: from the extension)")
+    parser.add_argument("--output", help="write JSONL results here instead of stdout")
+    parser.add_argument("--top-k", type=int, default=BATCH_TOP_K, help="recommendations per lead")
+    parser.add_argument("--workers", type=int, default=1, help="processes to spread chunks over")
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE, help="leads scored per matrix")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.leads.lower().endswith(".csv") else "jsonl")
+    source = sys.stdin if args.leads == "-" else open(args.leads, encoding="utf-8", newline="")
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+
+    start = time.perf_counter()
+    leads = errors = 0
+    try:
+        for lines, rejected in recommend_lines(read_leads(source, fmt), args.top_k, args.workers, args.chunk_size):
+            for line in lines:
+                output.write(line + "\n")
+            leads += len(lines)
+            errors += rejected
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    rate = leads / elapsed if elapsed else 0.0
+    print(f"Recommended for {leads} leads ({errors} rejected) in {elapsed:.2f}s ({rate:,.0f} leads/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Latency/throughput benchmark for the chat pipeline.
+
+Loads dataset.json into an in-process MongoDB stand-in (mongomock), replaces
+Ollama with a fake that answers after a fixed delay, and replays scripted
+multi-turn conversations at a configurable concurrency against the sync
+function API (chat_with_phi), the async one (achat_with_phi) and the FastAPI
+app (/chat). Reports p50/p95/p99 latency per stage and turns/sec as JSON,
+plus the prefetch hit rate; --think-time pauses between a conversation's
+turns like a user typing, which is when prefetches run.
+
+    python benchmarks/chat_pipeline.py --conversations 200 --concurrency 16 --output report.json
+
+Needs mongomock; the api target also needs httpx.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# (stage, message) turns of the guided flow, ending in an LLM fallback
+SCRIPTS = [
+    [("greeting", "hi"), ("family_size", "we are 4 people"), ("fuel", "diesel please"),
+     ("body", "a sedan"), ("budget", "around 10 lakh"), ("recommend", "which one is best?"),
+     ("fallback", "what about the warranty?")],
+    [("greeting", "hello"), ("family_size", "7 of us"), ("fuel", "petrol"),
+     ("body", "mpv"), ("budget", "12 lakh"), ("recommend", "what would you suggest"),
+     ("fallback", "can I get a discount?")],
+    [("greeting", "hey"), ("family_size", "just 2"), ("fuel", "cng"),
+     ("body", "hatchback"), ("budget", "6 lakh"), ("recommend", "which one should I choose"),
+     ("fallback", "how long is delivery?")],
+]
+
+# search_cars filter shapes timed in the "search" stage
+SEARCH_FILTERS = [
+    {"seats": 5, "fuel_type": "Diesel", "car_type": "Sedan", "budget_max": 1100000},
+    {"seats": 7, "fuel_type": "Petrol", "car_type": "Mpv", "budget_max": 1320000},
+    {"seats": 2, "fuel_type": "CNG", "car_type": "Hatchback", "budget_max": 660000},
+    {"budget_min": 500000, "budget_max": 800000},
+]
+
+
+def setup_environment(backend):
+    """Patch in mongomock, load the dataset and import the app."""
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("This benchmark needs mongomock: pip install mongomock")
+    import pymongo
+
+    pymongo.MongoClient = mongomock.MongoClient
+    # mongomock edits projection dicts in place (it pops and restores _id),
+    # which races when threads share car_database.LISTING_PROJECTION;
+    # pymongo never modifies them
+    find = mongomock.collection.Collection.find
+
+    def find_with_copied_projection(self, filter=None, projection=None, *args, **kwargs):
+        return find(self, filter, dict(projection) if projection else projection, *args, **kwargs)
+
+    mongomock.collection.Collection.find = find_with_copied_projection
+    os.environ.update(
+        MONGO_URI="mongodb://localhost", MONGO_DB="bench", MONGO_COLLECTION="cars",
+        CAR_CATALOG_BACKEND=backend, CAR_CATALOG_SOURCE="mongo", CHAT_SESSION_BACKEND="memory",
+    )
+
+    import car_database
+    from bson import ObjectId
+    from catalog_ingest import _oid, load_dataset
+
+    # The same ObjectId keys upsert_documents writes (its bulk_write path is
+    # not supported by mongomock); dataset.json holds them as {"$oid": ...}
+    docs = [dict(doc, _id=ObjectId(_oid(doc))) if _oid(doc) else dict(doc) for doc in load_dataset()]
+    car_database.collection.insert_many(docs)
+    car_database.ensure_indexes()
+
+
+def install_fake_llm(latency):
+    """Ollama stand-in that replies after a fixed delay (sync, async and streaming)."""
+    import ollama
+    import llm_handler
+
+    reply = "The Maruti Suzuki warranty covers 2 years or 40,000 km, extendable at the dealership."
+
+    def chat(model, messages, options=None, stream=False):
+        time.sleep(latency)
+        return {"message": {"content": reply}}
+
+    class AsyncClient:
+        async def chat(self, model, messages, options=None, stream=False):
+            await asyncio.sleep(latency)
+            if not stream:
+                return {"message": {"content": reply}}
+
+            async def tokens():
+                for token in reply.split(" "):
+                    yield {"message": {"content": token + " "}}
+            return tokens()
+
+    ollama.chat = chat
+    llm_handler._async_client = AsyncClient()
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def report(self, wall_seconds, unit="turns"):
+        stages = {}
+        for stage, values in self.samples.items():
+            ms = np.asarray(values) * 1000
+            stages[stage] = {
+                "count": len(values),
+                "mean_ms": round(float(ms.mean()), 3),
+                "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                "p95_ms": round(float(np.percentile(ms, 95)), 3),
+                "p99_ms": round(float(np.percentile(ms, 99)), 3),
+            }
+        count = sum(len(values) for values in self.samples.values())
+        return {
+            "wall_seconds": round(wall_seconds, 3),
+            unit: count,
+            f"{unit}_per_sec": round(count / wall_seconds, 1) if wall_seconds else 0.0,
+            "stages": stages,
+        }
+
+
+def _conversations(count):
+    return [(f"bench-{i}", SCRIPTS[i % len(SCRIPTS)]) for i in range(count)]
+
+
+def _fresh_scheduler():
+    # asyncio primitives bind to the first loop that waits on them, and every
+    # async target runs in its own loop
+    import llm_handler
+    from inference_scheduler import InferenceScheduler
+
+    old = llm_handler.scheduler
+    llm_handler.scheduler = InferenceScheduler(old.max_in_flight, old.max_queue, old.timeout)
+
+
+def _before_conversation(clear_caches):
+    if clear_caches:
+        from response_cache import invalidate_all
+        invalidate_all()
+
+
+def run_function(conversations, concurrency, clear_caches, think_time=0.0):
+    from llm_handler import chat_with_phi
+
+    recorder = Recorder()
+
+    def converse(item):
+        session_id, script = item
+        _before_conversation(clear_caches)
+        for stage, message in script:
+            start = time.perf_counter()
+            chat_with_phi(message, session_id)
+            recorder.add(stage, time.perf_counter() - start)
+            time.sleep(think_time)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(converse, conversations))
+    return recorder.report(time.perf_counter() - start)
+
+
+async def _run_concurrently(conversations, concurrency, converse):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(item):
+        async with semaphore:
+            await converse(item)
+
+    await asyncio.gather(*(limited(item) for item in conversations))
+
+
+def run_async(conversations, concurrency, clear_caches, think_time=0.0):
+    from llm_handler import achat_with_phi
+
+    recorder = Recorder()
+    _fresh_scheduler()
+
+    async def converse(item):
+        session_id, script = item
+        _before_conversation(clear_caches)
+        for stage, message in script:
+            start = time.perf_counter()
+            await achat_with_phi(message, session_id)
+            recorder.add(stage, time.perf_counter() - start)
+            await asyncio.sleep(think_time)
+
+    start = time.perf_counter()
+    asyncio.run(_run_concurrently(conversations, concurrency, converse))
+    return recorder.report(time.perf_counter() - start)
+
+
+def run_api(conversations, concurrency, clear_caches, think_time=0.0):
+    try:
+        import httpx
+    except ImportError:
+        raise SystemExit("The api target needs httpx: pip install httpx")
+    from api import app
+
+    recorder = Recorder()
+    _fresh_scheduler()
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            async def converse(item):
+                session_id, script = item
+                _before_conversation(clear_caches)
+                for stage, message in script:
+                    start = time.perf_counter()
+                    response = await http.post("/chat", json={"user_message": message, "session_id": session_id})
+                    response.raise_for_status()
+                    recorder.add(stage, time.perf_counter() - start)
+                    await asyncio.sleep(think_time)
+
+            await _run_concurrently(conversations, concurrency, converse)
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return recorder.report(time.perf_counter() - start)
+
+
+def run_search(repeat):
+    from car_database import search_cars
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for filters in SEARCH_FILTERS:
+            t = time.perf_counter()
+            search_cars(filters)
+            recorder.add("search", time.perf_counter() - t)
+    return recorder.report(time.perf_counter() - start, unit="searches")
+
+
+TARGETS = {"function": run_function, "async": run_async, "api": run_api}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--targets", default="function,async,api", help="comma-separated: " + ", ".join(TARGETS))
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake Ollama reply delay in seconds")
+    parser.add_argument("--backend", choices=["mongo", "memory"], default="mongo", help="CAR_CATALOG_BACKEND")
+    parser.add_argument("--search-repeat", type=int, default=200)
+    parser.add_argument("--clear-caches", action="store_true", help="drop reply caches before every conversation")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds between a conversation's turns")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    setup_environment(args.backend)
+    install_fake_llm(args.llm_latency)
+
+    report = {
+        "config": {
+            "conversations": args.conversations,
+            "concurrency": args.concurrency,
+            "llm_latency": args.llm_latency,
+            "backend": args.backend,
+            "clear_caches": args.clear_caches,
+            "think_time": args.think_time,
+        },
+        "targets": {"search": run_search(args.search_repeat)},
+    }
+    for target in args.targets.split(","):
+        # Fresh session ids per target so every run starts from a greeting
+        conversations = [(f"{target}-{sid}", script) for sid, script in _conversations(args.conversations)]
+        report["targets"][target] = TARGETS[target](conversations, args.concurrency, args.clear_caches, args.think_time)
+
+    from prefetch import prefetcher
+    report["prefetch"] = prefetcher.stats()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Micro-benchmark for per-message entity extraction.
+
+Compares the previous per-pattern implementation (eight re.search calls plus
+linear substring scans, reproduced below as the baseline) with the shared
+single-pass engine in entity_extractor_manager, on a synthetic corpus.
+The engine must first reproduce the expected extraction of CHECKS, and
+name resolution the cars of NAME_CHECKS.
+
+    python benchmarks/entity_extraction.py --messages 20000
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import entity_extractor_manager as engine  # noqa: E402
+
+# === Baseline: extraction as it was before the shared engine ===
+
+def legacy_extract_entities(user_input):
+    entities = {}
+    text = user_input.lower()
+    seats_match = re.search(r"(\d+)\s*(seats|people|members)", text)
+    if seats_match:
+        entities["seats"] = int(seats_match.group(1))
+    if "seats" not in entities and "family_size" not in entities:
+        for key, value in {"nuclear": 3, "small": 4, "medium": 5, "big": 6, "large": 7, "joint": 7}.items():
+            if key in text:
+                entities["family_size"] = value
+                break
+    if "petrol" in text:
+        entities["fuel_type"] = "Petrol"
+    elif "diesel" in text:
+        entities["fuel_type"] = "Diesel"
+    elif "cng" in text:
+        entities["fuel_type"] = "CNG"
+    elif "electric" in text:
+        entities["fuel_type"] = "Electric"
+    if "automatic" in text:
+        entities["transmission"] = "Automatic"
+    elif "manual" in text:
+        entities["transmission"] = "Manual"
+    for body in ["hatchback", "sedan", "suv", "mpv", "muv", "van", "crossover"]:
+        if body in text:
+            entities["car_type"] = body.capitalize()
+            break
+    if re.search(r"four[- ]?wheel|4wd", text):
+        entities["drive_type"] = "Four Wheel Drive"
+    elif re.search(r"rear[- ]?wheel", text):
+        entities["drive_type"] = "Rear Wheel Drive"
+    elif re.search(r"front[- ]?wheel", text):
+        entities["drive_type"] = "Front Wheel Drive"
+    range_match = re.search(
+        r"(between|from)?\s*₹?\s*(\d+)\s*(lakh|lakhs)?\s*(to|and|-)\s*₹?\s*(\d+)\s*(lakh|lakhs)?", text
+    )
+    if range_match:
+        entities["budget_min"] = int(range_match.group(2)) * 100000
+        entities["budget_max"] = int(range_match.group(5)) * 100000
+    else:
+        max_match = re.search(r"(under|below|less than)\s*₹?\s*(\d+)\s*(lakh|lakhs)?", text)
+        if max_match:
+            entities["budget_max"] = int(max_match.group(2)) * 100000
+        min_match = re.search(r"(above|over|more than)\s*₹?\s*(\d+)\s*(lakh|lakhs)?", text)
+        if min_match:
+            entities["budget_min"] = int(min_match.group(2)) * 100000
+    mileage_above = re.search(r"(mileage\s*(above|over|more than))\s*(\d+)", text)
+    if mileage_above:
+        entities["arai_mileage_min"] = int(mileage_above.group(3))
+    mileage_below = re.search(r"(mileage\s*(under|below|less than))\s*(\d+)", text)
+    if mileage_below:
+        entities["arai_mileage_max"] = int(mileage_below.group(3))
+    mileage_range = re.search(r"mileage\s*(between|from)?\s*(\d+)\s*(to|and|-)\s*(\d+)", text)
+    if mileage_range:
+        entities["arai_mileage_min"] = int(mileage_range.group(2))
+        entities["arai_mileage_max"] = int(mileage_range.group(4))
+    return entities
+
+
+def legacy_turn(message):
+    """Everything main.py evaluated per message before the engine."""
+    text = message.lower()
+    any(topic in text for topic in engine.IRRELEVANT_TOPICS)
+    any(trigger in text for trigger in engine.RECOMMENDATION_TRIGGERS)
+    any(trigger in text for trigger in engine.OFF_TOPIC_TRIGGERS)
+    return legacy_extract_entities(message)
+
+
+def engine_turn(message):
+    result = engine.scan(message)
+    result.has("irrelevant_topic")
+    result.has("recommendation_trigger")
+    result.has("off_topic")
+    return engine.extract_entities(message)
+
+
+# === Checks ===
+# (message, extract_entities, extract_budget) the engine must reproduce
+CHECKS = [
+    ("my budget is 8 lac", {}, 800000),
+    ("8 lacs", {}, 800000),
+    ("8 lakhs", {}, 800000),
+    ("8.5 l", {}, 850000),
+    ("800k", {}, 800000),
+    ("under 8 lac", {"budget_max": 800000}, 800000),
+    ("between 5 and 8 lakh", {"budget_min": 500000, "budget_max": 800000}, 5),
+    ("petrol suv above 6 lakhs", {"fuel_type": "Petrol", "car_type": "Suv", "budget_min": 600000}, 600000),
+    ("mileage under 20", {"arai_mileage_max": 20}, 20),
+    ("a crossover 8 seater", {"car_type": "Crossover"}, 8),
+    ("over 5 people", {"seats": 5}, 5),
+]
+
+
+# (message, car resolve_car must find or None)
+NAME_CHECKS = [
+    ("tell me about the swift", "Swift"),
+    ("is the swfit good", "Swift"),
+    ("breeza price", "Vitara Brezza"),
+    ("wagon-r on road price", "Wagon"),
+    ("can i shift gears easily", None),
+    ("i need an espresso first", None),
+    ("what's across the road", None),
+    ("press start to drive", None),
+]
+
+
+def check_extraction():
+    """Messages whose extraction or resolved car differs from CHECKS and NAME_CHECKS."""
+    failures = []
+    for message, entities, budget in CHECKS:
+        got = (engine.extract_entities(message), engine.extract_budget(message))
+        if got != (entities, budget):
+            failures.append({"message": message, "expected": [entities, budget], "got": list(got)})
+
+    os.environ.setdefault("CAR_CATALOG_BACKEND", "memory")
+    os.environ.setdefault("CAR_CATALOG_SOURCE", "json")
+    from name_resolver import resolve_car
+
+    for message, name in NAME_CHECKS:
+        candidate = resolve_car(message)
+        got = candidate.doc["Model"] if candidate else None
+        if got != name:
+            failures.append({"message": message, "expected": name, "got": got})
+    return failures
+
+
+# === Synthetic corpus ===
+_TEMPLATES = [
+    "hi, we are a family of {n} people looking for a {fuel} {body}",
+    "my budget is between {lo} and {hi} lakhs, prefer {trans} transmission",
+    "need a {body} under {hi} lakh with mileage above {mileage}",
+    "which one is best for a {family} family? {fuel} please",
+    "show me {fuel} {body} with {drive} from {lo} to {hi} lakh",
+    "tell me about the {model} {fuel} variant",
+    "is the {model} better than a {body} for {n} members",
+    "I want {n} seats, {trans}, above {lo} lakh, mileage between {mileage} and {mileage2}",
+    "what would you suggest for a long highway trip with luggage",
+    "can you compare service costs and warranty for the {model}",
+]
+_VALUES = {
+    "fuel": ["petrol", "diesel", "cng", "electric"],
+    "body": ["hatchback", "sedan", "suv", "mpv", "crossover"],
+    "trans": ["automatic", "manual"],
+    "drive": ["four wheel drive", "4wd", "front-wheel drive", "rear wheel"],
+    "family": ["nuclear", "small", "medium", "big", "joint"],
+    "model": ["Swift", "Dzire Tour", "Baleno", "Alto", "Brezza", "Eeco", "Ertiga", "Ciaz"],
+}
+
+
+def _tag(i):
+    letters = ""
+    while True:
+        i, rest = divmod(i, 26)
+        letters += chr(ord("a") + rest)
+        if not i:
+            return letters
+
+
+def synthetic_corpus(size, seed=7):
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(size):
+        values = {key: rng.choice(options) for key, options in _VALUES.items()}
+        lo = rng.randint(3, 9)
+        values.update(n=rng.randint(2, 8), lo=lo, hi=lo + rng.randint(1, 6),
+                      mileage=rng.randint(14, 22), mileage2=rng.randint(23, 28))
+        # A unique (digit-free) suffix keeps scan's per-text cache from hiding the work
+        corpus.append(rng.choice(_TEMPLATES).format(**values) + " " + _tag(i))
+    return corpus
+
+
+def _messages_per_second(func, corpus, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        engine.scan.cache_clear()
+        start = time.perf_counter()
+        for message in corpus:
+            func(message)
+        best = min(best, time.perf_counter() - start)
+    return len(corpus) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    failures = check_extraction()
+    if failures:
+        raise SystemExit("Extraction checks failed:\n" + json.dumps(failures, indent=2))
+
+    corpus = synthetic_corpus(args.messages)
+    before = _messages_per_second(legacy_turn, corpus, args.repeat)
+    after = _messages_per_second(engine_turn, corpus, args.repeat)
+    print(json.dumps({
+        "messages": len(corpus),
+        "before_msgs_per_sec": round(before),
+        "after_msgs_per_sec": round(after),
+        "speedup": round(after / before, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+LLM calls saved by intent routing on a replay corpus.
+
+Replays recorded conversations through chat_with_phi twice, with
+INTENT_ROUTING off and on, against an Ollama stand-in that only counts
+calls. Reports the LLM calls of each run, the calls saved, the branch
+that answered every turn (and the intent, for routed turns) and the
+classifier's per-turn latency.
+
+    python benchmarks/intent_replay.py --corpus benchmarks/replay_corpus.jsonl
+
+Corpus lines are {"session": id, "turns": [message, ...]}. The intent model
+must be trained first (python intent_classifier.py train).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replay_corpus.jsonl")
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay(conversations, routing, tag):
+    """
+    LLM calls made, the branch that answered each turn and the intents of
+    the routed turns, replaying every conversation once.
+    """
+    import ollama
+    import llm_handler
+    from intent_classifier import classify
+    from response_cache import invalidate_all
+
+    calls = []
+
+    def chat(model, messages, options=None, stream=False):
+        calls.append(messages[-1]["content"])
+        return {"message": {"content": "Our dealership team can help with that."}}
+
+    ollama.chat = chat
+    llm_handler.INTENT_ROUTING = routing
+    invalidate_all()
+
+    branches, intents = Counter(), Counter()
+    answered = []
+    original_set_branch = llm_handler.set_branch
+
+    def set_branch(branch):
+        answered.append(branch)
+        original_set_branch(branch)
+
+    llm_handler.set_branch = set_branch
+    try:
+        for conversation in conversations:
+            session_id = f"{tag}-{conversation['session']}"
+            for message in conversation["turns"]:
+                answered.clear()
+                llm_handler.chat_with_phi(message, session_id)
+                # The last branch set wins, as in the turn telemetry
+                branch = answered[-1] if answered else "rule"
+                branches[branch] += 1
+                if branch == "intent":
+                    intents[classify(message).name] += 1
+    finally:
+        llm_handler.set_branch = original_set_branch
+    return calls, branches, intents
+
+
+def classifier_latency(conversations):
+    from intent_classifier import get_intent_classifier
+
+    classifier = get_intent_classifier()
+    messages = [message for conversation in conversations for message in conversation["turns"]]
+    classifier.predict(messages[0])
+    timings = []
+    for message in messages:
+        start = time.perf_counter()
+        classifier.predict(message)
+        timings.append(time.perf_counter() - start)
+    us = np.asarray(timings) * 1e6
+    return {"p50_us": round(float(np.percentile(us, 50)), 1), "p99_us": round(float(np.percentile(us, 99)), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    os.environ.setdefault("CHAT_SESSION_BACKEND", "memory")
+    os.environ.setdefault("CAR_CATALOG_BACKEND", "memory")
+    os.environ.setdefault("CAR_CATALOG_SOURCE", "json")
+
+    from intent_classifier import INTENT_CONFIDENCE, get_intent_classifier
+
+    if get_intent_classifier() is None:
+        raise SystemExit("No intent model; run: python intent_classifier.py train")
+
+    conversations = load_corpus(args.corpus)
+    baseline_calls, baseline_branches, _ = replay(conversations, routing=False, tag="keywords")
+    routed_calls, routed_branches, intents = replay(conversations, routing=True, tag="intents")
+
+    turns = sum(len(conversation["turns"]) for conversation in conversations)
+    saved = len(baseline_calls) - len(routed_calls)
+    report = {
+        "corpus": os.path.relpath(args.corpus),
+        "conversations": len(conversations),
+        "turns": turns,
+        "confidence_threshold": INTENT_CONFIDENCE,
+        "llm_calls_keywords_only": len(baseline_calls),
+        "llm_calls_with_intents": len(routed_calls),
+        "llm_calls_saved": saved,
+        "saved_pct": round(100 * saved / len(baseline_calls), 1) if baseline_calls else 0.0,
+        "answered_by_keywords_only": dict(baseline_branches.most_common()),
+        "answered_by_with_intents": dict(routed_branches.most_common()),
+        "intent_answers": dict(intents.most_common()),
+        "classifier_latency": classifier_latency(conversations),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Checks semantic_search against a small labelled query set.
+
+Each query is labelled with what its answer must satisfy (a condition on
+the typed catalog fields) or with None when it must not be answered at
+all. Builds the index into a temporary path, then reports every query's
+top score and the precision of the variants semantic_answer would list,
+and fails when a labelled query goes unanswered, an unlabelled one is
+answered, or fewer than SEMANTIC_MIN_PRECISION of a reply's variants fit.
+
+    python benchmarks/semantic_calibration.py
+
+The spread between the lowest answered and highest unanswered score is
+reported too, as a guide for SEMANTIC_ANSWER_SCORE with another embedder.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import semantic_search  # noqa: E402
+from catalog_ingest import load_dataset  # noqa: E402
+
+SEMANTIC_MIN_PRECISION = 2 / 3
+
+
+def _automatic(doc):
+    return str(doc.get("Type", "")).lower() in ("automatic", "amt")
+
+
+def _at_least(field, value):
+    return lambda doc: (doc.get(field) or 0) >= value
+
+
+def _all(*conditions):
+    return lambda doc: all(condition(doc) for condition in conditions)
+
+
+# (query, condition every listed variant should meet, or None: no answer)
+QUERIES = [
+    ("quiet car with big boot for highway trips", _at_least("Boot_Space_Value", 350)),
+    ("spacious car for long trips with luggage", _at_least("Boot_Space_Value", 350)),
+    ("7 seater with high ground clearance",
+     _all(_at_least("Seating_Capacity", 7), _at_least("Ground_Clearance_Value", 180))),
+    ("large family people mover", _at_least("Seating_Capacity", 7)),
+    ("fuel efficient automatic for city traffic", _all(_automatic, _at_least("ARAI_Certified_Mileage_Value", 21))),
+    ("automatic gearbox for easy city driving", _automatic),
+    ("economical car with low running cost", _at_least("ARAI_Certified_Mileage_Value", 23)),
+    ("cheap entry level car", lambda doc: (doc.get("Ex-Showroom_Price_Value") or 0) <= 500000),
+    ("powerful suv for rough roads",
+     lambda doc: doc.get("Body_Type") == "SUV"
+     and ((doc.get("Power_Value") or 0) >= 90 or (doc.get("Ground_Clearance_Value") or 0) >= 180)),
+    ("premium sedan with a big boot", lambda doc: doc.get("Body_Type") == "Sedan"),
+    ("what is the weather today", None),
+    ("tell me a joke", None),
+    ("can i get a loan", None),
+    ("who won the cricket match yesterday", None),
+    ("write me a poem about the sea", None),
+    ("how do i reset my password", None),
+    # Guided-flow answers and service questions are not spec-sheet questions
+    ("we are 4 people", None),
+    ("just 2", None),
+    ("10 lakh", None),
+    ("how long is delivery?", None),
+]
+
+
+def evaluate(index, docs, answer_score):
+    by_name = {doc["Model_Variant"]: doc for doc in docs}
+    results = []
+    for query, condition in QUERIES:
+        matches = index.search(query.lower(), semantic_search.SEMANTIC_TOP_K * 4)
+        top = matches[0].score if matches else 0.0
+        listed, seen = [], set()
+        for match in matches:
+            if match.model not in seen:
+                seen.add(match.model)
+                listed.append(match.name)
+            if len(listed) == semantic_search.SEMANTIC_TOP_K:
+                break
+        answered = semantic_search.answerable(query) and top >= answer_score
+        result = {"query": query, "top_score": round(top, 3), "answered": answered, "listed": listed}
+        if condition is None:
+            result["ok"] = not answered
+        else:
+            fit = sum(1 for name in listed if condition(by_name[name]))
+            result["precision"] = round(fit / len(listed), 2) if listed else 0.0
+            result["ok"] = answered and result["precision"] >= SEMANTIC_MIN_PRECISION
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default=semantic_search.SEMANTIC_MODEL,
+                        help="embedder to calibrate (default: SEMANTIC_MODEL)")
+    parser.add_argument("--answer-score", type=float, default=semantic_search.SEMANTIC_ANSWER_SCORE)
+    args = parser.parse_args()
+
+    docs = load_dataset()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "semantic_index")
+        semantic_search.build_index(docs, path, semantic_search.create_embedder(args.model))
+        results = evaluate(semantic_search.SemanticIndex.load(path), docs, args.answer_score)
+
+    labelled = [r["top_score"] for (_, condition), r in zip(QUERIES, results) if condition is not None]
+    # Messages answerable() turns away never reach the threshold
+    unlabelled = [r["top_score"] for (query, condition), r in zip(QUERIES, results)
+                  if condition is None and semantic_search.answerable(query)]
+    failed = [r["query"] for r in results if not r["ok"]]
+    print(json.dumps({
+        "answer_score": args.answer_score,
+        "lowest_labelled_score": min(labelled),
+        "highest_unlabelled_score": max(unlabelled, default=0.0),
+        "queries": results,
+        "failed": failed,
+    }, indent=2))
+    if failed:
+        raise SystemExit(f"{len(failed)} semantic checks failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Cold-start and worker-memory benchmark for the API.
+
+Starts fresh interpreters and measures how long `import api` takes, how long
+the lifespan hook takes until the catalog and its indexes are ready, the
+first chat turn, and which heavy dependencies were imported along the way.
+With --workers it also forks workers from a parent that preloaded the app
+(APP_PRELOAD=1) and from a bare parent, and compares their memory as
+reported by /proc/self/smaps_rollup (Linux only).
+
+    python benchmarks/startup.py --runs 5 --workers 4 --output startup.json
+
+Uses the in-memory backend over the memory-mapped catalog snapshot by
+default, so no MongoDB is needed; the snapshot is written first if missing.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Modules a fast start should not import before they are needed
+HEAVY_MODULES = ("pymongo", "ollama", "httpx", "sentence_transformers")
+
+# Timings of one cold start, printed as JSON by a fresh interpreter
+STARTUP_PROBE = r"""
+import asyncio, json, resource, sys, time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+modules = len(sys.modules)
+
+async def main():
+    async with api.lifespan(api.app):
+        ready = time.perf_counter()
+        await api.achat_with_phi("hi", "startup-probe")
+        return ready, time.perf_counter()
+
+ready, first_turn = asyncio.run(main())
+print(json.dumps({
+    "import_seconds": imported - start,
+    "ready_seconds": ready - imported,
+    "first_turn_seconds": first_turn - ready,
+    "modules": modules,
+    "heavy_modules": heavy,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+# Forks workers (after preloading the app when asked), lets each serve a few
+# turns, then reads their memory once all of them are alive
+WORKERS_PROBE = r"""
+import json, os, sys
+workers, preload = int(sys.argv[1]), sys.argv[2] == "1"
+if preload:
+    os.environ["APP_PRELOAD"] = "1"
+    import api
+
+def memory():
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss_mb": values["Rss"] / 1024,
+        "pss_mb": values["Pss"] / 1024,
+        "private_mb": (values["Private_Clean"] + values["Private_Dirty"]) / 1024,
+    }
+
+go_read, go_write = os.pipe()
+children = []
+for _ in range(workers):
+    result_read, result_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        import api
+        from car_database import search_cars
+        from llm_handler import chat_with_phi
+        api.catalog_manager.current()
+        api.get_semantic_index()
+        for message in ("hi", "cheapest diesel sedan", "tell me about the swift"):
+            chat_with_phi(message, "worker")
+        search_cars({"fuel_type": "Petrol", "budget_max": 800000})
+        os.read(go_read, 1)
+        os.write(result_write, json.dumps(memory()).encode())
+        os._exit(0)
+    os.close(result_write)
+    children.append((pid, result_read))
+
+os.write(go_write, b"x" * workers)
+results = []
+for pid, result_read in children:
+    with os.fdopen(result_read) as f:
+        results.append(json.loads(f.read()))
+    os.waitpid(pid, 0)
+print(json.dumps(results))
+"""
+
+
+def _environment(source):
+    env = dict(os.environ)
+    env.update(
+        CAR_CATALOG_BACKEND="memory", CAR_CATALOG_SOURCE=source, CAR_CATALOG_WATCH="none",
+        CHAT_SESSION_BACKEND="memory", PYTHONPATH=ROOT,
+    )
+    env.pop("APP_PRELOAD", None)
+    return env
+
+
+def _run(code, env, *args, flags=()):
+    prelude = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n"
+    completed = subprocess.run(
+        [sys.executable, *flags, "-c", prelude + code, *args],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return completed
+
+
+def _summary(values):
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "mean": round(float(values.mean()), 4),
+        "min": round(float(values.min()), 4),
+        "max": round(float(values.max()), 4),
+    }
+
+
+def measure_startup(env, runs):
+    probes = [json.loads(_run(STARTUP_PROBE, env).stdout.strip().splitlines()[-1]) for _ in range(runs)]
+    report = {
+        key: _summary([probe[key] for probe in probes])
+        for key in ("import_seconds", "ready_seconds", "first_turn_seconds", "max_rss_mb")
+    }
+    report["modules"] = probes[-1]["modules"]
+    report["heavy_modules"] = probes[-1]["heavy_modules"]
+    return report
+
+
+def slowest_imports(env, count=10):
+    """Largest cumulative import times under `import api`, from -X importtime."""
+    stderr = _run("import api", env, flags=("-X", "importtime")).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in sorted(rows, reverse=True)[:count]]
+
+
+def measure_workers(env, workers):
+    report = {}
+    for mode, preload in (("preloaded", "1"), ("cold", "0")):
+        results = json.loads(_run(WORKERS_PROBE, env, str(workers), preload).stdout.strip().splitlines()[-1])
+        report[mode] = {
+            "workers": len(results),
+            "private_mb": _summary([r["private_mb"] for r in results]),
+            "rss_mb": _summary([r["rss_mb"] for r in results]),
+            "total_pss_mb": round(sum(r["pss_mb"] for r in results), 1),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to average")
+    parser.add_argument("--workers", type=int, default=0, help="also compare memory of this many forked workers")
+    parser.add_argument("--source", choices=["snapshot", "json"], default="snapshot", help="CAR_CATALOG_SOURCE")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    if args.source == "snapshot":
+        from car_catalog import SNAPSHOT_PATH
+        from catalog_ingest import load_dataset, write_snapshot
+
+        if not os.path.exists(SNAPSHOT_PATH + ".meta.json"):
+            write_snapshot(load_dataset())
+
+    env = _environment(args.source)
+    report = {
+        "config": {"runs": args.runs, "source": args.source},
+        "startup": measure_startup(env, args.runs),
+        "slowest_imports": slowest_imports(env),
+    }
+    if args.workers:
+        if not os.path.exists("/proc/self/smaps_rollup"):
+            raise SystemExit("--workers needs /proc/self/smaps_rollup (Linux)")
+        report["workers"] = measure_workers(env, args.workers)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import re
+
+import numpy as np
+
+from catalog_ingest import (
+    DATASET_PATH, SNAPSHOT_PATH, _oid, load_dataset, load_snapshot, normalize_document, snapshot_documents
+)
+
+# Categorical columns kept as integer codes into a small per-column vocabulary.
+# Each entry maps the filter key used by search_cars to the document field.
+CATEGORICAL_FIELDS = {
+    "fuel_type": "Fuel_Type",
+    "car_type": "Body_Type",
+    "drive_type": "Drivetrain",
+    "model": "Model",
+}
+
+_CODE_CACHE_SIZE = 256
+
+
+def min_seats(filters: dict):
+    """
+    Seating capacity a filter dict requires, or None. Same semantics as the
+    MongoDB query in car_database.search_cars: family_size (plus the
+    driver) wins over seats.
+    """
+    if "family_size" in filters:
+        family_size = filters["family_size"]
+        return family_size + 1 if isinstance(family_size, int) else 4
+    return filters.get("seats")
+
+
+def _regex_codes(vocabulary, pattern):
+    """Codes of the vocabulary entries a case-insensitive $regex would match."""
+    try:
+        compiled = re.compile(pattern, re.IGNORECASE)
+    except re.error:
+        return np.empty(0, dtype=np.int32)
+    return np.array(
+        [code for code, value in enumerate(vocabulary) if compiled.search(value)],
+        dtype=np.int32,
+    )
+
+
+class CarCatalog:
+    """
+    Read-only, in-memory copy of the car collection.
+
+    Numeric attributes live in NumPy columns and categorical attributes are
+    stored as integer codes, so search_cars filters become vectorized boolean
+    masks instead of MongoDB round trips. Documents are returned as stored and
+    must be treated as read-only by callers.
+    """
+
+    def __init__(self, documents, records=None):
+        self.documents = [normalize_document(dict(doc)) for doc in documents]
+        docs = self.documents
+
+        if records is not None:
+            # Views of the (memory-mapped) snapshot, shared through the page
+            # cache by every process that maps the same file
+            self.price = records["Ex-Showroom_Price_Value"]
+            self.mileage = records["ARAI_Certified_Mileage_Value"]
+            self.seats = records["Seating_Capacity"]
+        else:
+            self.price = np.array([doc["Ex-Showroom_Price_Value"] for doc in docs], dtype=np.float64)
+            self.mileage = np.array([doc["ARAI_Certified_Mileage_Value"] for doc in docs], dtype=np.float64)
+            self.seats = np.array([doc.get("Seating_Capacity") for doc in docs], dtype=np.float64)
+
+        self.vocabularies = {}
+        self.codes = {}
+        for key, field in CATEGORICAL_FIELDS.items():
+            vocabulary, codes = np.unique(
+                np.array([str(doc.get(field, "")) for doc in docs], dtype=object),
+                return_inverse=True,
+            )
+            self.vocabularies[key] = [str(v) for v in vocabulary]
+            self.codes[key] = codes.astype(np.int32)
+
+        self.model_variants = [doc["Model_Variant"] for doc in docs]
+        # Unique tiebreaker of every sort, ordered like MongoDB orders ObjectIds
+        self.keys = np.array([_oid(doc) for doc in docs], dtype=str)
+        self._code_cache = {}
+        self._sort_orders = {}
+
+    def __len__(self):
+        return len(self.documents)
+
+    @classmethod
+    def from_json(cls, path: str = DATASET_PATH):
+        """Load the catalog from a JSON export such as dataset.json."""
+        return cls(load_dataset(path))
+
+    @classmethod
+    def from_snapshot(cls, path: str = SNAPSHOT_PATH):
+        """Load the catalog from a memory-mapped snapshot written by catalog_ingest."""
+        return cls.from_records(load_snapshot(path))
+
+    @classmethod
+    def from_records(cls, records):
+        """Catalog over snapshot records, filtering on the mapped columns directly."""
+        return cls(snapshot_documents(records), records=records)
+
+    @classmethod
+    def from_collection(cls, collection):
+        """Load the catalog with a single full scan of a MongoDB collection."""
+        return cls(collection.find({}))
+
+    def _category_mask(self, key, pattern):
+        # Resolve the regex against the vocabulary once per distinct pattern
+        cache_key = (key, pattern)
+        mask = self._code_cache.get(cache_key)
+        if mask is None:
+            matching = _regex_codes(self.vocabularies[key], pattern)
+            mask = np.isin(self.codes[key], matching)
+            if len(self._code_cache) >= _CODE_CACHE_SIZE:
+                self._code_cache.clear()
+            self._code_cache[cache_key] = mask
+        return mask
+
+    def _mask(self, filters: dict, ids=None):
+        """Boolean mask of the variants matching filters; over ids only when given."""
+        def column(values):
+            return values if ids is None else values[ids]
+
+        mask = np.ones(len(self.documents) if ids is None else len(ids), dtype=bool)
+
+        seats = min_seats(filters)
+        if seats is not None:
+            mask &= column(self.seats) >= seats
+
+        if "budget_min" in filters:
+            mask &= column(self.price) >= filters["budget_min"]
+        if "budget_max" in filters:
+            mask &= column(self.price) <= filters["budget_max"]
+
+        for key in CATEGORICAL_FIELDS:
+            if key in filters:
+                mask &= column(self._category_mask(key, filters[key]))
+
+        if "min_mileage" in filters:
+            mask &= column(self.mileage) >= filters["min_mileage"]
+        if "max_mileage" in filters:
+            mask &= column(self.mileage) <= filters["max_mileage"]
+
+        return mask
+
+    def mask_batch(self, filters_list):
+        """
+        _mask for many filter dicts at once: row i of the returned
+        (len(filters_list), len(self)) matrix equals _mask(filters_list[i]).
+        """
+        n = len(self.documents)
+        mask = np.ones((len(filters_list), n), dtype=bool)
+
+        def bound(key, column, compare):
+            rows = [i for i, filters in enumerate(filters_list) if key in filters]
+            if rows:
+                limits = np.array([filters_list[i][key] for i in rows], dtype=np.float64)[:, None]
+                mask[rows] &= compare(column[None, :], limits)
+
+        seats = {i: min_seats(filters) for i, filters in enumerate(filters_list)}
+        seats = {i: value for i, value in seats.items() if value is not None}
+        if seats:
+            rows = list(seats)
+            mask[rows] &= self.seats[None, :] >= np.array(list(seats.values()), dtype=np.float64)[:, None]
+
+        bound("budget_min", self.price, np.greater_equal)
+        bound("budget_max", self.price, np.less_equal)
+
+        # One vocabulary lookup per distinct pattern, shared by its rows
+        for key in CATEGORICAL_FIELDS:
+            groups = {}
+            for i, filters in enumerate(filters_list):
+                if key in filters:
+                    groups.setdefault(filters[key], []).append(i)
+            for pattern, rows in groups.items():
+                mask[rows] &= self._category_mask(key, pattern)
+
+        bound("min_mileage", self.mileage, np.greater_equal)
+        bound("max_mileage", self.mileage, np.less_equal)
+
+        return mask
+
+    def search(self, filters: dict = {}, limit: int = None, debug: bool = False):
+        """
+        In-memory equivalent of car_database.search_cars.
+        Returns matching documents in catalog order, up to limit.
+        """
+        indices = self.search_ids(filters)
+        if limit is not None:
+            indices = indices[:limit]
+        if debug:
+            print("Catalog filters:", filters)
+            print(f"Found {len(indices)} results")
+        return [self.documents[i] for i in indices]
+
+    def search_ids(self, filters: dict = {}):
+        """Catalog row ids matching filters, in catalog order."""
+        return np.flatnonzero(self._mask(filters))
+
+    def refine(self, filters: dict, ids):
+        """
+        The subset of ids (catalog row ids) matching filters. Costs the size
+        of ids rather than of the catalog, for narrowing an earlier result.
+        """
+        ids = np.asarray(ids, dtype=np.intp)
+        return ids[self._mask(filters, ids)]
+
+    def sort_column(self, sort: str):
+        return {"price": self.price, "mileage": self.mileage}[sort]
+
+    def _sort_order(self, sort: str):
+        # Row ids with a value, ascending by (value, key); built once per catalog
+        cached = self._sort_orders.get(sort)
+        if cached is None:
+            values = np.asarray(self.sort_column(sort), dtype=np.float64)
+            order = np.lexsort((self.keys, values))
+            order = order[~np.isnan(values[order])]
+            cached = self._sort_orders[sort] = (order, values[order], self.keys[order])
+        return cached
+
+    def search_sorted(self, filters: dict, sort: str, descending: bool = False, after=None, limit: int = None,
+                      ids=None):
+        """
+        Documents matching filters ordered by (sort value, key), descending
+        if asked, strictly after the (value, key) keyset cursor `after`.
+        Variants without a value for sort are left out. With ids (catalog
+        row ids) only those rows are considered.
+        """
+        order, values, keys = self._sort_order(sort)
+        if after is not None:
+            value, key = after
+            low, high = np.searchsorted(values, value, "left"), np.searchsorted(values, value, "right")
+            position = low + np.searchsorted(keys[low:high], key, "left" if descending else "right")
+            order = order[:position][::-1] if descending else order[position:]
+        elif descending:
+            order = order[::-1]
+        if ids is None:
+            mask = self._mask(filters)
+        else:
+            mask = np.zeros(len(self.documents), dtype=bool)
+            mask[self.refine(filters, ids)] = True
+        selected = order[mask[order]]
+        if limit is not None:
+            selected = selected[:limit]
+        return [self.documents[i] for i in selected]
+
+    def get_by_name(self, name: str, debug: bool = False):
+        """First document whose Model matches name (case-insensitive regex)."""
+        if debug:
+            print("Catalog lookup (by name):", name)
+        indices = np.flatnonzero(self._category_mask("model", name))
+        return self.documents[indices[0]] if len(indices) else None
+
+    def find_variant(self, pattern: str):
+        """First document whose Model_Variant matches pattern (case-insensitive regex)."""
+        try:
+            compiled = re.compile(pattern, re.IGNORECASE)
+        except re.error:
+            return None
+        for i, model_variant in enumerate(self.model_variants):
+            if compiled.search(model_variant):
+                return self.documents[i]
+        return None
+
+    def distinct_models(self):
+        return list(self.vocabularies["model"])
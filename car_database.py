@@ -1,16 +1,246 @@
-from pymongo import MongoClient
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
 
-client = MongoClient("")
-db = client[""]
-collection = db[""]
+import numpy as np
 
-def search_cars(filters: dict = {}, limit: int = None, debug: bool = False):
+from car_catalog import DATASET_PATH, SNAPSHOT_PATH, CarCatalog, _regex_codes
+from catalog_ingest import _oid, load_dataset, load_snapshot, numeric_value
+from catalog_manager import CatalogManager
+from ranking import RECOMMENDATION_WEIGHTS, CarColumns, score_cars
+from telemetry import stage, timed
+
+# "mongo" queries the collection on every call, "memory" serves reads from an
+# in-process CarCatalog snapshot of CATALOG_SOURCE ("mongo", "json" or
+# "snapshot", the memory-mapped output of catalog_ingest.py). Derived indexes
+# (names, facets) always read the snapshot.
+CATALOG_BACKEND = os.getenv("CAR_CATALOG_BACKEND", "mongo")
+CATALOG_SOURCE = os.getenv("CAR_CATALOG_SOURCE", "mongo")
+
+# === Connection ===
+MONGO_URI = os.getenv("MONGO_URI", "")
+MONGO_DB = os.getenv("MONGO_DB", "")
+MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", "300000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "2000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "3000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "5000"))
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "1") == "1"
+
+# pymongo is imported and the client opened on first use (or by the API's
+# lifespan hook), so importing this module stays cheap and forked workers
+# never inherit a client from their parent.
+_client = None
+_client_lock = threading.Lock()
+
+
+def connect():
+    """Open the MongoDB client (idempotent) and create the search indexes."""
+    global _client
+    client = _client
+    if client is not None:
+        return client
+    with _client_lock:
+        if _client is None:
+            from pymongo import MongoClient
+            from pymongo.errors import PyMongoError
+
+            client = MongoClient(
+                MONGO_URI,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGO_MAX_IDLE_MS,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            )
+            if MONGO_ENSURE_INDEXES and CATALOG_BACKEND == "mongo":
+                try:
+                    ensure_indexes(client[MONGO_DB][MONGO_COLLECTION])
+                except PyMongoError as e:
+                    print(f"Could not create MongoDB indexes: {e}")
+            _client = client
+        return _client
+
+
+def close():
+    """Close the MongoDB client; the next use opens a new one."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def get_database():
+    return connect()[MONGO_DB]
+
+
+def get_collection():
+    return get_database()[MONGO_COLLECTION]
+
+
+def mongo_required():
+    """Whether the configured catalog backend or source reads MongoDB."""
+    return CATALOG_BACKEND == "mongo" or CATALOG_SOURCE == "mongo"
+
+
+def __getattr__(name):
+    # client, db and collection stay importable; they connect on first access
+    if name == "client":
+        return connect()
+    if name == "db":
+        return get_database()
+    if name == "collection":
+        return get_collection()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# === Indexes ===
+# Every index and every query share this case-insensitive collation; an
+# index is only usable for string predicates under its own collation.
+# Plain dicts (pymongo accepts them for Collation and ASCENDING) keep
+# pymongo out of the import path.
+CASE_INSENSITIVE = {"locale": "en", "strength": 2}
+ASCENDING = 1
+
+# Equality ($in) fields first, ranges last
+INDEXES = {
+    "fuel_body_seats_price": [
+        ("Fuel_Type", ASCENDING), ("Body_Type", ASCENDING),
+        ("Seating_Capacity", ASCENDING), ("Ex-Showroom_Price_Value", ASCENDING),
+    ],
+    "body_price": [("Body_Type", ASCENDING), ("Ex-Showroom_Price_Value", ASCENDING)],
+    "seats_price": [("Seating_Capacity", ASCENDING), ("Ex-Showroom_Price_Value", ASCENDING)],
+    # _id breaks ties, so sorted pages are stable and keyset cursors exact
+    "price_id": [("Ex-Showroom_Price_Value", ASCENDING), ("_id", ASCENDING)],
+    "mileage_id": [("ARAI_Certified_Mileage_Value", ASCENDING), ("_id", ASCENDING)],
+    "drivetrain": [("Drivetrain", ASCENDING)],
+    "model": [("Model", ASCENDING)],
+    "model_variant": [("Model_Variant", ASCENDING)],
+}
+
+# Fields the listings, pitches, ranking and session summaries read
+LISTING_FIELDS = (
+    "Model", "Variant", "Model_Variant", "Fuel_Type", "Body_Type", "Type", "Drivetrain",
+    "Seating_Capacity", "Ex-Showroom_Price", "Ex-Showroom_Price_Value",
+    "ARAI_Certified_Mileage", "ARAI_Certified_Mileage_Value", "Power_Value",
+)
+LISTING_PROJECTION = dict.fromkeys(LISTING_FIELDS, 1)
+
+# Sort keys of search_cars and /search -> document field; "score" ranks by
+# RECOMMENDATION_WEIGHTS against the caller's preferences
+SORT_FIELDS = {
+    "price": "Ex-Showroom_Price_Value",
+    "mileage": "ARAI_Certified_Mileage_Value",
+    "score": "score",
+}
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "100"))
+
+# Filter key -> categorical field, matched through the field's vocabulary
+CATEGORICAL_FILTERS = {
+    "fuel_type": "Fuel_Type",
+    "drive_type": "Drivetrain",
+    "car_type": "Body_Type",
+    "model": "Model",
+}
+
+# Distinct values per categorical field are re-read this often
+VOCABULARY_TTL_SECONDS = int(os.getenv("MONGO_VOCABULARY_TTL", "300"))
+_vocabularies = {}
+
+
+def ensure_indexes(target=None):
+    """Create the search indexes (idempotent); returns their names."""
+    target = get_collection() if target is None else target
+    return [
+        target.create_index(keys, name=name, collation=CASE_INSENSITIVE)
+        for name, keys in INDEXES.items()
+    ]
+
+
+def _vocabulary(field):
+    cached = _vocabularies.get(field)
+    now = time.monotonic()
+    if cached is None or cached[1] < now:
+        with stage("mongo_distinct"):
+            values = sorted(str(v) for v in get_collection().distinct(field) if v is not None)
+        cached = _vocabularies[field] = (values, now + VOCABULARY_TTL_SECONDS)
+    return cached[0]
+
+
+def categorical_match(field, pattern):
     """
-    Search cars in the MongoDB collection based on given filters.
-    Supports filtering by seats, price range, fuel type, drive type,
-    car body type, model, and ARAI mileage.
-    Returns a list of matching car documents up to the specified limit.
+    Exact $in match equivalent to a case-insensitive partial $regex, resolved
+    against the field's distinct values so the query can use an index.
     """
+    vocabulary = _vocabulary(field)
+    return {"$in": [vocabulary[code] for code in _regex_codes(vocabulary, pattern)]}
+
+CATALOG_SNAPSHOT = os.getenv("CAR_CATALOG_SNAPSHOT", SNAPSHOT_PATH)
+
+# How the snapshot is kept fresh: "none", "poll", "changestream" (MongoDB
+# source) or "file" (json/snapshot source)
+CATALOG_WATCH = os.getenv("CAR_CATALOG_WATCH", "none")
+CATALOG_POLL_SECONDS = float(os.getenv("CAR_CATALOG_POLL_SECONDS", "30"))
+
+
+def _load_documents():
+    if CATALOG_SOURCE == "json":
+        return load_dataset(DATASET_PATH)
+    if CATALOG_SOURCE == "snapshot":
+        return load_snapshot(CATALOG_SNAPSHOT)
+    return get_collection().find({})
+
+
+def _build_catalog(data):
+    # Snapshot sources keep their numeric columns in the shared mapping
+    if CATALOG_SOURCE == "snapshot":
+        return CarCatalog.from_records(data)
+    return CarCatalog(data)
+
+
+catalog_manager = CatalogManager(_load_documents, source=CATALOG_SOURCE, build=_build_catalog)
+catalog_manager.on_swap(_vocabularies.clear)
+# Ranking columns of the whole catalog, for search_cars(sort="score")
+catalog_manager.register_derived("ranking", lambda catalog: CarColumns(catalog.documents))
+
+
+def on_catalog_reload(callback):
+    """Register a zero-argument callback fired after every catalog swap."""
+    catalog_manager.on_swap(callback)
+
+
+def get_catalog():
+    """Return the live in-memory catalog, loading it on first use."""
+    return catalog_manager.current().catalog
+
+
+def reload_catalog():
+    """Rebuild the catalog from the configured source and swap it in."""
+    catalog_manager.refresh(force=True)
+    return get_catalog()
+
+
+def start_catalog_watch(mode=CATALOG_WATCH):
+    """Start the background refresher selected by CAR_CATALOG_WATCH."""
+    if mode == "poll":
+        catalog_manager.watch_polling(CATALOG_POLL_SECONDS)
+    elif mode == "changestream":
+        catalog_manager.watch_change_stream(get_collection(), fallback_interval=CATALOG_POLL_SECONDS)
+    elif mode == "file":
+        path = DATASET_PATH if CATALOG_SOURCE == "json" else CATALOG_SNAPSHOT + ".npy"
+        catalog_manager.watch_file(path)
+
+
+def build_query(filters: dict) -> dict:
+    """Translate search_cars filters into an index-friendly MongoDB query."""
     query = {}
 
     # Handle family_size by converting it to required seating capacity
@@ -34,17 +264,9 @@ def search_cars(filters: dict = {}, limit: int = None, debug: bool = False):
     elif "budget_max" in filters:
         query["Ex-Showroom_Price_Value"] = {"$lte": filters["budget_max"]}
 
-    if "fuel_type" in filters:
-        query["Fuel_Type"] = {"$regex": filters["fuel_type"], "$options": "i"}
-
-    if "drive_type" in filters:
-        query["Drivetrain"] = {"$regex": filters["drive_type"], "$options": "i"}
-
-    if "car_type" in filters:
-        query["Body_Type"] = {"$regex": filters["car_type"], "$options": "i"}
-
-    if "model" in filters:
-        query["Model"] = {"$regex": filters["model"], "$options": "i"}
+    for key, field in CATEGORICAL_FILTERS.items():
+        if key in filters:
+            query[field] = categorical_match(field, filters[key])
 
     if "min_mileage" in filters or "max_mileage" in filters:
         mileage_query = {}
@@ -54,10 +276,49 @@ def search_cars(filters: dict = {}, limit: int = None, debug: bool = False):
             mileage_query["$lte"] = filters["max_mileage"]
         query["ARAI_Certified_Mileage_Value"] = mileage_query
 
+    return query
+
+
+@timed("search_cars")
+def search_cars(filters: dict = {}, limit: int = None, debug: bool = False, projection=LISTING_PROJECTION,
+                sort: str = None, descending: bool = False, after=None, prefs: dict = None, ids=None):
+    """
+    Search cars in the MongoDB collection based on given filters.
+    Supports filtering by seats, price range, fuel type, drive type,
+    car body type, model, and ARAI mileage.
+    Returns a list of matching car documents up to the specified limit,
+    reduced to LISTING_FIELDS unless projection=None.
+
+    With sort (a SORT_FIELDS key) results are ordered server-side by the
+    sort value with the document id as tiebreaker, and `after` = (value,
+    id) continues strictly after a previous result (keyset pagination).
+    Cars without the sort value are left out. sort="score" ranks against
+    prefs (family_size, budget) and adds a "score" field to each result.
+    """
+    if sort == "score":
+        return _search_by_score(filters, prefs or {}, limit, descending, after)
+    if sort is not None and CATALOG_BACKEND == "memory":
+        return get_catalog().search_sorted(filters, sort, descending, after, limit)
+    if CATALOG_BACKEND == "memory":
+        return get_catalog().search(filters, limit=limit, debug=debug)
+
+    query = build_query(filters)
+    if sort is not None:
+        field = SORT_FIELDS[sort]
+        clauses = [query, {field: {"$ne": None}}]
+        if after is not None:
+            value, key = after
+            key = _object_id(key)
+            op = "$lt" if descending else "$gt"
+            clauses.append({"$or": [{field: {op: value}}, {field: value, "_id": {op: key}}]})
+        query = {"$and": clauses}
     if debug:
         print("MongoDB Query:", query)
 
-    cursor = collection.find(query)
+    cursor = get_collection().find(query, projection, collation=CASE_INSENSITIVE)
+    if sort is not None:
+        direction = -1 if descending else ASCENDING
+        cursor = cursor.sort([(SORT_FIELDS[sort], direction), ("_id", direction)])
     if limit is not None:
         cursor = cursor.limit(limit)
 
@@ -68,13 +329,209 @@ def search_cars(filters: dict = {}, limit: int = None, debug: bool = False):
     return results
 
 
+def _object_id(key):
+    # Cursor keys are ObjectId hex strings; MongoDB compares them as ObjectIds
+    from bson import ObjectId
+    return ObjectId(key) if ObjectId.is_valid(key) else key
+
+
+def _search_by_score(filters, prefs, limit, descending, after, ids=None):
+    # Scores depend on the caller's preferences, so they are computed over
+    # the in-memory snapshot whatever the backend
+    snapshot = catalog_manager.current()
+    catalog = snapshot.catalog
+    scores = score_cars(catalog_manager.derived("ranking"), prefs, RECOMMENDATION_WEIGHTS)
+    if ids is not None and CATALOG_BACKEND != "memory":
+        # MongoDB ids -> rows of the snapshot
+        ids = np.flatnonzero(np.isin(catalog.keys, [str(key) for key in ids]))
+    ids = catalog.search_ids(filters) if ids is None else catalog.refine(filters, ids)
+    if after is not None:
+        value, key = after
+        if descending:
+            keep = (scores[ids] < value) | ((scores[ids] == value) & (catalog.keys[ids] < key))
+        else:
+            keep = (scores[ids] > value) | ((scores[ids] == value) & (catalog.keys[ids] > key))
+        ids = ids[keep]
+    ids = ids[np.lexsort((catalog.keys[ids], scores[ids]))]
+    if descending:
+        ids = ids[::-1]
+    if limit is not None:
+        ids = ids[:limit]
+    return [dict(catalog.documents[i], score=float(scores[i])) for i in ids]
+
+
+def _search_digest(filters, sort, descending, prefs):
+    text = json.dumps([filters, sort, descending, prefs], sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def encode_cursor(value, key, digest):
+    data = json.dumps({"v": value, "k": key, "d": digest}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, digest):
+    """(value, key) of a cursor from encode_cursor; ValueError if it is invalid or from another search."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        value, key, cursor_digest = data["v"], data["k"], data["d"]
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
+    if cursor_digest != digest:
+        raise ValueError("Cursor belongs to a different search")
+    return value, key
+
+
+def search_page(filters: dict, sort: str = "price", descending: bool = False, limit: int = SEARCH_PAGE_SIZE,
+                cursor: str = None, prefs: dict = None, projection=LISTING_PROJECTION, ids=None):
+    """
+    One page of sorted search_cars results and the cursor of the next page
+    (None after the last one). Each page costs one bounded query however
+    many cars match. Pass the same ids (from refine_ids) with every page to
+    page through a narrowed result. Raises ValueError for an unknown sort or
+    a bad cursor.
+    """
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"Unknown sort {sort!r}; use one of {', '.join(SORT_FIELDS)}")
+    limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+    prefs = prefs or {}
+    digest = _search_digest(filters, sort, descending, prefs)
+    after = decode_cursor(cursor, digest) if cursor else None
+    # One extra result tells whether another page exists
+    cars = search_cars(filters, limit=limit + 1, projection=projection, sort=sort, descending=descending,
+                       after=after, prefs=prefs, ids=ids)
+    if len(cars) <= limit:
+        return cars, None
+    cars = cars[:limit]
+    last = cars[-1]
+    value = last["score"] if sort == "score" else numeric_value(last, SORT_FIELDS[sort])
+    return cars, encode_cursor(value, _oid(last), digest)
+
+
+def _refinement(filters: dict, search):
+    """(snapshot, fingerprint, whether filters narrow search) for refine_cars and refine_ids."""
+    # With MongoDB the ids stay valid across catalog versions, and the query
+    # re-checks every filter on them; only a change the catalog watcher has
+    # already swapped in starts over, so no snapshot is loaded just to
+    # fingerprint it
+    snapshot = catalog_manager.current() if CATALOG_BACKEND == "memory" else catalog_manager.loaded()
+    fingerprint = snapshot.fingerprint if snapshot is not None else None
+    return snapshot, fingerprint, search.can_narrow(filters, fingerprint)
+
+
+def _refine_query(filters: dict, search, narrow):
+    query = build_query(filters)
+    if narrow:
+        query["_id"] = {"$in": search.ids}
+    return query
+
+
+def refine_cars(filters: dict, search):
+    """
+    search_cars(filters) for a session's SearchState. When filters only
+    narrow the state's last search on the same catalog content, they are
+    evaluated against its cached result ids (an `_id $in` query with
+    MongoDB) instead of the whole catalog. The state is updated with the
+    new filters and results.
+    """
+    snapshot, fingerprint, narrow = _refinement(filters, search)
+    with stage("search_narrow" if narrow else "search_full"):
+        if CATALOG_BACKEND == "memory":
+            catalog = snapshot.catalog
+            ids = catalog.refine(filters, search.ids) if narrow else catalog.search_ids(filters)
+            search.update(filters, ids.tolist(), fingerprint)
+            return [catalog.documents[i] for i in ids]
+
+        query = _refine_query(filters, search, narrow)
+        results = list(get_collection().find(query, LISTING_PROJECTION, collation=CASE_INSENSITIVE))
+        search.update(filters, [doc["_id"] for doc in results], fingerprint)
+        return results
+
+
+def refine_ids(filters: dict, search):
+    """
+    refine_cars without fetching the cars: the ids of the matches, for
+    counting them and paging through them with search_page(ids=...).
+    """
+    snapshot, fingerprint, narrow = _refinement(filters, search)
+    with stage("search_narrow" if narrow else "search_full"):
+        if CATALOG_BACKEND == "memory":
+            catalog = snapshot.catalog
+            ids = catalog.refine(filters, search.ids) if narrow else catalog.search_ids(filters)
+            ids = ids.tolist()
+        else:
+            query = _refine_query(filters, search, narrow)
+            ids = [doc["_id"] for doc in get_collection().find(query, {"_id": 1}, collation=CASE_INSENSITIVE)]
+        search.update(filters, ids, fingerprint)
+        return ids
+
+
+@timed("get_car_by_name")
 def get_car_by_name(name: str, debug: bool = False):
     """
     Retrieve a single car document matching the given model name.
     Case-insensitive partial match using regex.
     Returns None if no match is found.
     """
-    query = {"Model": {"$regex": name, "$options": "i"}}
+    if CATALOG_BACKEND == "memory":
+        return get_catalog().get_by_name(name, debug=debug)
+
+    query = {"Model": categorical_match("Model", name)}
     if debug:
         print("MongoDB Query (by name):", query)
-    return collection.find_one(query)
+    return next(iter(get_collection().find(query, collation=CASE_INSENSITIVE).limit(1)), None)
+
+
+def get_car_by_variant(pattern: str):
+    """
+    Retrieve a single car document whose Model_Variant matches the pattern.
+    Case-insensitive partial match using regex.
+    """
+    if CATALOG_BACKEND == "memory":
+        return get_catalog().find_variant(pattern)
+    query = {"Model_Variant": categorical_match("Model_Variant", pattern)}
+    return next(iter(get_collection().find(query, collation=CASE_INSENSITIVE).limit(1)), None)
+
+
+def get_model_names():
+    """Return the distinct Model names in the catalog."""
+    if CATALOG_BACKEND == "memory":
+        return get_catalog().distinct_models()
+    return get_collection().distinct("Model")
+
+
+# Representative search_cars filters, one per query shape the app issues
+QUERY_SHAPES = {
+    "guided_flow": {"seats": 5, "fuel_type": "Diesel", "car_type": "Sedan", "budget_max": 1000000},
+    "fuel": {"fuel_type": "Petrol"},
+    "body_budget": {"car_type": "Suv", "budget_max": 1200000},
+    "seats": {"seats": 7},
+    "budget_range": {"budget_min": 500000, "budget_max": 800000},
+    "mileage": {"min_mileage": 20},
+    "drive_type": {"drive_type": "Four Wheel"},
+    "model": {"model": "Swift"},
+}
+
+
+def _plan_stages(plan):
+    yield plan.get("stage")
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            yield from _plan_stages(child)
+
+
+def check_index_usage(shapes=QUERY_SHAPES):
+    """
+    explain() each query shape and report its winning plan's stages;
+    a shape whose plan contains a COLLSCAN is listed under "collscans".
+    """
+    report = {"plans": {}, "collscans": []}
+    for name, filters in shapes.items():
+        explain = get_collection().find(build_query(filters), LISTING_PROJECTION, collation=CASE_INSENSITIVE).explain()
+        winning = explain["queryPlanner"]["winningPlan"]
+        # Slot-based engine plans (MongoDB 7+) nest the classic plan
+        stages = list(_plan_stages(winning.get("queryPlan", winning)))
+        report["plans"][name] = stages
+        if "COLLSCAN" in stages:
+            report["collscans"].append(name)
+    return report
@@ -0,0 +1,271 @@
+"""
+Offline ingestion for the car catalog.
+
+Parses the unit-bearing display strings in dataset.json ("Rs. 3,52,136",
+"15 km/litre", "73PS@6000rpm", ...) once into typed numeric fields, writes a
+versioned, memory-mappable NumPy snapshot and can bulk-upsert the normalized
+documents into MongoDB.
+
+    python catalog_ingest.py --snapshot catalog_snapshot --upsert
+"""
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+
+DATASET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataset.json")
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog_snapshot")
+
+# Bump whenever SNAPSHOT_DTYPE or the meaning of a normalized field changes.
+SNAPSHOT_VERSION = 1
+
+_NUMBER_RE = re.compile(r"\d[\d,]*(?:\.\d+)?")
+_POWER_RE = re.compile(r"([\d.]+)\s*(ps|bhp|hp|kw)", re.IGNORECASE)
+
+# Horsepower-style units converted to metric PS
+_POWER_TO_PS = {"ps": 1.0, "bhp": 1.01387, "hp": 1.01387, "kw": 1.35962}
+
+
+def parse_number(value):
+    """
+    Return the first number found in a display string such as
+    "Rs. 3,52,136" or "15 km/litre", or NaN when there is none.
+    Plain ints and floats are returned unchanged.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, str):
+        return float("nan")
+    match = _NUMBER_RE.search(value)
+    if not match:
+        return float("nan")
+    return float(match.group(0).replace(",", ""))
+
+
+def parse_power(value):
+    """Peak power in PS from strings like "73PS@6000rpm" or "103Bhp@6000rpm"."""
+    if not isinstance(value, str):
+        return parse_number(value)
+    match = _POWER_RE.search(value)
+    if not match:
+        return parse_number(value)
+    return round(float(match.group(1)) * _POWER_TO_PS[match.group(2).lower()], 2)
+
+
+# normalized field -> (source display field, parser)
+NUMERIC_FIELDS = {
+    "Ex-Showroom_Price_Value": ("Ex-Showroom_Price", parse_number),   # rupees
+    "ARAI_Certified_Mileage_Value": ("ARAI_Certified_Mileage", parse_number),  # km/l
+    "City_Mileage_Value": ("City_Mileage", parse_number),
+    "Highway_Mileage_Value": ("Highway_Mileage", parse_number),
+    "Power_Value": ("Power", parse_power),                         # PS
+    "Torque_Value": ("Torque", parse_number),                      # Nm
+    "Boot_Space_Value": ("Boot_Space", parse_number),              # litres
+    "Fuel_Tank_Capacity_Value": ("Fuel_Tank_Capacity", parse_number),
+    "Displacement_Value": ("Displacement", parse_number),          # cc
+    "Length_Value": ("Length", parse_number),                      # mm
+    "Width_Value": ("Width", parse_number),
+    "Height_Value": ("Height", parse_number),
+    "Wheelbase_Value": ("Wheelbase", parse_number),
+    "Ground_Clearance_Value": ("Ground_Clearance", parse_number),
+    "Kerb_Weight_Value": ("Kerb_Weight", parse_number),            # kg
+}
+
+# Display fields carried in the snapshot so listings and pitches can be
+# rendered without the full 74-field document.
+STRING_FIELDS = {
+    "_oid": "U24",
+    "Model": "U32",
+    "Variant": "U48",
+    "Model_Variant": "U80",
+    "Fuel_Type": "U24",
+    "Body_Type": "U16",
+    "Drivetrain": "U32",
+    "Type": "U16",
+    "Ex-Showroom_Price": "U24",
+    "ARAI_Certified_Mileage": "U24",
+}
+
+SNAPSHOT_DTYPE = np.dtype(
+    [(name, dtype) for name, dtype in STRING_FIELDS.items()]
+    + [("Seating_Capacity", "i2")]
+    + [(name, "f8") for name in NUMERIC_FIELDS]
+)
+
+
+def normalize_document(doc: dict) -> dict:
+    """
+    Add the typed *_Value fields (and Model_Variant) to a catalog document.
+    Fields already present as numbers are left untouched, missing values
+    become None.
+    """
+    for field, (source, parser) in NUMERIC_FIELDS.items():
+        if isinstance(doc.get(field), (int, float)):
+            continue
+        value = parser(doc.get(source))
+        doc[field] = value if value == value else None
+    if doc["Ex-Showroom_Price_Value"] is not None:
+        doc["Ex-Showroom_Price_Value"] = int(doc["Ex-Showroom_Price_Value"])
+    if "Model_Variant" not in doc:
+        doc["Model_Variant"] = f"{doc.get('Model', '')} {doc.get('Variant', '')}".strip()
+    return doc
+
+
+def numeric_value(doc: dict, field: str):
+    """
+    Typed value of a normalized field. Only documents that have not been
+    through normalize_document fall back to parsing the display string.
+    """
+    value = doc.get(field)
+    if isinstance(value, (int, float)):
+        return value
+    source, parser = NUMERIC_FIELDS[field]
+    value = parser(doc.get(source))
+    return value if value == value else None
+
+
+def load_dataset(path: str = DATASET_PATH):
+    """Read a JSON export and return normalized documents."""
+    with open(path, encoding="utf-8") as f:
+        return [normalize_document(doc) for doc in json.load(f)]
+
+
+def _oid(doc):
+    _id = doc.get("_id")
+    if isinstance(_id, dict):
+        return _id.get("$oid", "")
+    return str(_id) if _id is not None else ""
+
+
+def to_records(docs) -> np.ndarray:
+    """Pack normalized documents into a SNAPSHOT_DTYPE structured array."""
+    records = np.zeros(len(docs), dtype=SNAPSHOT_DTYPE)
+    for i, doc in enumerate(docs):
+        row = records[i]
+        row["_oid"] = _oid(doc)
+        for name in STRING_FIELDS:
+            if name != "_oid":
+                row[name] = str(doc.get(name) or "")
+        row["Seating_Capacity"] = int(doc.get("Seating_Capacity") or 0)
+        for name in NUMERIC_FIELDS:
+            value = doc.get(name)
+            row[name] = np.nan if value is None else value
+    return records
+
+
+def write_snapshot(docs, path: str = SNAPSHOT_PATH):
+    """
+    Write <path>.npy (structured array) and <path>.meta.json (version, count).
+    The array is written first and the metadata last, so a reader never sees
+    metadata for a half-written array. Both are replaced by rename: running
+    processes keep their mapping of the old file instead of faulting on a
+    truncated one.
+    """
+    records = to_records(docs)
+    tmp_records = path + ".npy.tmp"
+    with open(tmp_records, "wb") as f:
+        np.save(f, records, allow_pickle=False)
+    os.replace(tmp_records, path + ".npy")
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "count": int(len(records)),
+        "dtype": [list(field) for field in SNAPSHOT_DTYPE.descr],
+    }
+    tmp_meta = path + ".meta.json.tmp"
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, path + ".meta.json")
+    return records
+
+
+def load_snapshot(path: str = SNAPSHOT_PATH, mmap: bool = True) -> np.ndarray:
+    """
+    Open a snapshot written by write_snapshot, memory-mapped by default.
+    Raises ValueError when the snapshot was written by another version.
+    """
+    with open(path + ".meta.json", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"Catalog snapshot version {meta.get('version')} does not match "
+            f"expected version {SNAPSHOT_VERSION}; re-run catalog_ingest.py"
+        )
+    records = np.load(path + ".npy", mmap_mode="r" if mmap else None, allow_pickle=False)
+    if records.dtype != SNAPSHOT_DTYPE:
+        raise ValueError("Catalog snapshot dtype does not match; re-run catalog_ingest.py")
+    return records
+
+
+def snapshot_documents(records: np.ndarray):
+    """Rebuild the lightweight display documents stored in a snapshot."""
+    docs = []
+    for row in records:
+        doc = {"_id": str(row["_oid"])}
+        for name in STRING_FIELDS:
+            if name != "_oid":
+                doc[name] = str(row[name])
+        doc["Seating_Capacity"] = int(row["Seating_Capacity"])
+        for name in NUMERIC_FIELDS:
+            value = float(row[name])
+            doc[name] = value if value == value else None
+        if doc["Ex-Showroom_Price_Value"] is not None:
+            doc["Ex-Showroom_Price_Value"] = int(doc["Ex-Showroom_Price_Value"])
+        docs.append(doc)
+    return docs
+
+
+def upsert_documents(collection, docs, batch_size: int = 500):
+    """Bulk-upsert normalized documents keyed on their ObjectId."""
+    from bson import ObjectId
+    from pymongo import UpdateOne
+
+    written = 0
+    for start in range(0, len(docs), batch_size):
+        ops = []
+        for doc in docs[start:start + batch_size]:
+            fields = {k: v for k, v in doc.items() if k != "_id"}
+            oid = _oid(doc)
+            key = {"_id": ObjectId(oid)} if oid else {"Model_Variant": doc["Model_Variant"]}
+            ops.append(UpdateOne(key, {"$set": fields}, upsert=True))
+        if ops:
+            result = collection.bulk_write(ops, ordered=False)
+            written += result.upserted_count + result.modified_count
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalize dataset.json into typed fields and a binary snapshot")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--snapshot", default=SNAPSHOT_PATH, help="snapshot path prefix (without extension)")
+    parser.add_argument("--upsert", action="store_true", help="also bulk-upsert normalized documents into MongoDB")
+    parser.add_argument("--ensure-indexes", action="store_true", help="create the MongoDB search indexes")
+    parser.add_argument("--check-indexes", action="store_true",
+                        help="explain() every search query shape and fail if one scans the collection")
+    args = parser.parse_args()
+
+    docs = load_dataset(args.dataset)
+    records = write_snapshot(docs, args.snapshot)
+    print(f"Wrote {len(records)} variants to {args.snapshot}.npy (v{SNAPSHOT_VERSION})")
+
+    if args.upsert:
+        from car_database import collection
+        written = upsert_documents(collection, docs)
+        print(f"Upserted {written} documents")
+
+    if args.ensure_indexes:
+        from car_database import ensure_indexes
+        print("Indexes:", ", ".join(ensure_indexes()))
+
+    if args.check_indexes:
+        from car_database import check_index_usage
+        report = check_index_usage()
+        for name, stages in report["plans"].items():
+            print(f"{name}: {' <- '.join(stages)}")
+        if report["collscans"]:
+            raise SystemExit(f"Collection scans: {', '.join(report['collscans'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Versioned, hot-swappable catalog snapshots.
+
+A CatalogManager holds one immutable CatalogSnapshot at a time. Refreshing
+loads the source in the caller's (or a background) thread, skips the swap
+when the content fingerprint is unchanged, builds every registered derived
+index (name resolver, facets, ...) for the new snapshot and only then
+replaces the reference, so readers never lock and never see a cold index.
+Listeners registered with on_swap run after each swap to drop caches that
+quote catalog data.
+
+Watchers trigger refreshes in the background: a MongoDB change stream,
+polling, or an mtime watch on a file such as dataset.json.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from car_catalog import CarCatalog
+
+
+def fingerprint(documents) -> str:
+    """Content hash of a document list (independent of its order) or a snapshot array."""
+    if isinstance(documents, np.ndarray):
+        return hashlib.blake2b(documents.tobytes(), digest_size=16).hexdigest()
+    digests = sorted(
+        hashlib.blake2b(json.dumps(doc, sort_keys=True, default=str).encode("utf-8"), digest_size=16).digest()
+        for doc in documents
+    )
+    return hashlib.blake2b(b"".join(digests), digest_size=16).hexdigest()
+
+
+class CatalogSnapshot:
+    """One immutable catalog version plus the indexes derived from it."""
+
+    def __init__(self, version, catalog, fingerprint, source):
+        self.version = version
+        self.catalog = catalog
+        self.fingerprint = fingerprint
+        self.source = source
+        self.loaded_at = time.time()
+        self._derived = {}
+
+    def info(self):
+        return {
+            "version": self.version,
+            "variants": len(self.catalog),
+            "fingerprint": self.fingerprint,
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class CatalogManager:
+    """
+    Owns the current CatalogSnapshot. `load` is a zero-argument callable
+    returning the raw documents (or snapshot records) of the configured
+    source and `build` turns them into a CarCatalog.
+    """
+
+    def __init__(self, load, source="", build=CarCatalog):
+        self._load = load
+        self._source = source
+        self._build = build
+        self._current = None
+        self._builders = {}
+        self._listeners = []
+        self._refresh_lock = threading.Lock()
+        self._watchers = []
+
+    # === Readers ===
+    def current(self) -> CatalogSnapshot:
+        """The live snapshot, loading the first one on demand. Never locks once loaded."""
+        snapshot = self._current
+        if snapshot is None:
+            self.refresh()
+            snapshot = self._current
+        return snapshot
+
+    def loaded(self):
+        """The live snapshot, or None when none has been loaded yet. Never loads."""
+        return self._current
+
+    def derived(self, name):
+        """The named derived index for the live snapshot, built on first use."""
+        snapshot = self.current()
+        value = snapshot._derived.get(name)
+        if value is None:
+            # Concurrent first uses may both build; either result is valid
+            value = snapshot._derived[name] = self._builders[name](snapshot.catalog)
+        return value
+
+    # === Registration ===
+    def register_derived(self, name, build):
+        """build(catalog) is run for every new snapshot before it goes live."""
+        self._builders[name] = build
+
+    def on_swap(self, callback):
+        """Zero-argument callback fired after every swap."""
+        self._listeners.append(callback)
+
+    # === Refresh ===
+    def refresh(self, force=False):
+        """
+        Reload the source and swap in a new snapshot if its content changed
+        (or force). Returns True when a swap happened. Concurrent calls are
+        serialized; readers keep using the old snapshot meanwhile.
+        """
+        with self._refresh_lock:
+            documents = self._load()
+            if not isinstance(documents, np.ndarray):
+                documents = list(documents)
+            digest = fingerprint(documents)
+            previous = self._current
+            if previous is not None and not force and previous.fingerprint == digest:
+                return False
+            snapshot = CatalogSnapshot(
+                (previous.version + 1) if previous else 1, self._build(documents), digest, self._source
+            )
+            for name, build in self._builders.items():
+                snapshot._derived[name] = build(snapshot.catalog)
+            self._current = snapshot
+        for callback in self._listeners:
+            callback()
+        return True
+
+    def _safe_refresh(self):
+        """refresh() for background threads; returns False if loading failed."""
+        try:
+            self.refresh()
+            return True
+        except Exception as e:
+            print(f"Catalog refresh failed: {e}")
+            return False
+
+    # === Watchers ===
+    def _spawn(self, target, name):
+        stop = threading.Event()
+        thread = threading.Thread(target=target, args=(stop,), name=name, daemon=True)
+        thread.start()
+        self._watchers.append((stop, thread))
+
+    def watch_polling(self, interval):
+        """Re-read the source every interval seconds; swaps only on change."""
+        def run(stop):
+            while not stop.wait(interval):
+                self._safe_refresh()
+        self._spawn(run, "catalog-poll")
+
+    def watch_file(self, path, interval=2.0):
+        """Refresh whenever the file's mtime or size changes."""
+        def signature():
+            try:
+                stat = os.stat(path)
+                return stat.st_mtime_ns, stat.st_size
+            except OSError:
+                return None
+
+        def run(stop):
+            last = signature()
+            while not stop.wait(interval):
+                current = signature()
+                # A half-written file fails to load; retry on the next tick
+                if current != last and current is not None and self._safe_refresh():
+                    last = current
+        self._spawn(run, "catalog-file-watch")
+
+    def watch_change_stream(self, collection, fallback_interval=30.0):
+        """
+        Refresh on every change event of a MongoDB collection. Change streams
+        need a replica set; without one this falls back to polling.
+        """
+        def run(stop):
+            try:
+                with collection.watch(max_await_time_ms=1000) as stream:
+                    while not stop.is_set() and stream.alive:
+                        if stream.try_next() is not None:
+                            # Drain a burst of changes into a single reload
+                            while stream.try_next() is not None:
+                                pass
+                            self._safe_refresh()
+            except Exception as e:
+                print(f"Catalog change stream unavailable ({e}); polling every {fallback_interval}s")
+                while not stop.wait(fallback_interval):
+                    self._safe_refresh()
+        self._spawn(run, "catalog-change-stream")
+
+    def stop(self):
+        for stop, _ in self._watchers:
+            stop.set()
+        for _, thread in self._watchers:
+            thread.join(timeout=5)
+        self._watchers = []
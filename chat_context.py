@@ -0,0 +1,85 @@
+import os
+from functools import lru_cache
+
+# Prompt size for the LLM fallback, in estimated tokens
+LLM_PROMPT_TOKENS = int(os.getenv("LLM_PROMPT_TOKENS", "1024"))
+
+# Role markers and separators the chat template adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_SLOT_PHRASES = {
+    "family_size": "travels with {} people",
+    "fuel_type": "prefers {}",
+    "car_type": "wants a {}",
+    "budget": "has a budget of ₹{:,}",
+}
+
+
+@lru_cache(maxsize=4096)
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (about four characters per token for English text).
+    Only used for budgeting, so no tokenizer dependency is needed.
+    """
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def summarize_user_info(user_info: dict):
+    """One system message recapping the collected slots, or None."""
+    facts = [phrase.format(user_info[slot]) for slot, phrase in _SLOT_PHRASES.items() if user_info.get(slot)]
+    if not facts:
+        return None
+    return {"role": "system", "content": "Earlier in this conversation the customer said they " + ", ".join(facts) + "."}
+
+
+class PromptContext:
+    """
+    Builds the LLM prompt within a fixed token budget.
+
+    The system prefix never changes, so its size is counted once and Ollama
+    can reuse its KV cache for it across turns. After it come a recap of the
+    slots collected so far (only when older turns had to be dropped), the
+    most recent turns that fit, and the per-question grounding right before
+    the latest user message.
+    """
+
+    def __init__(self, system_messages, token_budget: int = LLM_PROMPT_TOKENS):
+        self.system_messages = list(system_messages)
+        self.token_budget = token_budget
+        self.prefix_tokens = sum(message_tokens(m) for m in self.system_messages)
+
+    def build(self, history, user_info=None, grounding=None):
+        history = list(history)
+        budget = self.token_budget - self.prefix_tokens
+        if grounding:
+            budget -= message_tokens(grounding)
+        summary = summarize_user_info(user_info or {})
+        summary_tokens = message_tokens(summary) if summary else 0
+
+        # Newest first; the latest message is always kept
+        start = len(history)
+        used = 0
+        while start > 0:
+            cost = message_tokens(history[start - 1])
+            reserve = summary_tokens if start > 1 else 0
+            if start < len(history) and used + cost + reserve > budget:
+                break
+            used += cost
+            start -= 1
+        # Never open the window on an assistant reply
+        while start < len(history) - 1 and history[start]["role"] != "user":
+            start += 1
+
+        window = history[start:]
+        messages = list(self.system_messages)
+        if start > 0 and summary:
+            messages.append(summary)
+        messages.extend(window[:-1])
+        if grounding:
+            messages.append(grounding)
+        messages.extend(window[-1:])
+        return messages
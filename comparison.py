@@ -0,0 +1,234 @@
+"""
+Side-by-side comparison of models and variants.
+
+Built once per catalog load: every variant gets a spec vector (price,
+mileage, power, boot space, ground clearance) and every model one summary
+vector (its starting price and the best of the other specs across its
+variants), both also normalized to 0..1 over the catalog with higher
+always better. Comparing k cars is then one vectorized step over a
+(k x attributes) matrix: per-attribute winners (ties within
+COMPARISON_TIE_TOLERANCE of the catalog range share the win) and deltas
+to the winner. Tables for every pair of the most popular models are
+rendered at load time, so "Swift vs Baleno" is a dict lookup.
+"""
+import os
+import re
+from itertools import permutations
+
+import numpy as np
+
+from car_database import catalog_manager
+from catalog_ingest import numeric_value
+from entity_extractor_manager import scan
+from name_resolver import get_name_index, resolve_car
+from telemetry import annotate, timed
+
+# (row label, field, model summary, higher is better, unit)
+ATTRIBUTES = (
+    ("Price", "Ex-Showroom_Price_Value", "from", False, "₹"),
+    ("Mileage", "ARAI_Certified_Mileage_Value", "up to", True, "km/l"),
+    ("Power", "Power_Value", "up to", True, "PS"),
+    ("Boot space", "Boot_Space_Value", "up to", True, "L"),
+    ("Ground clearance", "Ground_Clearance_Value", "up to", True, "mm"),
+)
+
+# Cars compared in one table
+COMPARISON_MAX_CARS = 4
+# Models (by variant count) whose pairwise tables are rendered at load time
+COMPARISON_PRECOMPUTE_MODELS = int(os.getenv("COMPARISON_PRECOMPUTE_MODELS", "12"))
+# Normalized gap under which two values count as a tie
+COMPARISON_TIE_TOLERANCE = float(os.getenv("COMPARISON_TIE_TOLERANCE", "0.0025"))
+
+# Separators between the cars named in "swift vs baleno or dzire"
+_SEPARATOR_RE = re.compile(r"\b(?:vs|versus|or|and|with|to|than|against)\b|[,/&]")
+
+
+def _format(value, unit):
+    if unit == "₹":
+        return f"₹{int(round(value)):,}"
+    return f"{value:g} {unit}"
+
+
+def _format_delta(delta, unit):
+    sign = "+" if delta > 0 else "-"
+    if unit == "₹":
+        return f"{sign}₹{int(round(abs(delta))):,}"
+    return f"{sign}{round(abs(delta), 1):g}"
+
+
+class ComparisonIndex:
+    """Spec vectors per variant and per model for one catalog snapshot."""
+
+    def __init__(self, documents, popular=COMPARISON_PRECOMPUTE_MODELS):
+        self.documents = list(documents)
+        self.units = [unit for *_, unit in ATTRIBUTES]
+        # +1 where higher is better, -1 where lower is
+        self.signs = np.array([1.0 if higher else -1.0 for _, _, _, higher, _ in ATTRIBUTES])
+        self.variant_values = np.array(
+            [[np.nan if (v := numeric_value(doc, field)) is None else v for _, field, *_ in ATTRIBUTES]
+             for doc in self.documents],
+            dtype=np.float64,
+        ).reshape(len(self.documents), len(ATTRIBUTES))
+        self.variant_rows = {doc.get("Model_Variant"): i for i, doc in enumerate(self.documents)}
+
+        groups = {}
+        for i, doc in enumerate(self.documents):
+            if doc.get("Model"):
+                groups.setdefault(doc["Model"], []).append(i)
+        self.models = list(groups)
+        self.model_rows = {model: row for row, model in enumerate(self.models)}
+        self.model_values = np.full((len(self.models), len(ATTRIBUTES)), np.nan)
+        for row, ids in enumerate(groups.values()):
+            values = self.variant_values[ids]
+            for column, higher in enumerate(self.signs > 0):
+                present = values[:, column][~np.isnan(values[:, column])]
+                if len(present):
+                    self.model_values[row, column] = present.max() if higher else present.min()
+
+        # Catalog-wide ranges of the signed values, for 0..1 normalization
+        signed = self.variant_values * self.signs
+        present = ~np.isnan(signed)
+        self.low = np.where(present.any(axis=0), np.where(present, signed, np.inf).min(axis=0), 0.0)
+        high = np.where(present.any(axis=0), np.where(present, signed, -np.inf).max(axis=0), 1.0)
+        self.span = np.where(high > self.low, high - self.low, 1.0)
+        self.variant_vectors = self.normalize(self.variant_values)
+        self.model_vectors = self.normalize(self.model_values)
+
+        popular_models = sorted(groups, key=lambda model: -len(groups[model]))[:popular]
+        self.tables = {
+            pair: self.render([("model", model) for model in pair]) for pair in permutations(popular_models, 2)
+        }
+
+    def normalize(self, values):
+        """0..1 per attribute over the catalog, higher always better (NaN stays NaN)."""
+        return (values * self.signs - self.low) / self.span
+
+    def spec(self, kind, name):
+        """(raw values, normalized vector) of a model or a variant."""
+        if kind == "model":
+            row = self.model_rows[name]
+            return self.model_values[row], self.model_vectors[row]
+        row = self.variant_rows[name]
+        return self.variant_values[row], self.variant_vectors[row]
+
+    def compare(self, cars):
+        """
+        (values, winners, deltas) for [(kind, name), ...]: the k x attributes
+        raw values, a boolean matrix of per-attribute winners and each
+        value's difference to the winning one (NaN where unknown).
+        """
+        specs = [self.spec(kind, name) for kind, name in cars]
+        values = np.array([values for values, _ in specs])
+        vectors = np.array([vector for _, vector in specs])
+        known = ~np.isnan(vectors)
+        filled = np.where(known, vectors, -np.inf)
+        best = filled.argmax(axis=0)
+        columns = np.arange(len(ATTRIBUTES))
+        # A column needs two known values to have a winner
+        contested = known.sum(axis=0) >= 2
+        winners = known & contested & (filled >= filled[best, columns] - COMPARISON_TIE_TOLERANCE)
+        deltas = np.where(contested, values - values[best, columns], np.nan)
+        return values, winners, deltas
+
+    def render(self, cars):
+        """Compact table for [(kind, name), ...], plus the attributes each car wins."""
+        values, winners, deltas = self.compare(cars)
+        names = [name for _, name in cars]
+        # Model columns summarize their variants: "Price (from)", "Power (up to)"
+        summarized = any(kind == "model" for kind, _ in cars)
+        lines = [f"Comparing {', '.join(names[:-1])} and {names[-1]}:", "Spec | " + " | ".join(names)]
+        for column, (label, _, summary, _, unit) in enumerate(ATTRIBUTES):
+            if np.isnan(values[:, column]).all():
+                continue
+            cells = []
+            for row in range(len(cars)):
+                value = values[row, column]
+                if np.isnan(value):
+                    cells.append("N/A")
+                    continue
+                cell = _format(value, unit)
+                if winners[row, column]:
+                    cell += " ✓"
+                elif not np.isnan(deltas[row, column]) and deltas[row, column]:
+                    cell += f" ({_format_delta(deltas[row, column], unit)})"
+                cells.append(cell)
+            lines.append(f"{label} ({summary}) | " if summarized else f"{label} | ")
+            lines[-1] += " | ".join(cells)
+
+        # Attributes every car ties on decide nothing
+        decisive = winners & ~winners.all(axis=0)
+        verdicts = []
+        for row, name in enumerate(names):
+            won = [ATTRIBUTES[column][0].lower() for column in np.flatnonzero(decisive[row])]
+            if won:
+                verdicts.append(f"{name} leads on {', '.join(won)}")
+        if verdicts:
+            lines.append("")
+            lines.append("; ".join(verdicts) + ".")
+        lines.append("\nWould you like a detailed pitch for any of them, or to book a test drive?")
+        return "\n".join(lines)
+
+    def answer(self, cars):
+        """Rendered table for [(kind, name), ...], precomputed for popular model pairs."""
+        key = tuple(name for kind, name in cars) if all(kind == "model" for kind, _ in cars) else None
+        table = self.tables.get(key)
+        return table if table is not None else self.render(cars)
+
+
+catalog_manager.register_derived("comparison", lambda catalog: ComparisonIndex(catalog.documents))
+
+
+def get_comparison_index():
+    """Comparison index of the live catalog snapshot, rebuilt before every swap."""
+    return catalog_manager.derived("comparison")
+
+
+# === Chat answers ===
+def _car(candidate):
+    if candidate.kind == "variant":
+        return "variant", candidate.doc["Model_Variant"]
+    return "model", candidate.name
+
+
+def resolve_cars(text, limit=COMPARISON_MAX_CARS):
+    """
+    Distinct cars [(kind, name), ...] named in text, in the order mentioned.
+    Each part between separators ("vs", "or", commas) resolves on its own,
+    so variants stay attached to their model; names run together without
+    separators ("compare swift baleno") are picked up from the whole text.
+    """
+    cars = []
+    for part in _SEPARATOR_RE.split(text.lower()):
+        candidate = resolve_car(part) if part.strip() else None
+        if candidate and _car(candidate) not in cars:
+            cars.append(_car(candidate))
+    if len(cars) < 2:
+        models = {name if kind == "model" else None for kind, name in cars}
+        for candidate in get_name_index().resolve(text, limit=10):
+            if candidate.kind == "model" and candidate.name not in models:
+                models.add(candidate.name)
+                cars.append(_car(candidate))
+    return cars[:limit]
+
+
+@timed("compare")
+def comparison_answer(text, intent=None, recent_cars=()):
+    """
+    Comparison table when the message asks to compare two or more cars, or
+    None. "compare them" compares recent_cars (the last shortlist).
+    """
+    if not (intent == "compare" or scan(text).has("comparison")):
+        return None
+    cars = resolve_cars(text)
+    if len(cars) < 2 and recent_cars:
+        cars = list(dict.fromkeys(("variant", car["Model_Variant"]) for car in recent_cars))
+        cars = cars[:COMPARISON_MAX_CARS]
+    if len(cars) < 2:
+        return None
+    index = get_comparison_index()
+    cars = [(kind, name) for kind, name in cars
+            if name in (index.model_rows if kind == "model" else index.variant_rows)]
+    if len(cars) < 2:
+        return None
+    annotate(cars=[name for _, name in cars])
+    return index.answer(cars)
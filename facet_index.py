@@ -0,0 +1,277 @@
+"""
+Facet and aggregate index over the catalog.
+
+Built once per catalog load: every facet value (model, fuel, body,
+transmission, drivetrain, seats) maps to a bitset of variant ids, so
+combining filters is a bitwise AND of Python ints. Price and mileage keep
+prefix bitsets along their sorted order, making range filters two lookups
+and a mask. Questions like "cheapest 7-seater diesel", "what fuel types
+does Ertiga come in" or "price range for SUVs under 10 lakh" are answered
+from it without touching the database.
+"""
+import re
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from car_database import catalog_manager
+from catalog_ingest import numeric_value
+from entity_extractor_manager import entities_of, scan
+from name_resolver import resolve_car
+from telemetry import timed
+
+# facet -> document field
+FACETS = {
+    "model": "Model",
+    "fuel": "Fuel_Type",
+    "body": "Body_Type",
+    "transmission": "Type",
+    "drivetrain": "Drivetrain",
+    "seats": "Seating_Capacity",
+}
+
+# Extracted entity values -> substrings of the facet values they cover
+_FACET_TERMS = {
+    ("transmission", "Automatic"): ("automatic", "amt"),
+    ("drivetrain", "Four Wheel Drive"): ("4wd", "four wheel"),
+    ("drivetrain", "Front Wheel Drive"): ("front wheel",),
+    ("drivetrain", "Rear Wheel Drive"): ("rear wheel",),
+}
+
+_SEATER_RE = re.compile(r"(\d+)\s*-?\s*seat(?:er|s)?\b")
+
+# Variants listed for superlative questions
+MAX_LISTED = 3
+
+
+def _bits(indices):
+    mask = 0
+    for i in indices:
+        mask |= 1 << int(i)
+    return mask
+
+
+def _summary(values):
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return None
+    return {"min": float(values.min()), "max": float(values.max()), "median": float(np.median(values))}
+
+
+class FacetIndex:
+    """Bitsets and aggregates per facet value for one catalog snapshot."""
+
+    def __init__(self, documents):
+        self.documents = list(documents)
+        n = len(self.documents)
+        self.all = (1 << n) - 1
+        self.price = np.array(
+            [np.nan if (v := numeric_value(d, "Ex-Showroom_Price_Value")) is None else v for d in self.documents],
+            dtype=np.float64,
+        )
+        self.mileage = np.array(
+            [np.nan if (v := numeric_value(d, "ARAI_Certified_Mileage_Value")) is None else v for d in self.documents],
+            dtype=np.float64,
+        )
+
+        # facet -> value -> bitset
+        self.bitsets = {}
+        for facet, field in FACETS.items():
+            groups = {}
+            for i, doc in enumerate(self.documents):
+                value = doc.get(field)
+                if value not in (None, ""):
+                    groups.setdefault(value, []).append(i)
+            self.bitsets[facet] = {value: _bits(ids) for value, ids in groups.items()}
+
+        # Sorted values with prefix bitsets: prefix[k] holds the k smallest
+        self._sorted = {}
+        for name, column in (("price", self.price), ("mileage", self.mileage)):
+            order = np.argsort(column, kind="stable")
+            order = order[~np.isnan(column[order])]
+            prefix = [0]
+            for i in order:
+                prefix.append(prefix[-1] | (1 << int(i)))
+            self._sorted[name] = (column[order].tolist(), order, prefix)
+
+    # === Selection ===
+    def facet(self, facet, term):
+        """Bitset of variants whose facet value matches term (case-insensitive)."""
+        if facet == "seats":
+            return self.bitsets[facet].get(int(term), 0)
+        if facet == "model":
+            return self.bitsets[facet].get(term, 0)
+        patterns = _FACET_TERMS.get((facet, term), (str(term).lower(),))
+        mask = 0
+        for value, bits in self.bitsets[facet].items():
+            lowered = str(value).lower()
+            if any(pattern in lowered for pattern in patterns):
+                mask |= bits
+        return mask
+
+    def range(self, column, low=None, high=None):
+        """Bitset of variants with low <= column <= high."""
+        values, _, prefix = self._sorted[column]
+        start = bisect_left(values, low) if low is not None else 0
+        end = bisect_right(values, high) if high is not None else len(values)
+        return prefix[end] & ~prefix[start] if end > start else 0
+
+    def select(self, facets=None, price=(None, None), mileage=(None, None)):
+        """AND of the facet filters {facet: term} and the numeric ranges."""
+        mask = self.all
+        for facet, term in (facets or {}).items():
+            mask &= self.facet(facet, term)
+        if price != (None, None):
+            mask &= self.range("price", *price)
+        if mileage != (None, None):
+            mask &= self.range("mileage", *mileage)
+        return mask
+
+    # === Aggregates ===
+    def ids(self, mask):
+        return [i for i in range(len(self.documents)) if mask >> i & 1]
+
+    def aggregate(self, mask):
+        ids = np.array(self.ids(mask), dtype=np.int64)
+        return {"count": len(ids), "price": _summary(self.price[ids]), "mileage": _summary(self.mileage[ids])}
+
+    def values(self, facet, mask):
+        """Facet values present among the selected variants, most common first."""
+        counts = {value: (bits & mask).bit_count() for value, bits in self.bitsets[facet].items()}
+        return [value for value, count in sorted(counts.items(), key=lambda item: -item[1]) if count]
+
+    def ordered(self, column, mask, descending=False, k=MAX_LISTED):
+        """The k selected documents with the lowest (or highest) column value."""
+        _, order, _ = self._sorted[column]
+        found = []
+        for i in (order[::-1] if descending else order):
+            if mask >> int(i) & 1:
+                found.append(self.documents[i])
+                if len(found) == k:
+                    break
+        return found
+
+
+catalog_manager.register_derived("facets", lambda catalog: FacetIndex(catalog.documents))
+
+
+def get_facet_index():
+    """Facet index of the live catalog snapshot, rebuilt before every swap."""
+    return catalog_manager.derived("facets")
+
+
+# === Chat answers ===
+def parse_facets(text):
+    """Facet filters mentioned in a message."""
+    result = scan(text)
+    facets = {}
+    for slot, facet in (("fuel_type", "fuel"), ("car_type", "body"), ("transmission", "transmission"),
+                        ("drive_type", "drivetrain")):
+        value = result.first(slot)
+        if value:
+            facets[facet] = value
+    seater = _SEATER_RE.search(text.lower())
+    if seater:
+        facets["seats"] = int(seater.group(1))
+    candidate = resolve_car(text)
+    if candidate:
+        facets["model"] = candidate.doc["Model"]
+    return facets
+
+
+def parse_ranges(text):
+    """(price, mileage) bounds mentioned in a message, as select() ranges."""
+    entities = entities_of(scan(text))
+    return ((entities.get("budget_min"), entities.get("budget_max")),
+            (entities.get("arai_mileage_min"), entities.get("arai_mileage_max")))
+
+
+def _bounds(low, high, format):
+    if low is not None and high is not None:
+        return f"between {format(low)} and {format(high)}"
+    if high is not None:
+        return f"under {format(high)}"
+    return f"over {format(low)}"
+
+
+def _qualify(price, mileage):
+    """Range phrase such as " under ₹800,000", or "" without ranges."""
+    words = ""
+    if price != (None, None):
+        words += " " + _bounds(*price, _price)
+    if mileage != (None, None):
+        words += " with mileage " + _bounds(*mileage, lambda value: f"{value} km/l")
+    return words
+
+
+def _describe(facets):
+    words = []
+    if "seats" in facets:
+        words.append(f"{facets['seats']}-seater")
+    for facet in ("transmission", "fuel", "model", "body"):
+        if facet in facets:
+            value = str(facets[facet])
+            words.append(value.upper() if value.lower() in ("suv", "mpv", "muv") else value)
+    return " ".join(words) if words else "Maruti Suzuki"
+
+
+def _price(value):
+    return f"₹{int(value):,}"
+
+
+def _line(doc):
+    price = doc.get("Ex-Showroom_Price_Value")
+    mileage = doc.get("ARAI_Certified_Mileage") or "N/A"
+    return f"- {doc['Model_Variant']}: {_price(price) if price else doc.get('Ex-Showroom_Price', 'N/A')}, {mileage}"
+
+
+@timed("facets")
+def facet_answer(text, refers_back=False):
+    """
+    Answer an aggregate question from the facet index, or None. A question
+    that refers back to the conversation (refers_back: "cheapest of these",
+    "how much is it") is only answered when it names its own subject.
+    """
+    result = scan(text)
+    if not result.has("aggregate"):
+        return None
+    question = result.first("aggregate")
+    # "how much boot space ..." is for the spec rules, not a price range
+    if question == "how_much" and result.has("spec"):
+        return None
+    facets = parse_facets(text)
+    price, mileage = parse_ranges(text)
+    if not facets and price == mileage == (None, None) and (refers_back or question == "how_much"):
+        # A bare "how much" asks about the car under discussion
+        return None
+    if question == "how_much":
+        question = "price_range"
+    index = get_facet_index()
+    mask = index.select(facets, price=price, mileage=mileage)
+    subject = _describe(facets)
+    qualifier = _qualify(price, mileage)
+    if not mask:
+        return f"I couldn't find any {subject} variants{qualifier} in our current lineup. Could you relax one of the requirements?"
+
+    if question in ("cheapest", "priciest", "best_mileage"):
+        column, descending, title = {
+            "cheapest": ("price", False, "Most affordable"),
+            "priciest": ("price", True, "Top-end"),
+            "best_mileage": ("mileage", True, "Most fuel-efficient"),
+        }[question]
+        cars = index.ordered(column, mask, descending=descending)
+        return f"{title} {subject} options{qualifier}:\n" + "\n".join(_line(car) for car in cars) + \
+            "\n\nWould you like a detailed pitch for any of them?"
+
+    if question == "price_range":
+        aggregate = index.aggregate(mask)
+        stats = aggregate["price"]
+        if stats is None:
+            return None
+        return (f"{subject} prices range from {_price(stats['min'])} to {_price(stats['max'])} "
+                f"(median {_price(stats['median'])}) across {aggregate['count']} variants{qualifier}.")
+
+    facet, noun = {"fuel_types": ("fuel", "fuel types"), "transmissions": ("transmission", "transmissions"),
+                   "body_types": ("body", "body styles")}[question]
+    values = index.values(facet, mask)
+    return f"{subject}{qualifier} is available in these {noun}: {', '.join(str(v) for v in values)}."
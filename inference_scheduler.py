@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import json
+from collections import deque
+from contextlib import asynccontextmanager
+
+# Wait times kept for the percentile metrics
+WAIT_SAMPLES = 1024
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when the queue is full and a request is shed."""
+
+
+def prompt_key(model, messages, options=None):
+    """Identical prompts share a key and therefore one generation."""
+    payload = json.dumps([model, messages, options], sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class InferenceScheduler:
+    """
+    Admission control in front of the model server.
+
+    At most max_in_flight generations run at once and at most max_queue
+    requests wait for a slot; beyond that requests are shed immediately
+    with SchedulerOverloaded instead of piling up on Ollama. Every request
+    has a deadline covering both its queue wait and its generation.
+    Concurrent requests with the same key await a single generation.
+
+    Must be used from one event loop.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._pending = {}  # key -> generation task
+        self._wait_times = deque(maxlen=WAIT_SAMPLES)
+        self.queued = 0
+        self.in_flight = 0
+        self.submitted = 0
+        self.coalesced = 0
+        self.shed = 0
+        self.timeouts = 0
+        self.failed = 0
+        self.completed = 0
+
+    async def _acquire(self, deadline):
+        if not self.queued and not self._slots.locked():
+            # A slot is free: take it without queueing
+            await self._slots.acquire()
+            self._wait_times.append(0.0)
+            self.in_flight += 1
+            return
+        if self.queued >= self.max_queue:
+            self.shed += 1
+            raise SchedulerOverloaded()
+        loop = asyncio.get_running_loop()
+        enqueued = loop.time()
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=deadline - enqueued)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.queued -= 1
+        self._wait_times.append(loop.time() - enqueued)
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    async def _run(self, call, deadline):
+        await self._acquire(deadline)
+        try:
+            result = await asyncio.wait_for(call(), timeout=deadline - asyncio.get_running_loop().time())
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._release()
+        self.completed += 1
+        return result
+
+    async def submit(self, call, key=None, timeout=None):
+        """
+        Run call() (a coroutine function) under the scheduler and return its
+        result. Raises SchedulerOverloaded when shed and asyncio.TimeoutError
+        when the deadline passes.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        self.submitted += 1
+        task = self._pending.get(key) if key is not None else None
+        if task is not None:
+            self.coalesced += 1
+        else:
+            deadline = asyncio.get_running_loop().time() + timeout
+            task = asyncio.ensure_future(self._run(call, deadline))
+            # Waiters may give up first; keep an unobserved failure quiet
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            if key is not None:
+                self._pending[key] = task
+                task.add_done_callback(lambda _: self._pending.pop(key, None))
+        # shield: one waiter timing out must not cancel a shared generation
+        return await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+
+    @asynccontextmanager
+    async def slot(self, timeout=None):
+        """
+        Hold one in-flight slot for work that cannot be coalesced, such as a
+        streamed generation. Yields the loop-time deadline.
+        """
+        deadline = asyncio.get_running_loop().time() + (self.timeout if timeout is None else timeout)
+        self.submitted += 1
+        await self._acquire(deadline)
+        try:
+            yield deadline
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        else:
+            self.completed += 1
+        finally:
+            self._release()
+
+    def metrics(self):
+        waits = sorted(self._wait_times)
+        return {
+            "queue_depth": self.queued,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "shed": self.shed,
+            "timeouts": self.timeouts,
+            "failed": self.failed,
+            "completed": self.completed,
+            "wait_seconds": {
+                "p50": _percentile(waits, 0.50),
+                "p95": _percentile(waits, 0.95),
+                "max": waits[-1] if waits else 0.0,
+            },
+        }
@@ -0,0 +1,234 @@
+"""
+Local intent classifier for routing chat turns.
+
+Messages become hashed features (words, word bigrams and character
+trigrams, with digits folded together) and a softmax-regression model
+trained offline on intent_utterances.jsonl scores them in microseconds on
+the CPU. Turns classified with at least INTENT_CONFIDENCE are routed by
+intent; anything less confident keeps the keyword rules and the LLM.
+
+    python intent_classifier.py train
+    python intent_classifier.py query "which one should i buy"
+
+Utterance templates may use {model}, {model2}, {fuel}, {body}, {budget}
+and {people}; training expands each one with catalog values.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import zlib
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from catalog_ingest import load_dataset
+from telemetry import stage
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(_DIR, "intent_model.npz")
+UTTERANCES_PATH = os.path.join(_DIR, "intent_utterances.jsonl")
+MODEL_VERSION = 1
+
+INTENTS = ("search", "model_info", "compare", "recommend", "smalltalk", "off_topic", "dealer")
+# Below this probability a turn is left to the keyword rules and the LLM
+INTENT_CONFIDENCE = float(os.getenv("INTENT_CONFIDENCE", "0.7"))
+HASHING_DIM = 1 << 14
+
+# Template expansions per utterance when training
+EXPANSIONS = 8
+TEMPLATE_VALUES = {
+    "fuel": ["petrol", "diesel", "cng"],
+    "body": ["suv", "sedan", "hatchback", "mpv"],
+    "budget": ["5 lakh", "8 lakh", "10 lakhs", "12l", "600k", "7.5 lakh", "15 lakh"],
+    "people": ["2", "4", "5", "6", "7", "8"],
+}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_DIGITS_RE = re.compile(r"\d+")
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+
+Intent = namedtuple("Intent", ["name", "confidence"])
+
+
+def features(text, dim=HASHING_DIM):
+    """Hashed feature ids of a message; repeated features repeat."""
+    words = [_DIGITS_RE.sub("0", w) for w in _WORD_RE.findall(text.lower())]
+    keys = [f"w:{w}" for w in words]
+    keys += [f"b:{a} {b}" for a, b in zip(["^"] + words, words + ["$"])]
+    for word in words:
+        padded = f"<{word}>"
+        keys += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return np.array([zlib.crc32(key.encode("utf-8")) % dim for key in keys], dtype=np.int64)
+
+
+class IntentClassifier:
+    """Linear softmax model over hashed features."""
+
+    def __init__(self, weights, bias, intents, dim=HASHING_DIM):
+        self.weights = weights
+        self.bias = bias
+        self.intents = tuple(intents)
+        self.dim = dim
+
+    def probabilities(self, text):
+        ids = features(text, self.dim)
+        logits = self.bias.copy()
+        if len(ids):
+            # Inputs are L2-normalized counts: each occurrence weighs 1/sqrt(n)
+            logits += self.weights[ids].sum(axis=0) / np.sqrt(len(ids))
+        logits = np.exp(logits - logits.max())
+        return logits / logits.sum()
+
+    def predict(self, text):
+        probabilities = self.probabilities(text)
+        best = int(probabilities.argmax())
+        return Intent(self.intents[best], float(probabilities[best]))
+
+    def save(self, path=MODEL_PATH):
+        np.savez(
+            path, weights=self.weights, bias=self.bias, intents=np.array(self.intents),
+            dim=self.dim, version=MODEL_VERSION,
+        )
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != MODEL_VERSION:
+                raise ValueError("Intent model version mismatch; re-run intent_classifier.py train")
+            return cls(data["weights"], data["bias"], [str(i) for i in data["intents"]], int(data["dim"]))
+
+
+# === Training ===
+def load_utterances(path=UTTERANCES_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def expand(utterances, models, expansions=EXPANSIONS, seed=0):
+    """(text, intent) examples with every template filled in several ways."""
+    rng = random.Random(seed)
+    values = dict(TEMPLATE_VALUES, model=models, model2=models)
+    examples = []
+    for utterance in utterances:
+        text = utterance["text"]
+        count = expansions if _PLACEHOLDER_RE.search(text) else 1
+        for _ in range(count):
+            filled = _PLACEHOLDER_RE.sub(lambda m: rng.choice(values[m.group(1)]), text)
+            examples.append((filled, utterance["intent"]))
+    return examples
+
+
+def train(examples, intents=INTENTS, dim=HASHING_DIM, epochs=300, learning_rate=0.1, l2=1e-5):
+    """Full-batch Adam on the softmax cross-entropy of the examples."""
+    index = {intent: i for i, intent in enumerate(intents)}
+    rows, cols, vals = [], [], []
+    for row, (text, _) in enumerate(examples):
+        ids = features(text, dim)
+        rows.append(np.full(len(ids), row))
+        cols.append(ids)
+        vals.append(np.full(len(ids), 1 / np.sqrt(max(len(ids), 1))))
+    rows, cols, vals = np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+    n, k = len(examples), len(intents)
+    targets = np.zeros((n, k))
+    targets[np.arange(n), [index[intent] for _, intent in examples]] = 1.0
+
+    params = [np.zeros((dim, k)), np.zeros(k)]
+    moments = [[np.zeros_like(p), np.zeros_like(p)] for p in params]
+    for step in range(1, epochs + 1):
+        logits = np.zeros((n, k))
+        for c in range(k):
+            logits[:, c] = np.bincount(rows, weights=vals * params[0][cols, c], minlength=n)
+        logits += params[1]
+        logits = np.exp(logits - logits.max(axis=1, keepdims=True))
+        delta = (logits / logits.sum(axis=1, keepdims=True) - targets) / n
+        grads = [
+            np.stack([np.bincount(cols, weights=vals * delta[rows, c], minlength=dim) for c in range(k)], axis=1)
+            + l2 * params[0],
+            delta.sum(axis=0),
+        ]
+        for param, grad, (m, v) in zip(params, grads, moments):
+            m *= 0.9
+            m += 0.1 * grad
+            v *= 0.999
+            v += 0.001 * grad * grad
+            param -= learning_rate * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+    return IntentClassifier(params[0].astype(np.float32), params[1].astype(np.float32), intents, dim)
+
+
+def evaluate(classifier, examples, threshold=INTENT_CONFIDENCE):
+    """Accuracy overall, and coverage/accuracy of the predictions above threshold."""
+    predictions = [classifier.predict(text) for text, _ in examples]
+    correct = [p.name == intent for p, (_, intent) in zip(predictions, examples)]
+    confident = [c for p, c in zip(predictions, correct) if p.confidence >= threshold]
+    return {
+        "examples": len(examples),
+        "accuracy": round(float(np.mean(correct)), 4) if correct else 0.0,
+        "coverage": round(len(confident) / len(examples), 4) if examples else 0.0,
+        "confident_accuracy": round(float(np.mean(confident)), 4) if confident else 0.0,
+    }
+
+
+# === Runtime ===
+_classifier = None
+
+
+def get_intent_classifier(path=MODEL_PATH):
+    """The trained model, or None when it has not been trained."""
+    global _classifier
+    if _classifier is None:
+        if not os.path.exists(path):
+            return None
+        _classifier = IntentClassifier.load(path)
+    return _classifier
+
+
+@lru_cache(maxsize=1024)
+def classify(text, threshold=INTENT_CONFIDENCE):
+    """The message's Intent when the model is at least threshold sure, else None."""
+    classifier = get_intent_classifier()
+    if classifier is None:
+        return None
+    with stage("intent"):
+        intent = classifier.predict(text)
+    return intent if intent.confidence >= threshold else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or query the local intent classifier")
+    parser.add_argument("command", choices=["train", "query"])
+    parser.add_argument("text", nargs="?", default="")
+    parser.add_argument("--utterances", default=UTTERANCES_PATH)
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of utterances held out for evaluation")
+    args = parser.parse_args()
+
+    if args.command == "query":
+        classifier = IntentClassifier.load(args.model)
+        probabilities = classifier.probabilities(args.text)
+        for i in np.argsort(-probabilities):
+            print(f"{probabilities[i]:.3f}  {classifier.intents[i]}")
+        return
+
+    utterances = load_utterances(args.utterances)
+    models = sorted({doc["Model"] for doc in load_dataset()})
+    models += [model.lower() for model in models]
+
+    # Hold out whole utterances, so no expansion of a test template is trained on
+    shuffled = random.Random(0).sample(utterances, len(utterances))
+    split = int(len(shuffled) * args.holdout)
+    if split:
+        held_out = train(expand(shuffled[split:], models))
+        report = evaluate(held_out, expand(shuffled[:split], models, seed=1))
+        print(f"Held-out ({split} utterances): {json.dumps(report)}")
+
+    classifier = train(expand(utterances, models))
+    classifier.save(args.model)
+    print(f"Trained on {len(utterances)} utterances: {json.dumps(evaluate(classifier, expand(utterances, models, seed=2)))}")
+    print(f"Wrote {args.model}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,30 @@
-import ollama
+import asyncio
+import contextvars
+import os
 import re
-from difflib import get_close_matches
-from car_database import get_car_by_name, collection
+from concurrent.futures import ThreadPoolExecutor
+
+from catalog_ingest import numeric_value
+from chat_context import PromptContext
+from inference_scheduler import InferenceScheduler, SchedulerOverloaded, prompt_key
+from entity_extractor_manager import (
+    OFF_TOPIC_TRIGGERS, extract_budget, extract_car_type, extract_entities, extract_family_size, extract_fuel_type,
+    scan
+)
+from car_database import on_catalog_reload, refine_cars
+from comparison import comparison_answer
+from name_resolver import resolve_car
+from prefetch import prefetcher
+from facet_index import facet_answer
+from intent_classifier import classify
+from ranking import rank_cars
+from semantic_search import grounding_message, semantic_answer
+from response_cache import MISSING, invalidate_all, llm_cache, llm_cache_key, pitch_cache, pitch_cache_key
+from search_state import SearchState
+from session_store import create_session_store
+from telemetry import annotate, set_branch, stage, timed, turn
+# Logs every turn through telemetry.on_turn when TURN_LOG_BACKEND is set
+import turn_log  # noqa: F401
 
 context = [{
     "role": "system",
@@ -22,97 +45,130 @@ context = [{
     )
 }]
 
-chat_history = context.copy()
-user_info = {
-    "family_size": None,
-    "fuel_type": None,
-    "car_type": None,
-    "budget": None
+# The system prompt is a fixed prefix; history is trimmed to the token budget
+prompt_context = PromptContext(context)
+
+# Conversation state lives in a session store keyed by session id, so
+# concurrent clients (and workers, with the mongo backend) stay separate.
+DEFAULT_SESSION_ID = "default"
+sessions = create_session_store()
+
+# === Async execution ===
+# Blocking DB/session work runs on a bounded thread pool, LLM generations
+# use the async Ollama client behind the inference scheduler (concurrency
+# limit, bounded queue, deadlines and coalescing of identical prompts).
+DB_THREADS = int(os.getenv("CHAT_DB_THREADS", "16"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+
+LLM_MODEL = "phi"
+LLM_OPTIONS = {"temperature": 0.3, "repeat_penalty": 1.2}
+
+# Cars listed after the budget step
+MAX_LISTED_CARS = 6
+
+OFF_TOPIC_REPLY = "Let's focus on Maruti Suzuki cars. Would you like to know about models, pricing, or book a test drive?"
+LLM_ERROR_REPLY = "I'm having trouble connecting. Please ask about Maruti Suzuki cars or visit our website."
+# Served when the LLM queue is full; the guided flow still works without it
+OVERLOAD_REPLY = (
+    "We're helping a lot of customers right now. Tell me your family size, fuel preference, "
+    "car type or budget and I'll shortlist cars for you right away."
+)
+
+# Confidently classified turns the keyword rules miss are answered without
+# the LLM (see intent_classifier.py); set INTENT_ROUTING=0 to disable
+INTENT_ROUTING = os.getenv("INTENT_ROUTING", "1") == "1"
+SMALLTALK_REPLY = (
+    "Happy to help! Ask me about any Maruti Suzuki model, or tell me your budget "
+    "and I'll shortlist cars for you."
+)
+MODEL_PROMPT_REPLY = "Which Maruti Suzuki model would you like to know about? For example Swift, Baleno or Ertiga."
+# "what is its mileage" refers back to the conversation; only the LLM sees it
+_REFERENCE_RE = re.compile(r"\b(?:it|its|this|that|these|those|them|they)\b")
+
+# extract_entities keys -> search_cars filter keys
+_ENTITY_FILTERS = {
+    "seats": "seats", "family_size": "family_size", "fuel_type": "fuel_type", "car_type": "car_type",
+    "drive_type": "drive_type", "budget_min": "budget_min", "budget_max": "budget_max",
+    "arai_mileage_min": "min_mileage", "arai_mileage_max": "max_mileage",
 }
-last_recommended_cars = []
+
+# Cached pitches and replies may quote catalog data, and so may prefetched ones
+on_catalog_reload(invalidate_all)
+on_catalog_reload(prefetcher.clear)
+
+db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="chat-db")
+scheduler = InferenceScheduler(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_TIMEOUT_SECONDS)
+_async_client = None
+
+
+def _run_in_db(func, *args):
+    """run_in_executor on db_executor, carrying the turn's trace context along."""
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(db_executor, context.run, func, *args)
+
+def _ollama():
+    # Imported on the first LLM call: the client stack (httpx, pydantic
+    # models) is a large share of startup time and rule-based turns never need it
+    import ollama
+    return ollama
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = _ollama().AsyncClient()
+    return _async_client
+
+HALLUCINATION_FLAGS = [
+    "according to my calculations", "let me think through this",
+    "here's a story", "imagine this", "suppose that", "theoretical",
+    "abstract", "philosophical", "mathematical proof", "puzzle solution"
+]
 
 def is_off_topic(text):
-    triggers = [
-        "logic puzzle", "proof", "robot", "suv1", "tree of thought",
-        "deduction", "logical reasoning", "imagine you", "customer a",
-        "customer b", "hypothetical", "what if", "scenario",
-        "thought experiment", "fictional", "pretend", "assume"
-    ]
-    text_lower = text.lower()
-    return any(trigger in text_lower for trigger in triggers)
+    return scan(text).has("off_topic")
 
 def is_hallucination_response(text):
-    red_flags = [
-        "according to my calculations", "let me think through this",
-        "here's a story", "imagine this", "suppose that", "theoretical",
-        "abstract", "philosophical", "mathematical proof", "puzzle solution"
-    ]
-    return any(flag in text.lower() for flag in red_flags)
-
-# === Entity Extractors ===
-def extract_family_size(text):
-    match = re.search(r'\b(\d+)\s*(people|members|family|persons|kids|adults)?\b', text.lower())
-    return int(match.group(1)) if match else None
-
-def extract_fuel_type(text):
-    for fuel in ["petrol", "diesel", "cng"]:
-        if fuel in text.lower():
-            return fuel.capitalize()
-    return None
+    return any(flag in text.lower() for flag in HALLUCINATION_FLAGS)
 
-def extract_budget(text):
-    match = re.search(r'(\d+(?:\.\d+)?)\s*(lakh|lakhs|l|k|thousand)?', text.lower())
-    if match:
-        amount = float(match.group(1))
-        unit = match.group(2)
-        if unit:
-            if "lakh" in unit or unit == "l":
-                return int(amount * 100000)
-            elif "k" in unit or "thousand" in unit:
-                return int(amount * 1000)
-        return int(amount)
-    return None
+class StreamGuard:
+    """
+    Incremental is_hallucination_response/is_off_topic check for a growing
+    LLM reply. Only the tail that could complete a phrase is re-scanned,
+    so each token costs O(longest phrase) instead of O(reply length).
+    """
 
-def extract_car_type(text):
-    for car_type in ["suv", "sedan", "hatchback", "mpv"]:
-        if car_type in text.lower():
-            return car_type.capitalize()
-    return None
+    _phrases = OFF_TOPIC_TRIGGERS + HALLUCINATION_FLAGS
+    _window = max(len(p) for p in _phrases)
 
-def get_recommendation_score(car, user_info):
-    """Calculate a score for how well a car matches user preferences"""
-    score = 0
-    
-    if user_info["budget"] and car.get("Ex-Showroom_Price_Value"):
-        budget_diff = abs(user_info["budget"] - car["Ex-Showroom_Price_Value"])
-        score += max(0, 100 - (budget_diff / user_info["budget"] * 100))
-    
-    if user_info["family_size"] and car.get("Seating_Capacity"):
-        if car["Seating_Capacity"] >= user_info["family_size"]:
-            score += 50
-        else:
-            score -= 100  
-    
-    try:
-        mileage = float(re.findall(r"[\d.]+", car.get("ARAI_Certified_Mileage", "0"))[0])
-        score += mileage * 2
-    except:
-        pass
-    
-    if car.get("Ex-Showroom_Price_Value"):
-        score += car["Ex-Showroom_Price_Value"] / 100000  
-    
-    return score
+    def __init__(self):
+        self._tail = ""
+
+    def feed(self, token):
+        """Add a token; return True once the reply should be cut off."""
+        scan = self._tail + token.lower()
+        self._tail = scan[-self._window:]
+        return any(phrase in scan for phrase in self._phrases)
 
 # === Sales Pitch Generator ===
+@timed("pitch")
 def generate_sales_pitch(car, comparison=False):
+    key = pitch_cache_key(car, comparison)
+    pitch = pitch_cache.get(key)
+    if pitch is MISSING:
+        pitch = _render_sales_pitch(car, comparison)
+        pitch_cache.set(key, pitch)
+    return pitch
+
+def _render_sales_pitch(car, comparison):
     try:
         model = car.get("Model", "this car")
         fuel = car.get("Fuel_Type", "Petrol")
         seats = car.get("Seating_Capacity", "5")
         mileage = car.get("ARAI_Certified_Mileage", "")
-        price_value = car.get("Ex-Showroom_Price_Value")
-        price_display = f"₹{price_value:,}" if price_value else car.get("Ex-Showroom_Price", "N/A")
+        price_value = numeric_value(car, "Ex-Showroom_Price_Value")
+        price_display = f"₹{int(price_value):,}" if price_value else car.get("Ex-Showroom_Price", "N/A")
 
         features = []
 
@@ -123,15 +179,12 @@ def generate_sales_pitch(car, comparison=False):
             features.append("great value for money")
 
         # Add mileage advantage
-        if mileage:
-            try:
-                mileage_float = float(re.findall(r"[\d.]+", mileage)[0])
-                if mileage_float >= 23:
-                    features.append(f"excellent mileage of {mileage} – perfect for daily commuters")
-                elif mileage_float >= 20:
-                    features.append(f"good mileage of {mileage}")
-            except:
-                pass
+        mileage_float = numeric_value(car, "ARAI_Certified_Mileage_Value")
+        if mileage and mileage_float:
+            if mileage_float >= 23:
+                features.append(f"excellent mileage of {mileage} – perfect for daily commuters")
+            elif mileage_float >= 20:
+                features.append(f"good mileage of {mileage}")
 
         # Add usage-based suggestion
         if seats and int(seats) <= 5:
@@ -157,18 +210,68 @@ def generate_sales_pitch(car, comparison=False):
     except Exception as e:
         return "Let me tell you about this model. Would you like to schedule a test drive?"
 
-def chat_with_phi(user_message):
-    global chat_history, user_info, last_recommended_cars
-
+def chat_with_phi(user_message, session_id=DEFAULT_SESSION_ID):
+    with turn():
+        annotate(session=session_id, message=user_message)
+        state = _load_session(session_id)
+        try:
+            reply = _timed_rule_based_reply(state, user_message)
+            if reply is None:
+                reply = _llm_reply(state, user_message)
+            return reply
+        finally:
+            _save_session(state)
+
+async def achat_with_phi(user_message, session_id=DEFAULT_SESSION_ID):
+    """Async chat_with_phi that never blocks the event loop."""
+    with turn():
+        annotate(session=session_id, message=user_message)
+        state = await _run_in_db(_load_session, session_id)
+        try:
+            reply = await _run_in_db(_timed_rule_based_reply, state, user_message)
+            if reply is None:
+                reply = await _allm_reply(state, user_message)
+            return reply
+        finally:
+            await _run_in_db(_save_session, state)
+
+@timed("session_load")
+def _load_session(session_id):
+    return sessions.get(session_id)
+
+@timed("session_save")
+def _save_session(state):
+    sessions.save(state)
+
+@timed("rules")
+def _timed_rule_based_reply(state, user_message):
+    return _rule_based_reply(state, user_message)
+
+def _rule_based_reply(state, user_message):
+    """Answer from rules and the catalog, or None when the LLM must reply."""
+    user_info = state.user_info
     lowered = user_message.lower()
+    intent = classify(user_message) if INTENT_ROUTING else None
 
-    if is_off_topic(user_message):
+    if is_off_topic(user_message) or (intent and intent.name == "off_topic"):
         return "Let's focus on Maruti Suzuki cars. How can I help you find your perfect car today?"
 
     if not any(user_info.values()):
-        if any(greet in lowered for greet in ["hi", "hello", "hey"]):
+        if scan(user_message).has("greeting"):
             return "Hello! Welcome to Maruti Suzuki. To help find your ideal car, how many people will usually be traveling with you?"
 
+    # "cheapest 7-seater diesel", "price range for SUVs": answered at any step
+    reply = facet_answer(user_message, refers_back=bool(_REFERENCE_RE.search(lowered)))
+    if reply:
+        set_branch("facet")
+        return reply
+
+    # "Swift vs Baleno vs Dzire", "compare these": a spec table at any step
+    reply = comparison_answer(user_message, intent.name if intent else None, state.last_recommended_cars)
+    if reply:
+        set_branch("compare")
+        return reply
+
     if user_info["family_size"] is None:
         size = extract_family_size(user_message)
         if size:
@@ -187,6 +290,9 @@ def chat_with_phi(user_message):
         car_type = extract_car_type(user_message)
         if car_type:
             user_info["car_type"] = car_type
+            # The budget comes next: search the candidates while the user types it
+            filters = _candidate_filters(user_info)
+            prefetcher.schedule(state.session_id, "candidates", _prefetch_key(filters), _search_candidates, filters)
             return f"Excellent! What's your approximate budget for the {car_type}?"
         return "We have SUVs, Sedans, Hatchbacks, and MPVs. Which type interests you?"
 
@@ -194,87 +300,273 @@ def chat_with_phi(user_message):
         budget = extract_budget(user_message)
         if budget:
             user_info["budget"] = budget
-            query = {
-                "Seating_Capacity": {"$gte": user_info["family_size"]},
-                "Fuel_Type": user_info["fuel_type"].lower(),
-                "Car_Type": user_info["car_type"].lower(),
-                "Ex-Showroom_Price_Value": {"$lte": user_info["budget"] * 1.1}  # 10% flexibility
-            }
-            cars = list(collection.find(query).limit(6))
-            if cars:
-                last_recommended_cars = cars
-                response = "🌟 Based on your needs, I recommend these models:\n"
-                for car in cars:
-                    response += f"- {car['Model']} | {car['Fuel_Type']} | {car['Seating_Capacity']} seats | {car.get('ARAI_Certified_Mileage', 'N/A')} | ₹{car['Ex-Showroom_Price_Value']:,}\n"
-                response += "\nWould you like me to suggest the best option from these?"
-                return response
-            return "Let me check our inventory for suitable options. Could you adjust any preferences?"
+            search = prefetcher.take(state.session_id, "candidates", _prefetch_key(_candidate_filters(user_info)))
+            if search is not MISSING:
+                # The budget only narrows the prefetched candidates
+                state.search = search
+            return _shortlist(state, _profile_filters(user_info)) or \
+                "Let me check our inventory for suitable options. Could you adjust any preferences?"
         return "To suggest the best options, please share your approximate budget."
 
-    recommendation_triggers = [
-        "which one", "recommend", "best", "suggest", "good one", 
-        "value", "better", "better option", "which is good", 
-        "top pick", "what should", "what would you", "choose",
-        "go with", "prefer", "opinion"
-    ]
-    
-    if last_recommended_cars and any(trigger in lowered for trigger in recommendation_triggers):
-        # Score and sort the cars
-        scored_cars = [(car, get_recommendation_score(car, user_info)) for car in last_recommended_cars]
-        scored_cars.sort(key=lambda x: x[1], reverse=True)
-        
-        if scored_cars:
-            best_car = scored_cars[0][0]
-            last_recommended_cars = []  # Clear to avoid repetition
-            return generate_sales_pitch(best_car, comparison=True)
+    # A confident intent overrides the keyword triggers ("best value phone" is not a request)
+    wants_recommendation = intent.name == "recommend" if intent else scan(user_message).has("recommendation_trigger")
+    if state.last_recommended_cars and wants_recommendation:
+        picked = prefetcher.take(state.session_id, "pick", _pick_key(state))
+        if picked is MISSING:
+            picked = _pick(state.last_recommended_cars, user_info)
+        if picked:
+            set_branch("db")
+            annotate(cars=[picked[0].get("Model_Variant")])
+            state.last_recommended_cars = []  # Clear to avoid repetition
+            return picked[1]
 
     # Handle "show me again" or "what were my options"
-    if last_recommended_cars and ("options" in lowered or "show again" in lowered or "what were" in lowered):
+    if state.last_recommended_cars and ("options" in lowered or "show again" in lowered or "what were" in lowered):
+        annotate(cars=[car.get("Model_Variant") for car in state.last_recommended_cars])
         response = "Here are the models I recommended earlier:\n"
-        for car in last_recommended_cars:
+        for car in state.last_recommended_cars:
             response += f"- {car['Model']} | ₹{car['Ex-Showroom_Price_Value']:,}\n"
         response += "\nLet me know if you want know anything better?"
         return response
 
-    # Handle specific variant queries
-    variant_doc = collection.find_one({"Model_Variant": {"$regex": lowered, "$options": "i"}})
-    if variant_doc:
-        return generate_sales_pitch(variant_doc)
-
-    # Fuzzy match for models
-    words = re.findall(r"\b\w+\b", lowered)
-    models_in_db = collection.distinct("Model")
-    matched = get_close_matches(" ".join(words), models_in_db, n=1, cutoff=0.7)
-    if matched:
-        car = get_car_by_name(matched[0])
-        if car:
-            return generate_sales_pitch(car)
+    # Handle specific model / variant queries
+    candidate = resolve_car(user_message)
+    if candidate:
+        set_branch("db")
+        annotate(cars=[candidate.doc.get("Model_Variant")])
+        return generate_sales_pitch(candidate.doc)
+
+    # Descriptive questions ("big boot for highway trips") close to a spec sheet
+    reply = semantic_answer(user_message)
+    if reply:
+        set_branch("db")
+        return reply
+
+    if intent:
+        reply = _intent_reply(state, intent.name, user_message)
+        if reply:
+            set_branch("intent")
+            return reply
 
     # Fallback to LLM
-    try:
-        chat_history.append({"role": "user", "content": user_message})
-        response = ollama.chat(
-            model="phi",
-            messages=chat_history,
-            options={"temperature": 0.3, "repeat_penalty": 1.2}
-        )
-        bot_reply = response["message"]["content"]
+    return None
 
-        if is_hallucination_response(bot_reply) or is_off_topic(bot_reply):
-            return "Let's focus on Maruti Suzuki cars. Would you like to know about models, pricing, or book a test drive?"
+def _candidate_filters(user_info):
+    return {
+        "seats": user_info["family_size"],
+        "fuel_type": user_info["fuel_type"],
+        "car_type": user_info["car_type"],
+    }
+
+def _profile_filters(user_info):
+    return dict(_candidate_filters(user_info), budget_max=user_info["budget"] * 1.1)  # 10% flexibility
+
+# === Prefetch ===
+# Work for the predictable next turn, run by prefetcher while the user types
+def _prefetch_key(filters):
+    return tuple(sorted(filters.items()))
+
+def _search_candidates(filters):
+    """SearchState holding the candidates before the budget is known."""
+    search = SearchState()
+    refine_cars(filters, search)
+    return search
+
+def _pick_key(state):
+    return tuple(car.get("Model_Variant") for car in state.last_recommended_cars), tuple(state.user_info.items())
+
+def _pick(cars, user_info):
+    """(best car, its sales pitch) among a shortlist, or None."""
+    scored_cars = rank_cars(cars, user_info, k=1)
+    if not scored_cars:
+        return None
+    best_car = scored_cars[0][0]
+    return best_car, generate_sales_pitch(best_car, comparison=True)
+
+def _shortlist(state, filters):
+    """List the best few cars matching filters and remember them, or None."""
+    set_branch("db")
+    # Rank the whole candidate set, then show the best few; follow-up
+    # searches narrow the session's previous candidates
+    cars = [car for car, _ in rank_cars(refine_cars(filters, state.search), state.user_info, k=MAX_LISTED_CARS)]
+    if not cars:
+        return None
+    state.last_recommended_cars = cars
+    annotate(cars=[car.get("Model_Variant") for car in cars])
+    # "Which one is best?" usually follows: pick and pitch it in the background
+    prefetcher.schedule(state.session_id, "pick", _pick_key(state), _pick, cars, dict(state.user_info))
+    response = "🌟 Based on your needs, I recommend these models:\n"
+    for car in cars:
+        response += f"- {car['Model']} | {car['Fuel_Type']} | {car['Seating_Capacity']} seats | {car.get('ARAI_Certified_Mileage', 'N/A')} | ₹{car['Ex-Showroom_Price_Value']:,}\n"
+    response += "\nWould you like me to suggest the best option from these?"
+    return response
+
+def _intent_reply(state, intent, user_message):
+    """Reply for a confidently classified turn the rules missed, or None for the LLM."""
+    if intent == "smalltalk":
+        return SMALLTALK_REPLY
+    if intent == "model_info":
+        # resolve_car found no model in the message
+        return None if _REFERENCE_RE.search(user_message.lower()) else MODEL_PROMPT_REPLY
+    if intent == "search":
+        entities = extract_entities(user_message)
+        overrides = {_ENTITY_FILTERS[key]: value for key, value in entities.items() if key in _ENTITY_FILTERS}
+        if not overrides:
+            return None
+        filters = _profile_filters(state.user_info) if all(state.user_info.values()) else {}
+        if "family_size" in overrides:
+            filters.pop("seats", None)
+        filters.update(overrides)
+        return _shortlist(state, filters)
+    # Comparisons without two known cars, dealer questions and recommendations
+    # without a shortlist need the LLM
+    return None
 
-        chat_history.append({"role": "assistant", "content": bot_reply})
-        return bot_reply
+def _cached_llm_reply(state, user_message):
+    """Serve a repeated question from llm_cache; returns (key, reply or MISSING)."""
+    key = llm_cache_key(user_message, state.history)
+    reply = llm_cache.get(key)
+    if reply is not MISSING:
+        set_branch("cache")
+        state.history.append({"role": "user", "content": user_message})
+        state.history.append({"role": "assistant", "content": reply})
+    return key, reply
+
+def _llm_messages(state):
+    """Token-budgeted prompt: system prefix, recap, recent turns and grounding."""
+    grounding = grounding_message(state.history[-1]["content"]) if state.history else None
+    return prompt_context.build(state.history, state.user_info, grounding)
+
+def _finish_llm_reply(state, bot_reply, cache_key):
+    set_branch("llm")
+    if is_hallucination_response(bot_reply) or is_off_topic(bot_reply):
+        state.history.append({"role": "assistant", "content": OFF_TOPIC_REPLY})
+        return OFF_TOPIC_REPLY
+    state.history.append({"role": "assistant", "content": bot_reply})
+    llm_cache.set(cache_key, bot_reply)
+    return bot_reply
+
+def _llm_reply(state, user_message):
+    cache_key, reply = _cached_llm_reply(state, user_message)
+    if reply is not MISSING:
+        return reply
+    try:
+        state.history.append({"role": "user", "content": user_message})
+        with stage("llm"):
+            response = _ollama().chat(
+                model=LLM_MODEL,
+                messages=_llm_messages(state),
+                options=LLM_OPTIONS
+            )
+        return _finish_llm_reply(state, response["message"]["content"], cache_key)
 
     except Exception:
-        return "I'm having trouble connecting. Please ask about Maruti Suzuki cars or visit our website."
+        set_branch("llm_error")
+        return LLM_ERROR_REPLY
+
+async def astream_chat_with_phi(user_message, session_id=DEFAULT_SESSION_ID):
+    """
+    Async generator of (kind, text) events for one turn. Rule-based replies
+    are a single ("token", reply). LLM replies stream token by token; if the
+    stream turns off-topic it is cut off with ("replace", OFF_TOPIC_REPLY),
+    telling the client to discard the partial text.
+    """
+    with turn():
+        annotate(session=session_id, message=user_message)
+        state = await _run_in_db(_load_session, session_id)
+        try:
+            reply = await _run_in_db(_timed_rule_based_reply, state, user_message)
+            if reply is not None:
+                yield "token", reply
+                return
+            async for event in _astream_llm_reply(state, user_message):
+                yield event
+        finally:
+            await _run_in_db(_save_session, state)
+
+async def _astream_llm_reply(state, user_message):
+    cache_key, reply = _cached_llm_reply(state, user_message)
+    if reply is not MISSING:
+        yield "token", reply
+        return
+    state.history.append({"role": "user", "content": user_message})
+    guard = StreamGuard()
+    parts = []
+    loop = asyncio.get_running_loop()
+    try:
+        async with scheduler.slot() as deadline:
+            with stage("llm_stream"):
+                stream = await asyncio.wait_for(
+                    _get_async_client().chat(
+                        model=LLM_MODEL,
+                        messages=_llm_messages(state),
+                        options=LLM_OPTIONS,
+                        stream=True
+                    ),
+                    timeout=deadline - loop.time()
+                )
+                stream = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout=deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    token = chunk["message"]["content"]
+                    if not token:
+                        continue
+                    parts.append(token)
+                    if guard.feed(token):
+                        await stream.aclose()
+                        # The cut reply is never stored; the turn the user saw is
+                        state.history.append({"role": "assistant", "content": OFF_TOPIC_REPLY})
+                        yield "replace", OFF_TOPIC_REPLY
+                        return
+                    yield "token", token
+    except SchedulerOverloaded:
+        set_branch("shed")
+        state.history.pop()
+        yield "token", OVERLOAD_REPLY
+        return
+    except Exception:
+        set_branch("llm_error")
+        state.history.pop()
+        yield ("replace" if parts else "token"), LLM_ERROR_REPLY
+        return
+
+    set_branch("llm")
+    bot_reply = "".join(parts)
+    state.history.append({"role": "assistant", "content": bot_reply})
+    llm_cache.set(cache_key, bot_reply)
+
+async def _allm_reply(state, user_message):
+    cache_key, reply = _cached_llm_reply(state, user_message)
+    if reply is not MISSING:
+        return reply
+    try:
+        state.history.append({"role": "user", "content": user_message})
+        messages = _llm_messages(state)
+        with stage("llm"):
+            response = await scheduler.submit(
+                lambda: _get_async_client().chat(model=LLM_MODEL, messages=messages, options=LLM_OPTIONS),
+                key=prompt_key(LLM_MODEL, messages, LLM_OPTIONS)
+            )
+        return _finish_llm_reply(state, response["message"]["content"], cache_key)
+
+    except SchedulerOverloaded:
+        # Shed turns leave no trace in the history or the cache
+        set_branch("shed")
+        state.history.pop()
+        return OVERLOAD_REPLY
+    except Exception:
+        set_branch("llm_error")
+        return LLM_ERROR_REPLY
 
 # === Reset Conversation ===
-def reset_conversation():
-    global chat_history, user_info, last_recommended_cars
-    chat_history = context.copy()
-    user_info = {k: None for k in user_info}
-    last_recommended_cars = []
+def reset_conversation(session_id=DEFAULT_SESSION_ID):
+    state = sessions.get(session_id)
+    state.reset()
+    prefetcher.cancel(session_id)
+    sessions.save(state)
 
 # Explicitly expose
-__all__ = ['chat_with_phi', 'generate_sales_pitch', 'user_info', 'reset_conversation']
\ No newline at end of file
+__all__ = ['chat_with_phi', 'achat_with_phi', 'astream_chat_with_phi', 'generate_sales_pitch', 'reset_conversation', 'DEFAULT_SESSION_ID']
\ No newline at end of file
@@ -1,13 +1,22 @@
-from entity_extractor_manager import extract_entities
-from llm_handler import chat_with_phi, generate_sales_pitch, user_info, reset_conversation
-from car_database import search_cars, get_car_by_name
-import re
+from entity_extractor_manager import extract_entities, scan
+from intent_classifier import classify
+from llm_handler import chat_with_phi, generate_sales_pitch, reset_conversation
+from car_database import refine_ids, search_page
+from comparison import comparison_answer
+from name_resolver import resolve_car
+from ranking import VALUE_WEIGHTS, rank_cars
+from search_state import SearchState
 
 print("🚗 Welcome to Maruti Suzuki! I'm your personal car assistant.")
 
 context = {}
 last_mentioned_car = None
-last_search_results = []  # To store last search results for recommendations
+last_search_results = []  # Cars listed so far, for recommendations and comparisons
+search = SearchState()  # Narrowed turn by turn while constraints only tighten
+# Cars listed per page, cheapest first; "more" shows the next page
+PAGE_SIZE = 10
+page_filters = page_ids = None
+next_cursor = None
 
 def normalize_context(ctx):
     normalized = {}
@@ -34,49 +43,28 @@ def normalize_context(ctx):
 
     return normalized
 
-# Car model names (customizable based on your database)
-possible_models = [
-    "Dzire Tour", "Dzire", "Baleno", "Swift", "Alto", "Wagon R",
-    "Brezza", "Fronx", "Eeco"
-]
-
-# Phrases that trigger a recommendation
-RECOMMENDATION_TRIGGERS = [
-    "which one", "recommend", "best", "suggest", "good one",
-    "value", "better", "better option", "which is good",
-    "top pick", "what should", "what would you", "choose",
-    "go with", "prefer", "opinion", "which car"
-]
-
-# Irrelevant topics to detect
-IRRELEVANT_TOPICS = [
-    "bike", "motorcycle", "scooter", "bicycle", 
-    "truck", "bus", "plane", "airplane",
-    "boat", "ship", "train", "helicopter", "smartphones", "cosmetics", "mobiles"
-]
-
-def is_recommendation_request(text):
-    text_lower = text.lower()
-    return any(trigger in text_lower for trigger in RECOMMENDATION_TRIGGERS)
-
-def is_irrelevant_topic(text):
-    text_lower = text.lower()
-    return any(topic in text_lower for topic in IRRELEVANT_TOPICS)
+def is_recommendation_request(text, intent):
+    """intent is classify(text): a confident intent overrides the keyword triggers."""
+    if intent:
+        return intent.name == "recommend"
+    return scan(text).has("recommendation_trigger")
+
+def is_irrelevant_topic(text, intent):
+    return scan(text).has("irrelevant_topic") or (intent is not None and intent.name == "off_topic")
 
 def get_best_recommendation(cars):
     """Simple recommendation logic based on price and mileage"""
-    if not cars:
-        return None
-
-    def score_car(car):
-        try:
-            mileage = float(re.findall(r"[\d.]+", car.get("ARAI_Certified_Mileage", "0"))[0])
-            price = float(car.get("Ex-Showroom_Price_Value", 0))
-            return mileage / price if price > 0 else 0
-        except:
-            return 0
-
-    return max(cars, key=score_car)
+    ranked = rank_cars(cars, weights=VALUE_WEIGHTS, k=1)
+    return ranked[0][0] if ranked else None
+
+def show_page(filters, ids, cursor=None):
+    """Print one page of the cars matching filters among ids, by price; returns (cars, next page's cursor)."""
+    cars, cursor = search_page(filters, sort="price", limit=PAGE_SIZE, cursor=cursor, ids=ids)
+    for car in cars:
+        mileage = car.get("ARAI_Certified_Mileage_Value", None)
+        mileage_display = f"{mileage} km/l" if isinstance(mileage, (int, float)) else "N/A km/l"
+        print(f"- {car['Model']} | {car['Fuel_Type']} | {car['Seating_Capacity']} seats | {mileage_display} | ₹{car['Ex-Showroom_Price']}")
+    return cars, cursor
 
 # Start the conversation loop
 while True:
@@ -85,13 +73,26 @@ while True:
         print("🤖 Bot: Thanks for visiting Maruti Suzuki! Have a wonderful day ahead! 👋")
         break
 
+    # Classified once per turn; every rule below routes on the same intent
+    intent = classify(user_input)
+
     # First check for irrelevant topics
-    if is_irrelevant_topic(user_input):
+    if is_irrelevant_topic(user_input, intent):
         print("🤖 Bot: I specialize in Maruti Suzuki cars. Please ask about our car models, features, or pricing!")
         continue
 
+    if next_cursor and user_input.lower() in ["more", "show more", "next"]:
+        print()
+        cars, next_cursor = show_page(page_filters, page_ids, next_cursor)
+        last_search_results += cars
+        if next_cursor:
+            print("\n🤖 Bot: Say \"more\" to see more options.\n")
+        else:
+            print("\n🤖 Bot: That's all of them! I can also recommend the best one for you.\n")
+        continue
+
     # Handle recommendation requests if we have previous search results
-    if last_search_results and is_recommendation_request(user_input):
+    if last_search_results and is_recommendation_request(user_input, intent):
         best_car = get_best_recommendation(last_search_results)
         if best_car:
             print(f"\n🤖 Bot: Based on your needs, I recommend the {best_car['Model']}:\n")
@@ -99,11 +100,18 @@ while True:
             print(f"🤖 Bot: {pitch}\n")
             continue
 
+    # Side-by-side questions ("swift vs baleno")
+    comparison = comparison_answer(user_input, intent.name if intent else None, last_search_results)
+    if comparison:
+        print(f"🤖 Bot: {comparison}\n")
+        continue
+
     # Step 1: Specific car model inquiry
-    matched_model = next((model for model in possible_models if model.lower() in user_input.lower()), None)
+    candidate = resolve_car(user_input)
+    matched_model = candidate.name if candidate else None
     if matched_model:
         if matched_model != last_mentioned_car:
-            car = get_car_by_name(matched_model)
+            car = candidate.doc
             if car:
                 print(f"\n🤖 Bot: Great choice! Let me tell you about the {car['Model']}:\n")
                 pitch = generate_sales_pitch(car)
@@ -128,15 +136,15 @@ while True:
     ])
 
     if has_min_criteria:
-        results = search_cars(normalized_context)
-        if results:
-            last_search_results = results  
-            print("\n🤖 Bot: Based on your preferences, here are some great Maruti Suzuki options:\n")
-            for car in results:
-                mileage = car.get("ARAI_Certified_Mileage_Value", None)
-                mileage_display = f"{mileage} km/l" if isinstance(mileage, (int, float)) else "N/A km/l"
-                print(f"- {car['Model']} | {car['Fuel_Type']} | {car['Seating_Capacity']} seats | {mileage_display} | ₹{car['Ex-Showroom_Price']}")
-            print("\n🤖 Bot: Anything more on your mind? I can also recommend the best one for you!\n")
+        ids = refine_ids(normalized_context, search)
+        if ids:
+            print(f"\n🤖 Bot: Based on your preferences, I found {len(ids)} great Maruti Suzuki options. Starting with the most affordable:\n")
+            page_filters, page_ids = normalized_context, ids
+            last_search_results, next_cursor = show_page(page_filters, page_ids)
+            if next_cursor:
+                print("\n🤖 Bot: Say \"more\" to see more options, or ask me to recommend the best one for you!\n")
+            else:
+                print("\n🤖 Bot: Anything more on your mind? I can also recommend the best one for you!\n")
             continue
         else:
             print("🤖 Bot: Hmm, I couldn't find a perfect match. You might want to adjust your preferences a bit like budget or fuel type.\n")
@@ -0,0 +1,241 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from car_database import catalog_manager
+from entity_extractor_manager import VOCABULARIES
+from telemetry import timed
+
+# Colloquial names -> catalog Model. Names are matched after normalization
+# (lowercase, punctuation removed), so "Wagon-R" and "wagon r" are the same.
+MODEL_ALIASES = {
+    "brezza": "Vitara Brezza",
+    "vitara": "Vitara Brezza",
+    "wagonr": "Wagon",
+    "wagon r": "Wagon",
+    "spresso": "S-Presso",
+    "scross": "S-Cross",
+    "xl 6": "Xl6",
+    "alto 800": "Alto 800 Tour",
+    "k10": "Alto K10",
+}
+
+# A query token may differ from a name token by this many edits, by length
+_FUZZY_DISTANCES = ((8, 2), (5, 1))
+# Shorter tokens only match through one swap of adjacent letters ("swfit"):
+# a single substitution or insertion there mostly lands on another English
+# word ("shift", "start", "press")
+_MIN_EDITED_LENGTH = 6
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+Candidate = namedtuple("Candidate", ["name", "kind", "score", "doc"])
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _max_distance(token):
+    for length, distance in _FUZZY_DISTANCES:
+        if len(token) >= length:
+            return distance
+    return 0
+
+
+def _is_typo_of(token, word, distance):
+    """
+    Whether a token within distance of word reads as a misspelling of it.
+    Typos keep the first letter ("across" is not "scross", "espresso" is
+    not "spresso"); short tokens must be a transposition of the word.
+    """
+    if token[0] != word[0]:
+        return False
+    if len(token) < _MIN_EDITED_LENGTH:
+        return distance == 1 and len(token) == len(word) and sorted(token) == sorted(word)
+    return True
+
+
+def keyword_words(vocabularies=VOCABULARIES):
+    """Words the entity extractor already reads as something other than a car."""
+    return frozenset(
+        token for slot in vocabularies.values() for keyword, _ in slot for token in tokenize(keyword)
+    )
+
+
+def edit_distance(a, b):
+    """Optimal string alignment distance (Levenshtein plus transpositions)."""
+    if a == b:
+        return 0
+    previous2, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cost = ca != cb
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class BKTree:
+    """Burkhard-Keller tree for nearest-word lookups under edit_distance."""
+
+    def __init__(self, words=()):
+        self._root = None
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        if self._root is None:
+            self._root = (word, {})
+            return
+        node = self._root
+        while True:
+            distance = edit_distance(word, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                return
+            node = child
+
+    def search(self, word, max_distance):
+        """All (distance, word) within max_distance of word."""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node_word, children = stack.pop()
+            distance = edit_distance(word, node_word)
+            if distance <= max_distance:
+                found.append((distance, node_word))
+            for d in range(distance - max_distance, distance + max_distance + 1):
+                child = children.get(d)
+                if child is not None:
+                    stack.append(child)
+        return found
+
+
+class NameIndex:
+    """
+    Resolves car names in free text against the catalog.
+
+    Model names, their joined spellings ("S-Presso" -> "spresso") and
+    aliases are split into tokens. Query tokens are matched exactly through
+    a dict, or within a small edit distance through a BK-tree, so typos
+    such as "swfit" or "breeza" still resolve; keyword_words are never
+    matched fuzzily. A model matches when all of
+    its tokens do; a variant of a matched model is preferred when the text
+    also names some of its variant tokens ("dzire zxi").
+    """
+
+    def __init__(self, documents, aliases=MODEL_ALIASES, common_words=None):
+        self.common_words = keyword_words() if common_words is None else common_words
+        self.models = {}      # model -> first catalog doc
+        self.spellings = []   # (model, tokens)
+        self.variants = {}    # model -> [(variant tokens, doc)]
+        for doc in documents:
+            model = doc.get("Model")
+            if not model:
+                continue
+            if model not in self.models:
+                self.models[model] = doc
+                tokens = tokenize(model)
+                self.spellings.append((model, tokens))
+                if len(tokens) > 1:
+                    self.spellings.append((model, ["".join(tokens)]))
+            variant_tokens = tokenize(doc.get("Variant", ""))
+            if variant_tokens:
+                self.variants.setdefault(model, []).append((variant_tokens, doc))
+        for alias, model in aliases.items():
+            if model in self.models:
+                self.spellings.append((model, tokenize(alias)))
+
+        self.vocabulary = {token for _, tokens in self.spellings for token in tokens}
+        self.vocabulary.update(
+            token for variants in self.variants.values() for tokens, _ in variants for token in tokens
+        )
+        self._tree = BKTree(sorted(self.vocabulary))
+        # token -> spelling ids containing it
+        self._postings = {}
+        for spelling_id, (_, tokens) in enumerate(self.spellings):
+            for token in set(tokens):
+                self._postings.setdefault(token, []).append(spelling_id)
+        self._match_token = lru_cache(maxsize=4096)(self._match_token_uncached)
+
+    def _match_token_uncached(self, token):
+        """Vocabulary tokens matching a query token, with a 0..1 quality."""
+        if token in self.vocabulary:
+            return ((token, 1.0),)
+        max_distance = _max_distance(token)
+        if not max_distance or token in self.common_words:
+            return ()
+        return tuple(
+            (word, 1.0 - distance / max(len(word), len(token)))
+            for distance, word in self._tree.search(token, max_distance)
+            if _is_typo_of(token, word, distance)
+        )
+
+    def resolve(self, text, limit=5, cutoff=0.75):
+        """
+        Ranked Candidates for the car names mentioned in text. A model needs
+        every token of one of its spellings matched, with a mean quality of
+        at least cutoff.
+        """
+        matched = {}
+        for token in tokenize(text):
+            for word, quality in self._match_token(token):
+                if quality > matched.get(word, 0.0):
+                    matched[word] = quality
+
+        # model -> (quality, tokens in the matched spelling)
+        model_matches = {}
+        for word in matched:
+            for spelling_id in self._postings.get(word, ()):
+                model, tokens = self.spellings[spelling_id]
+                qualities = [matched.get(token, 0.0) for token in tokens]
+                if min(qualities) == 0.0:
+                    continue
+                score = sum(qualities) / len(qualities)
+                if score >= cutoff and (score, len(tokens)) > model_matches.get(model, (0.0, 0)):
+                    model_matches[model] = (score, len(tokens))
+
+        ranked = []
+        for model, (score, length) in model_matches.items():
+            # Prefer higher quality, then more specific names, then fewer
+            # unmentioned variant tokens
+            ranked.append(((score, length, 0), Candidate(model, "model", round(score, 3), self.models[model])))
+            for variant_tokens, doc in self.variants.get(model, ()):
+                hits = sum(1 for token in variant_tokens if matched.get(token, 0.0) >= cutoff)
+                if hits:
+                    key = (score, length + hits, hits - len(variant_tokens))
+                    ranked.append((key, Candidate(doc["Model_Variant"], "variant", round(score, 3), doc)))
+
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        results, seen = [], set()
+        for _, candidate in ranked:
+            if candidate.name not in seen:
+                seen.add(candidate.name)
+                results.append(candidate)
+            if len(results) == limit:
+                break
+        return results
+
+
+catalog_manager.register_derived("names", lambda catalog: NameIndex(catalog.documents))
+
+
+def get_name_index():
+    """Name index of the live catalog snapshot, rebuilt before every swap."""
+    return catalog_manager.derived("names")
+
+
+@timed("resolve_name")
+def resolve_car(text, cutoff=0.75):
+    """Best Candidate mentioned in text, or None."""
+    candidates = get_name_index().resolve(text, limit=1, cutoff=cutoff)
+    return candidates[0] if candidates else None
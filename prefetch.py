@@ -0,0 +1,145 @@
+"""
+Speculative prefetch of the next dialogue step.
+
+The guided flow is predictable: once family size, fuel and car type are
+known the next turn is almost always the budget, and after the shortlist
+it is "which one is best?". A Prefetcher runs that next step's work on a
+background thread while the user is typing (the candidate set before the
+budget is known, then the pick from the shortlist and its sales pitch)
+and keeps the result in a per-session buffer. The turn takes the result
+when its key (the preferences it was computed for) still matches, and
+computes inline otherwise. A newer prefetch for the session, a reset or a
+catalog swap cancels the pending one.
+
+Buffers are process-local: with several workers a turn served by another
+worker simply misses.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from response_cache import MISSING
+from telemetry import untraced
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_THREADS = int(os.getenv("PREFETCH_THREADS", "2"))
+PREFETCH_MAX_SESSIONS = int(os.getenv("PREFETCH_MAX_SESSIONS", "10000"))
+# How long a turn waits for a prefetch that is already running
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", "0.05"))
+
+
+class Prefetcher:
+    """Background jobs with one result buffer per session, plus hit/miss counters."""
+
+    def __init__(self, enabled=PREFETCH_ENABLED, threads=PREFETCH_THREADS,
+                 max_sessions=PREFETCH_MAX_SESSIONS, wait_seconds=PREFETCH_WAIT_SECONDS):
+        self.enabled = enabled
+        self.threads = threads
+        self.max_sessions = max_sessions
+        self.wait_seconds = wait_seconds
+        self._executor = None
+        self._buffers = OrderedDict()  # session_id -> (kind, key, future)
+        self._lock = threading.Lock()
+        self.scheduled = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0      # misses whose prefetch was for other preferences
+        self.late = 0       # misses whose prefetch had not finished in time
+        self.cancelled = 0
+
+    def _pool(self):
+        # Started on first use, so no thread exists before workers fork
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="prefetch")
+        return self._executor
+
+    def _drop(self, session_id):
+        entry = self._buffers.pop(session_id, None)
+        if entry is not None and entry[2].cancel():
+            self.cancelled += 1
+
+    def schedule(self, session_id, kind, key, func, *args):
+        """
+        Run func(*args) in the background as the session's next `kind` step
+        for key. Jobs run untraced: the turn that takes the result is timed.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._drop(session_id)
+            self._buffers[session_id] = (kind, key, self._pool().submit(untraced, func, *args))
+            self.scheduled += 1
+            while len(self._buffers) > self.max_sessions:
+                self._drop(next(iter(self._buffers)))
+
+    def take(self, session_id, kind, key):
+        """
+        The session's prefetched `kind` result if it was computed for key,
+        else MISSING. A job still running gets wait_seconds to finish.
+        """
+        if not self.enabled:
+            return MISSING
+        with self._lock:
+            entry = self._buffers.get(session_id)
+            if entry is None or entry[0] != kind:
+                self.misses += 1
+                return MISSING
+            del self._buffers[session_id]
+            if entry[1] != key:
+                self.misses += 1
+                self.stale += 1
+                if entry[2].cancel():
+                    self.cancelled += 1
+                return MISSING
+        future = entry[2]
+        try:
+            result = future.result(timeout=self.wait_seconds)
+        except TimeoutError:
+            future.cancel()
+            with self._lock:
+                self.misses += 1
+                self.late += 1
+            return MISSING
+        except Exception as e:
+            print(f"Prefetch failed: {e}")
+            with self._lock:
+                self.misses += 1
+            return MISSING
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def cancel(self, session_id):
+        """Forget the session's pending prefetch, e.g. when its preferences are reset."""
+        with self._lock:
+            self._drop(session_id)
+
+    def clear(self):
+        """Forget every prefetch, e.g. after a catalog swap."""
+        with self._lock:
+            for session_id in list(self._buffers):
+                self._drop(session_id)
+
+    def shutdown(self):
+        self.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "pending": len(self._buffers),
+            "scheduled": self.scheduled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "late": self.late,
+            "cancelled": self.cancelled,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+prefetcher = Prefetcher()
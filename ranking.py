@@ -0,0 +1,155 @@
+import numpy as np
+
+from catalog_ingest import numeric_value
+from telemetry import timed
+
+# Weights reproducing llm_handler's original per-car score:
+# budget closeness + seat fit + 2 x mileage + price in lakh
+RECOMMENDATION_WEIGHTS = {"budget_fit": 1.0, "seat_fit": 1.0, "mileage": 2.0, "price": 1.0}
+
+# main.py's "best value" pick: mileage per rupee
+VALUE_WEIGHTS = {"value": 1.0}
+
+FEATURES = {}
+
+
+def register_feature(name):
+    """
+    Register a scoring feature. A feature takes (columns, prefs) and returns
+    one float per car; NaN inputs must score 0 rather than propagate.
+    Preference values may also be (m, 1) arrays, one row per lead (NaN where
+    a lead has no value), in which case the result broadcasts to (m, cars).
+    """
+    def decorator(func):
+        FEATURES[name] = func
+        return func
+    return decorator
+
+
+class CarColumns:
+    """Numeric columns of a candidate set, in the order of `cars`."""
+
+    __slots__ = ("cars", "price", "seats", "mileage", "power")
+
+    def __init__(self, cars):
+        self.cars = cars
+        self.price = self._column(cars, "Ex-Showroom_Price_Value")
+        self.mileage = self._column(cars, "ARAI_Certified_Mileage_Value")
+        self.power = self._column(cars, "Power_Value")
+        self.seats = np.array(
+            [car.get("Seating_Capacity") if isinstance(car.get("Seating_Capacity"), (int, float)) else np.nan
+             for car in cars],
+            dtype=np.float64,
+        )
+
+    @staticmethod
+    def _column(cars, field):
+        values = [numeric_value(car, field) for car in cars]
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+@register_feature("budget_fit")
+def budget_fit(columns, prefs):
+    budget = prefs.get("budget")
+    if budget is None or np.ndim(budget) == 0 and not budget:
+        return np.zeros(len(columns.cars))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        closeness = 100 - np.abs(budget - columns.price) / budget * 100
+    # Rows without a budget score 0, like a missing scalar budget
+    return np.nan_to_num(np.where(np.asarray(budget) > 0, np.maximum(closeness, 0), 0.0), nan=0.0)
+
+
+@register_feature("seat_fit")
+def seat_fit(columns, prefs):
+    family_size = prefs.get("family_size")
+    if family_size is None or np.ndim(family_size) == 0 and not family_size:
+        return np.zeros(len(columns.cars))
+    with np.errstate(invalid="ignore"):
+        fit = np.where(columns.seats >= family_size, 50.0, -100.0)
+    fit = np.where(np.isnan(columns.seats), 0.0, fit)
+    return np.where(np.asarray(family_size) > 0, fit, 0.0)
+
+
+@register_feature("mileage")
+def mileage(columns, prefs):
+    return np.nan_to_num(columns.mileage, nan=0.0)
+
+
+@register_feature("price")
+def price(columns, prefs):
+    return np.nan_to_num(columns.price / 100000, nan=0.0)
+
+
+@register_feature("power")
+def power(columns, prefs):
+    return np.nan_to_num(columns.power, nan=0.0)
+
+
+@register_feature("value")
+def value(columns, prefs):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(columns.price > 0, columns.mileage / columns.price, 0.0)
+    return np.nan_to_num(ratio, nan=0.0)
+
+
+def score_cars(columns, prefs, weights):
+    """Weighted sum of the registered features, one score per car."""
+    scores = np.zeros(len(columns.cars))
+    for name, weight in weights.items():
+        if weight:
+            scores += weight * FEATURES[name](columns, prefs)
+    return scores
+
+
+def score_batch(columns, prefs, weights):
+    """
+    score_cars for many leads at once: prefs maps each preference to an
+    (m, 1) array and the result is an (m, cars) score matrix.
+    """
+    rows = max((len(value) for value in prefs.values()), default=1)
+    scores = np.zeros((rows, len(columns.cars)))
+    for name, weight in weights.items():
+        if weight:
+            scores += weight * FEATURES[name](columns, prefs)
+    return scores
+
+
+def top_k_batch(scores, mask, k):
+    """
+    Per row, column indices of the k best scores among the masked cars,
+    best first, ties in column order (as top_k over that row's candidates).
+    Rows with fewer than k candidates are padded with -1.
+    """
+    ranked = np.argsort(-np.where(mask, scores, -np.inf), axis=1, kind="stable")[:, :k]
+    return np.where(np.take_along_axis(mask, ranked, axis=1), ranked, -1)
+
+
+def top_k(scores, k=None):
+    """
+    Indices of the k best scores, best first. Ties keep input order, so the
+    result matches a stable sort (and max() for k=1).
+    """
+    n = len(scores)
+    if k is None or k >= n:
+        candidates = np.arange(n)
+    else:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        # argpartition does not keep input order among tied scores at the
+        # boundary; widen to every car tied with the k-th score
+        kth = scores[candidates].min()
+        candidates = np.union1d(candidates[scores[candidates] > kth], np.flatnonzero(scores == kth))
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:k]
+
+
+@timed("rank")
+def rank_cars(cars, prefs=None, weights=RECOMMENDATION_WEIGHTS, k=None):
+    """
+    Score every car in one vectorized pass and return the top k as
+    (car, score) pairs, best first.
+    """
+    if not cars:
+        return []
+    columns = CarColumns(cars)
+    scores = score_cars(columns, prefs or {}, weights)
+    return [(cars[i], float(scores[i])) for i in top_k(scores, k)]
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "3600"))
+PITCH_CACHE_SIZE = int(os.getenv("PITCH_CACHE_SIZE", "1024"))
+PITCH_CACHE_TTL = int(os.getenv("PITCH_CACHE_TTL", "86400"))
+
+# Number of prior history messages that make an LLM reply context-dependent
+LLM_CACHE_HISTORY_WINDOW = int(os.getenv("LLM_CACHE_HISTORY_WINDOW", "4"))
+
+MISSING = object()
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value, or MISSING."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return MISSING
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+llm_cache = LRUCache(LLM_CACHE_SIZE, LLM_CACHE_TTL)
+pitch_cache = LRUCache(PITCH_CACHE_SIZE, PITCH_CACHE_TTL)
+
+
+def normalize_message(text: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace."""
+    text = _PUNCTUATION_RE.sub(" ", text.lower())
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def llm_cache_key(user_message: str, history) -> str:
+    """
+    Key an LLM reply on the normalized message and a hash of the history
+    window that precedes it, so the same question in a different
+    conversation context is not served a stale answer.
+    """
+    window = list(history)[-LLM_CACHE_HISTORY_WINDOW:] if LLM_CACHE_HISTORY_WINDOW else []
+    digest = hashlib.blake2b(
+        json.dumps(window, sort_keys=True, ensure_ascii=False).encode("utf-8"),
+        digest_size=16,
+    ).hexdigest()
+    return f"{normalize_message(user_message)}|{digest}"
+
+
+def pitch_cache_key(car: dict, comparison: bool):
+    car_id = car.get("_id")
+    if car_id is None:
+        car_id = car.get("Model_Variant") or car.get("Model")
+    return (str(car_id), bool(comparison))
+
+
+def invalidate_all():
+    """Drop every cached reply and pitch, e.g. after a catalog reload."""
+    llm_cache.clear()
+    pitch_cache.clear()
+
+
+def cache_stats():
+    return {"llm": llm_cache.stats(), "pitch": pitch_cache.stats()}
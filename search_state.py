@@ -0,0 +1,87 @@
+"""
+Per-session search state for incremental refinement.
+
+A conversation mostly tightens its constraints one slot at a time ("SUV",
+then "diesel", then "under 12 lakh"). SearchState keeps the filters of the
+session's last search and the ids of the cars that matched them, so a
+follow-up search that only narrows those filters is evaluated against the
+surviving candidates instead of the whole catalog (see
+car_database.refine_cars). Relaxing or changing a constraint, or a catalog
+swap, starts over from the full catalog.
+"""
+from car_catalog import min_seats
+
+# Bounds a narrower search may only raise (lower bounds) or lower (upper bounds)
+LOWER_BOUNDS = ("budget_min", "min_mileage")
+UPPER_BOUNDS = ("budget_max", "max_mileage")
+SEAT_KEYS = ("seats", "family_size")
+
+
+def narrows(previous: dict, filters: dict) -> bool:
+    """
+    True when every car matching filters also matches previous: each
+    earlier constraint is kept or tightened; new constraints may be added.
+    Categorical filters are regexes, so only an identical one counts as kept.
+    """
+    for key, value in previous.items():
+        if key in SEAT_KEYS:
+            continue
+        if key not in filters:
+            return False
+        new = filters[key]
+        if key in LOWER_BOUNDS:
+            kept = new >= value
+        elif key in UPPER_BOUNDS:
+            kept = new <= value
+        else:
+            kept = new == value
+        if not kept:
+            return False
+
+    previous_seats = min_seats(previous)
+    if previous_seats is None:
+        return True
+    seats = min_seats(filters)
+    return seats is not None and seats >= previous_seats
+
+
+class SearchState:
+    """
+    Filters of a session's last search and the ids of its results. ids are
+    catalog row ids with the in-memory backend and document _ids with
+    MongoDB; fingerprint is the content fingerprint of the catalog they
+    belong to (None with MongoDB while no snapshot is loaded). Sessions can move between workers, and each worker numbers
+    its snapshot versions on its own, so only the fingerprint identifies
+    the same catalog everywhere.
+    """
+
+    __slots__ = ("filters", "ids", "fingerprint")
+
+    def __init__(self, filters=None, ids=None, fingerprint=None):
+        self.filters = filters
+        self.ids = ids
+        self.fingerprint = fingerprint
+
+    def can_narrow(self, filters: dict, fingerprint) -> bool:
+        """True when filters can be evaluated on the cached ids alone."""
+        return (
+            self.filters is not None and self.fingerprint == fingerprint
+            and narrows(self.filters, filters)
+        )
+
+    def update(self, filters: dict, ids, fingerprint):
+        self.filters = dict(filters)
+        self.ids = list(ids)
+        self.fingerprint = fingerprint
+
+    def clear(self):
+        self.filters = self.ids = self.fingerprint = None
+
+    def to_dict(self):
+        return {"filters": self.filters, "ids": self.ids, "fingerprint": self.fingerprint}
+
+    @classmethod
+    def from_dict(cls, data):
+        # States saved before fingerprints have none and start over
+        data = data or {}
+        return cls(data.get("filters"), data.get("ids"), data.get("fingerprint"))
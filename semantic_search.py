@@ -0,0 +1,391 @@
+"""
+Semantic retrieval over variant spec sheets.
+
+Each variant in dataset.json is rendered as a short spec sheet and embedded
+offline into a float32 matrix, which the service memory-maps at
+query time. Free-text questions ("quiet car with big boot for highway
+trips") are answered from the top matches, or the matches are handed to
+the LLM as compact grounding context. Every catalog snapshot gets its own
+copy of the index: sheets whose text changed since the build are embedded
+again at swap time, and replies quote the live snapshot's summaries.
+
+    python semantic_search.py build
+
+Embeddings come from a local sentence-transformers model when that package
+and SEMANTIC_MODEL are available, otherwise from a keyword-coverage
+embedder that needs nothing beyond NumPy. Its score thresholds are
+calibrated by benchmarks/semantic_calibration.py; re-run it (with --model)
+before changing either. At catalog scale a flat inner product over
+the mmapped matrix takes microseconds, so no ANN structure is built.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from car_database import catalog_manager
+from catalog_ingest import load_dataset
+from telemetry import stage
+
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "semantic_index")
+INDEX_VERSION = 3
+
+SEMANTIC_MODEL = os.getenv("SEMANTIC_MODEL", "")
+SEMANTIC_TOP_K = int(os.getenv("SEMANTIC_TOP_K", "3"))
+# Scores at which a match is answered directly / used as LLM context. The
+# defaults suit the keyword embedder (share of the query matched); a
+# sentence model's cosine scores need their own calibration.
+SEMANTIC_ANSWER_SCORE = float(os.getenv("SEMANTIC_ANSWER_SCORE", "0.6"))
+SEMANTIC_CONTEXT_SCORE = float(os.getenv("SEMANTIC_CONTEXT_SCORE", "0.4"))
+# Content words a message needs to be answered directly: a lone "petrol" or
+# "we are 4 people" is a guided-flow answer, not a description
+SEMANTIC_MIN_WORDS = 2
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset(
+    "a about an and any are as at be by can car cars could do does for from get give good how i in is it "
+    "me my need of on or our please show some tell that the this to want we what when where which who "
+    "why will with would you".split()
+)
+
+# Spec fields rendered into each variant's sheet
+SPEC_FIELDS = [
+    "Body_Type", "Fuel_Type", "Type", "Drivetrain", "Seating_Capacity", "ARAI_Certified_Mileage",
+    "Boot_Space", "Power", "Torque", "Ground_Clearance", "Ex-Showroom_Price", "Airbags",
+    "Drive_Modes", "Audiosystem", "Parking_Assistance", "Other_specs",
+]
+
+
+def _tags(doc):
+    """Plain-language tags derived from typed fields, bridging user vocabulary."""
+    tags = []
+    boot = doc.get("Boot_Space_Value")
+    if boot and boot >= 350:
+        tags.append("big boot spacious luggage space long trips")
+    elif boot and boot < 250:
+        tags.append("small boot compact")
+    seats = doc.get("Seating_Capacity") or 0
+    if seats >= 7:
+        tags.append("7 seater large family people mover")
+    mileage = doc.get("ARAI_Certified_Mileage_Value")
+    if mileage and mileage >= 23:
+        tags.append("high mileage fuel efficient economical low running cost")
+    power = doc.get("Power_Value")
+    if power and power >= 95:
+        tags.append("powerful engine highway cruising overtaking")
+    clearance = doc.get("Ground_Clearance_Value")
+    if clearance and clearance >= 180:
+        tags.append("high ground clearance rough roads")
+    if str(doc.get("Type", "")).lower() in ("automatic", "amt"):
+        tags.append("automatic gearbox easy city traffic")
+    price = doc.get("Ex-Showroom_Price_Value")
+    if price and price <= 500000:
+        tags.append("budget affordable cheap entry level")
+    elif price and price >= 1000000:
+        tags.append("premium top end")
+    return tags
+
+
+def spec_text(doc):
+    """Compact spec sheet for one variant."""
+    parts = [doc.get("Model_Variant", "")]
+    for field in SPEC_FIELDS:
+        value = doc.get(field)
+        if value not in (None, "", "Not on offer"):
+            parts.append(f"{field.replace('_', ' ').lower()} {value}")
+    parts.extend(_tags(doc))
+    return ". ".join(str(p) for p in parts)
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def summary(doc):
+    """One-line spec summary used in replies and as LLM grounding."""
+    details = [doc.get("Body_Type"), doc.get("Fuel_Type"), doc.get("Type")]
+    if doc.get("Seating_Capacity"):
+        details.append(f"{doc['Seating_Capacity']} seats")
+    for label, field in (("mileage", "ARAI_Certified_Mileage"), ("boot", "Boot_Space"), ("power", "Power")):
+        if doc.get(field):
+            details.append(f"{label} {doc[field]}")
+    price = doc.get("Ex-Showroom_Price_Value")
+    if price:
+        details.append(f"₹{int(price):,}")
+    return f"{doc.get('Model_Variant', '')}: " + ", ".join(str(d) for d in details if d)
+
+
+def _words(text):
+    return [
+        w[:-1] if len(w) > 3 and w.endswith("s") else w
+        for w in _WORD_RE.findall(text.lower()) if w not in _STOP_WORDS
+    ]
+
+
+class KeywordEmbedder:
+    """
+    Unigram+bigram features over the spec sheets' own vocabulary. Sheets
+    embed as feature presence and queries as IDF weights summing to 1, so a
+    score is the IDF-weighted share of the query's features that a sheet
+    contains (cosine would let long sheets drown short queries). Features
+    no sheet contains say nothing about which car fits; they weigh like the
+    most common ones, so an off-topic question scores near 0.
+    """
+
+    name = "keyword-coverage"
+
+    def __init__(self, vocabulary=(), idf=None):
+        self.vocabulary = {feature: column for column, feature in enumerate(vocabulary)}
+        self.idf = idf if idf is not None else np.ones(len(self.vocabulary), dtype=np.float32)
+
+    @staticmethod
+    def _features(text):
+        # Bare numbers only count within a bigram ("7 seater")
+        words = _words(text)
+        return {w for w in words if not w.isdigit()} | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+    def fit(self, texts):
+        document_frequency = {}
+        for text in texts:
+            for feature in self._features(text):
+                document_frequency[feature] = document_frequency.get(feature, 0) + 1
+        self.vocabulary = {feature: column for column, feature in enumerate(sorted(document_frequency))}
+        frequency = np.array([document_frequency[feature] for feature in self.vocabulary], dtype=np.float32)
+        self.idf = (np.log((1 + len(texts)) / (1 + frequency)) + 1.0).astype(np.float32)
+        return self
+
+    def embed_documents(self, texts):
+        matrix = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            columns = [self.vocabulary[f] for f in self._features(text) if f in self.vocabulary]
+            matrix[row, columns] = 1.0
+        return matrix
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            columns = [self.vocabulary[f] for f in features if f in self.vocabulary]
+            matrix[row, columns] = self.idf[columns]
+            # Unknown features weigh 1, like the commonest known ones
+            total = matrix[row].sum() + (len(features) - len(columns))
+            if total:
+                matrix[row] /= total
+        return matrix
+
+
+class SentenceTransformerEmbedder:
+    """Local CPU sentence-transformers model (optional dependency)."""
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model_name
+        self._model = SentenceTransformer(model_name, device="cpu")
+
+    def fit(self, texts):
+        return self
+
+    def embed(self, texts):
+        return _normalize(np.asarray(self._model.encode(list(texts)), dtype=np.float32))
+
+    embed_documents = embed
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return (matrix / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+
+def create_embedder(name=SEMANTIC_MODEL):
+    if name and name != KeywordEmbedder.name:
+        try:
+            return SentenceTransformerEmbedder(name)
+        except ImportError:
+            pass
+    return KeywordEmbedder()
+
+
+def build_index(docs, path=INDEX_PATH, embedder=None):
+    """Embed every variant and write <path>.npy, <path>.meta.json (and idf)."""
+    embedder = embedder or create_embedder()
+    texts = [spec_text(doc) for doc in docs]
+    embedder.fit(texts)
+    matrix = embedder.embed_documents(texts)
+    np.save(path + ".npy", matrix, allow_pickle=False)
+    if isinstance(embedder, KeywordEmbedder):
+        np.save(path + ".idf.npy", embedder.idf, allow_pickle=False)
+    meta = {
+        "version": INDEX_VERSION,
+        "embedder": embedder.name,
+        "vocabulary": list(getattr(embedder, "vocabulary", ())),
+        "ids": [doc["Model_Variant"] for doc in docs],
+        "models": [doc.get("Model", "") for doc in docs],
+        "summaries": [summary(doc) for doc in docs],
+        "digests": [_digest(text) for text in texts],
+    }
+    with open(path + ".meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return matrix
+
+
+Match = namedtuple("Match", ["name", "model", "score", "summary"])
+
+
+class SemanticIndex:
+    """Memory-mapped variant embeddings with a top-k inner-product search."""
+
+    def __init__(self, ids, models, summaries, digests, matrix, embedder):
+        self.ids = ids
+        self.models = models
+        self.summaries = summaries
+        self.digests = digests
+        self.matrix = matrix
+        self.embedder = embedder
+        self.search = lru_cache(maxsize=1024)(self._search)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        with open(path + ".meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError("Semantic index version mismatch; re-run semantic_search.py build")
+        if meta["embedder"] == KeywordEmbedder.name:
+            embedder = KeywordEmbedder(meta["vocabulary"], np.load(path + ".idf.npy"))
+        else:
+            embedder = SentenceTransformerEmbedder(meta["embedder"])
+        return cls(meta["ids"], meta["models"], meta["summaries"], meta["digests"],
+                   np.load(path + ".npy", mmap_mode="r"), embedder)
+
+    def updated(self, docs):
+        """
+        This index over another catalog version. Rows whose spec sheet is
+        unchanged are reused and the rest are embedded now with the built
+        embedder (rebuild the index to refit its vocabulary).
+        """
+        texts = [spec_text(doc) for doc in docs]
+        digests = [_digest(text) for text in texts]
+        if digests == self.digests:
+            matrix = self.matrix
+        else:
+            rows = {digest: row for row, digest in enumerate(self.digests)}
+            changed = [i for i, digest in enumerate(digests) if digest not in rows]
+            matrix = np.zeros((len(docs), self.matrix.shape[1]), dtype=np.float32)
+            for i, digest in enumerate(digests):
+                if digest in rows:
+                    matrix[i] = self.matrix[rows[digest]]
+            if changed:
+                matrix[changed] = self.embedder.embed_documents([texts[i] for i in changed])
+        return SemanticIndex(
+            [doc.get("Model_Variant", "") for doc in docs], [doc.get("Model", "") for doc in docs],
+            [summary(doc) for doc in docs], digests, matrix, self.embedder,
+        )
+
+    def _search(self, query, k=SEMANTIC_TOP_K):
+        """Matches for the k closest variants, best first."""
+        vector = self.embedder.embed([query])[0]
+        scores = self.matrix @ vector
+        k = min(k, len(scores))
+        if k <= 0:
+            return ()
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return tuple(Match(self.ids[i], self.models[i], float(scores[i]), self.summaries[i]) for i in best)
+
+
+_prebuilt = None
+
+
+def _prebuilt_index(path=INDEX_PATH):
+    """The index as built offline, or None when it has not been built."""
+    global _prebuilt
+    if _prebuilt is None and os.path.exists(path + ".meta.json"):
+        _prebuilt = SemanticIndex.load(path)
+    return _prebuilt
+
+
+def _build_for(catalog):
+    prebuilt = _prebuilt_index()
+    return prebuilt.updated(catalog.documents) if prebuilt is not None else None
+
+
+catalog_manager.register_derived("semantic", _build_for)
+
+
+def get_semantic_index():
+    """Semantic index of the live catalog snapshot, or None when it has not been built."""
+    return catalog_manager.derived("semantic")
+
+
+def semantic_matches(text, k=SEMANTIC_TOP_K, min_score=SEMANTIC_CONTEXT_SCORE):
+    """Up to k Matches scoring at least min_score; empty without an index."""
+    index = get_semantic_index()
+    if index is None:
+        return []
+    with stage("semantic_search"):
+        matches = index.search(text.lower(), k)
+    return [match for match in matches if match.score >= min_score]
+
+
+def answerable(text):
+    """Whether text describes enough to be answered from the index alone."""
+    return len({word for word in _words(text) if not word.isdigit()}) >= SEMANTIC_MIN_WORDS
+
+
+def semantic_answer(text):
+    """
+    Reply listing the closest models when the best match is confident
+    enough to skip the LLM, otherwise None.
+    """
+    if not answerable(text):
+        return None
+    matches = semantic_matches(text, k=SEMANTIC_TOP_K * 4)
+    if not matches or matches[0].score < SEMANTIC_ANSWER_SCORE:
+        return None
+    lines, seen = [], set()
+    for match in matches:
+        if match.model not in seen:
+            seen.add(match.model)
+            lines.append(f"- {match.summary}")
+        if len(lines) == SEMANTIC_TOP_K:
+            break
+    return "These models match what you're looking for:\n" + "\n".join(lines) + \
+        "\n\nWould you like more details on any of them?"
+
+
+def grounding_message(text):
+    """System message with the closest spec summaries, or None."""
+    matches = semantic_matches(text)
+    if not matches:
+        return None
+    return {
+        "role": "system",
+        "content": "Relevant catalog entries (quote only these facts):\n"
+                   + "\n".join(f"- {match.summary}" for match in matches),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the semantic spec-sheet index")
+    parser.add_argument("command", choices=["build", "query"])
+    parser.add_argument("text", nargs="?", default="")
+    parser.add_argument("--dataset", default=None)
+    parser.add_argument("--index", default=INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        docs = load_dataset(args.dataset) if args.dataset else load_dataset()
+        matrix = build_index(docs, args.index)
+        print(f"Embedded {matrix.shape[0]} variants ({matrix.shape[1]} dims) into {args.index}.npy")
+    else:
+        for match in SemanticIndex.load(args.index).search(args.text.lower(), 5):
+            print(f"{match.score:.3f}  {match.summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from search_state import SearchState
+
+# Messages kept per session for the LLM fallback (system prompt excluded)
+MAX_HISTORY_MESSAGES = int(os.getenv("CHAT_MAX_HISTORY", "20"))
+SESSION_TTL_SECONDS = int(os.getenv("CHAT_SESSION_TTL", "1800"))
+MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "50000"))
+
+USER_INFO_KEYS = ("family_size", "fuel_type", "car_type", "budget")
+
+# Fields kept when recommended cars leave the process (external backends)
+CAR_SUMMARY_FIELDS = (
+    "_id", "Model", "Variant", "Model_Variant", "Fuel_Type", "Body_Type", "Seating_Capacity",
+    "Ex-Showroom_Price", "Ex-Showroom_Price_Value",
+    "ARAI_Certified_Mileage", "ARAI_Certified_Mileage_Value",
+)
+
+
+class SessionState:
+    """Conversation state for a single chat session."""
+
+    __slots__ = ("session_id", "history", "user_info", "last_recommended_cars", "search", "last_seen")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.history = deque(maxlen=MAX_HISTORY_MESSAGES)
+        self.user_info = dict.fromkeys(USER_INFO_KEYS)
+        self.last_recommended_cars = []
+        # Last catalog search, narrowed by follow-up searches
+        self.search = SearchState()
+        self.last_seen = time.time()
+
+    def reset(self):
+        self.history.clear()
+        self.user_info = dict.fromkeys(USER_INFO_KEYS)
+        self.last_recommended_cars = []
+        self.search.clear()
+
+    def to_dict(self):
+        return {
+            "_id": self.session_id,
+            "history": list(self.history),
+            "user_info": self.user_info,
+            "last_recommended_cars": [
+                {k: str(car[k]) if k == "_id" else car[k] for k in CAR_SUMMARY_FIELDS if k in car}
+                for car in self.last_recommended_cars
+            ],
+            "search": self.search.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        state = cls(data["_id"])
+        state.history.extend(data.get("history", []))
+        state.user_info.update(data.get("user_info", {}))
+        state.last_recommended_cars = list(data.get("last_recommended_cars", []))
+        state.search = SearchState.from_dict(data.get("search"))
+        return state
+
+
+class InMemorySessionStore:
+    """
+    Process-local session store with LRU eviction and an idle TTL.
+    Only suitable for a single worker; use MongoSessionStore to share
+    sessions between uvicorn workers.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl_seconds: int = SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> SessionState:
+        now = time.time()
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is not None and now - state.last_seen > self.ttl_seconds:
+                state = None
+            if state is None:
+                state = SessionState(session_id)
+                self._sessions[session_id] = state
+            else:
+                self._sessions.move_to_end(session_id)
+            state.last_seen = now
+            self._evict(now)
+            return state
+
+    def save(self, state: SessionState):
+        # States are shared objects; nothing to write back
+        pass
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _evict(self, now):
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        # Oldest entries are at the front, so stop at the first live one
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_seen <= self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+
+
+class MongoSessionStore:
+    """
+    Session store backed by a MongoDB collection, shared by every worker.
+    Idle sessions expire through a TTL index on updated_at. The collection
+    comes from get_collection on first use, so no connection is opened
+    before the server (or a forked worker) starts.
+    """
+
+    def __init__(self, get_collection, ttl_seconds: int = SESSION_TTL_SECONDS):
+        self._get_collection = get_collection
+        self._collection = None
+        self._lock = threading.Lock()
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    collection = self._get_collection()
+                    collection.create_index("updated_at", expireAfterSeconds=self.ttl_seconds)
+                    self._collection = collection
+        return self._collection
+
+    def get(self, session_id: str) -> SessionState:
+        data = self.collection.find_one({"_id": session_id})
+        return SessionState.from_dict(data) if data else SessionState(session_id)
+
+    def save(self, state: SessionState):
+        from datetime import datetime, timezone
+
+        data = state.to_dict()
+        data["updated_at"] = datetime.now(timezone.utc)
+        self.collection.replace_one({"_id": state.session_id}, data, upsert=True)
+
+    def delete(self, session_id: str):
+        self.collection.delete_one({"_id": session_id})
+
+
+def create_session_store(backend: str = None):
+    """Build the store selected by CHAT_SESSION_BACKEND ("memory" or "mongo")."""
+    backend = backend or os.getenv("CHAT_SESSION_BACKEND", "memory")
+    if backend == "mongo":
+        from car_database import get_database
+        name = os.getenv("CHAT_SESSION_COLLECTION", "chat_sessions")
+        return MongoSessionStore(lambda: get_database()[name])
+    return InMemorySessionStore()
@@ -0,0 +1,232 @@
+"""
+Per-stage timings and branch counters for chat turns, exported in the
+Prometheus text format.
+
+Each turn decides once whether it is sampled (TRACE_SAMPLE_RATE, adjustable
+at runtime with set_sample_rate); stages of unsampled turns cost a context
+variable lookup. Branch counters are cheap and always recorded.
+
+    with telemetry.turn():
+        with telemetry.stage("search_cars"):
+            ...
+        telemetry.set_branch("db")
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+
+# Upper bounds in seconds; the last bucket is +Inf
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_sample_rate = TRACE_SAMPLE_RATE
+_current_turn = contextvars.ContextVar("chat_turn", default=None)
+
+
+def set_sample_rate(rate: float):
+    """Fraction of turns (0..1) whose stages are timed; takes effect immediately."""
+    global _sample_rate
+    _sample_rate = min(1.0, max(0.0, float(rate)))
+
+
+def get_sample_rate() -> float:
+    return _sample_rate
+
+
+class Histogram:
+    """Thread-safe labelled histogram with fixed buckets."""
+
+    def __init__(self, name, help_text, label, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}  # label value -> [bucket counts..., sum]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for value, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{self.label}="{value}"}} {cumulative}')
+        return lines
+
+
+class Counter:
+    """Thread-safe labelled counter."""
+
+    def __init__(self, name, help_text, label):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value, amount=1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        lines.extend(f'{self.name}{{{self.label}="{key}"}} {value}' for key, value in sorted(values.items()))
+        return lines
+
+
+stage_seconds = Histogram("chat_stage_seconds", "Time spent in each chat pipeline stage.", "stage")
+turn_seconds = Histogram("chat_turn_seconds", "End-to-end chat turn latency by answering branch.", "branch")
+turns_total = Counter("chat_turns_total", "Chat turns by the branch that answered them.", "branch")
+
+# name -> (help, callable returning a number) for values owned by other modules
+_gauges = {}
+# callback(branch, seconds, fields) run as every turn ends
+_turn_listeners = []
+
+
+def register_gauge(name, help_text, read):
+    _gauges[name] = (help_text, read)
+
+
+def on_turn(callback):
+    """
+    Call callback(branch, seconds, fields) at the end of every turn, on the
+    thread that ran it, with the fields recorded by annotate(). It runs on
+    the request path, so it must only hand the data off.
+    """
+    _turn_listeners.append(callback)
+
+
+class Turn:
+    """Per-turn trace state, shared with executor threads via the context."""
+
+    __slots__ = ("sampled", "branch", "fields")
+
+    def __init__(self, sampled):
+        self.sampled = sampled
+        self.branch = "rule"
+        self.fields = {}
+
+
+class turn:
+    """Context manager wrapping one chat turn."""
+
+    __slots__ = ("_turn", "_token", "_start")
+
+    def __enter__(self):
+        self._turn = Turn(_sample_rate >= 1.0 or random.random() < _sample_rate)
+        self._token = _current_turn.set(self._turn)
+        self._start = time.perf_counter()
+        return self._turn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _current_turn.reset(self._token)
+        except ValueError:
+            # A streamed turn closed from another context (client went away)
+            pass
+        branch = "error" if exc_type is not None else self._turn.branch
+        seconds = time.perf_counter() - self._start
+        turns_total.inc(branch)
+        if self._turn.sampled:
+            turn_seconds.observe(branch, seconds)
+        for callback in _turn_listeners:
+            callback(branch, seconds, self._turn.fields)
+        return False
+
+
+def set_branch(branch):
+    """Record which branch answered the current turn (rule, db, cache, llm, ...)."""
+    current = _current_turn.get()
+    if current is not None:
+        current.branch = branch
+
+
+def annotate(**fields):
+    """Attach fields (session, message, cars shown, ...) to the current turn's record."""
+    current = _current_turn.get()
+    if current is not None:
+        current.fields.update(fields)
+
+
+def untraced(func, *args):
+    """
+    func(*args) in a fresh context holding a throwaway unsampled turn, so
+    background work (prefetches) never times stages into the request
+    histograms, nor sets the branch or fields of a request's turn.
+    """
+    context = contextvars.Context()
+    context.run(_current_turn.set, Turn(False))
+    return context.run(func, *args)
+
+
+def _is_sampled():
+    current = _current_turn.get()
+    if current is None:
+        # Work outside a turn (startup, CLI, benchmarks) samples independently
+        return _sample_rate >= 1.0 or random.random() < _sample_rate
+    return current.sampled
+
+
+class stage:
+    """Context manager timing one stage of the current turn when it is sampled."""
+
+    __slots__ = ("name", "_start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter() if _is_sampled() else None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._start is not None:
+            stage_seconds.observe(self.name, time.perf_counter() - self._start)
+        return False
+
+
+def timed(name):
+    """Decorator form of stage()."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def exposition() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in (turns_total, turn_seconds, stage_seconds):
+        lines.extend(metric.exposition())
+    lines.append("# HELP chat_trace_sample_rate Fraction of turns whose stages are timed.")
+    lines.append("# TYPE chat_trace_sample_rate gauge")
+    lines.append(f"chat_trace_sample_rate {_sample_rate}")
+    for name, (help_text, read) in sorted(_gauges.items()):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {read()}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,240 @@
+"""
+Asynchronous, batched analytics log of chat turns.
+
+At the end of every turn a compact record (time, session, message, branch,
+cars shown, latency) is appended to a bounded ring buffer; that is all the
+request path pays. A background writer drains the buffer in batches, adds
+the extracted entities and writes them with insert_many to a MongoDB
+collection or to rotating gzip-compressed JSONL files. When the writer
+falls behind, the oldest records are overwritten and counted as dropped.
+close() flushes what is left. It runs once, from the API's lifespan hook
+or else at exit; records logged after it are counted as dropped.
+
+    TURN_LOG_BACKEND=file TURN_LOG_DIR=turn_logs uvicorn api:app
+"""
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from entity_extractor_manager import Scan, entities_of
+from telemetry import on_turn
+
+# "none", "mongo" (TURN_LOG_COLLECTION) or "file" (TURN_LOG_DIR)
+TURN_LOG_BACKEND = os.getenv("TURN_LOG_BACKEND", "none")
+TURN_LOG_COLLECTION = os.getenv("TURN_LOG_COLLECTION", "chat_turns")
+TURN_LOG_DIR = os.getenv("TURN_LOG_DIR", "turn_logs")
+# Records held in memory; beyond this the oldest are dropped
+TURN_LOG_CAPACITY = int(os.getenv("TURN_LOG_CAPACITY", "10000"))
+TURN_LOG_BATCH_SIZE = int(os.getenv("TURN_LOG_BATCH_SIZE", "500"))
+# Longest a record waits in the buffer before being written
+TURN_LOG_FLUSH_SECONDS = float(os.getenv("TURN_LOG_FLUSH_SECONDS", "1.0"))
+# Start a new file after this many uncompressed bytes or seconds
+TURN_LOG_ROTATE_BYTES = int(os.getenv("TURN_LOG_ROTATE_BYTES", str(64 * 1024 * 1024)))
+TURN_LOG_ROTATE_SECONDS = float(os.getenv("TURN_LOG_ROTATE_SECONDS", "3600"))
+
+
+# === Sinks ===
+class MongoSink:
+    """Writes batches with one unordered insert_many."""
+
+    def __init__(self, get_collection):
+        self._get_collection = get_collection
+        self._collection = None
+
+    def write(self, records):
+        if self._collection is None:
+            self._collection = self._get_collection()
+        for record in records:
+            record["ts"] = datetime.fromtimestamp(record["ts"], timezone.utc)
+        self._collection.insert_many(records, ordered=False)
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """
+    Appends batches to gzip-compressed JSONL files named
+    turns-<start time>-<pid>-<n>.jsonl.gz, rotated by size and age. Every
+    batch is flushed, so a file is readable up to its last batch even
+    while it is still open.
+    """
+
+    def __init__(self, directory, rotate_bytes=TURN_LOG_ROTATE_BYTES, rotate_seconds=TURN_LOG_ROTATE_SECONDS):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self._file = None
+        self._sequence = 0
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        path = os.path.join(self.directory, f"turns-{stamp}-{os.getpid()}-{self._sequence}.jsonl.gz")
+        self._file = gzip.open(path, "wb")
+        self._written = 0
+        self._opened = time.monotonic()
+
+    def write(self, records):
+        if self._file is not None and (
+            self._written >= self.rotate_bytes or time.monotonic() - self._opened >= self.rotate_seconds
+        ):
+            self.close()
+        if self._file is None:
+            self._open()
+        data = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        data = data.encode("utf-8")
+        self._file.write(data)
+        self._file.flush()
+        self._written += len(data)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# === Buffer and writer ===
+class TurnLog:
+    """Bounded ring buffer of turn records drained by a background writer thread."""
+
+    def __init__(self, sink, capacity=TURN_LOG_CAPACITY, batch_size=TURN_LOG_BATCH_SIZE,
+                 flush_seconds=TURN_LOG_FLUSH_SECONDS):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._buffer = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.logged = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+
+    def log(self, record):
+        """
+        Queue a record; never blocks on I/O. Overwrites the oldest when
+        full; after close() records are counted as dropped.
+        """
+        with self._lock:
+            if self._closed:
+                self.dropped += 1
+                return
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(record)
+            self.logged += 1
+            pending = len(self._buffer)
+        if self._thread is None:
+            self._start()
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def _start(self):
+        # Started by the first record, so no thread exists before workers fork
+        with self._lock:
+            if self._thread is None and not self._stop.is_set():
+                self._thread = threading.Thread(target=self._run, name="turn-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def _drain(self, limit):
+        with self._lock:
+            return [self._buffer.popleft() for _ in range(min(limit, len(self._buffer)))]
+
+    def flush(self):
+        """Write everything buffered so far, in batches."""
+        with self._write_lock:
+            while True:
+                batch = self._drain(self.batch_size)
+                if not batch:
+                    return
+                for record in batch:
+                    # Scanned directly: scan() would time an "extract" stage outside any turn
+                    message = record.get("message")
+                    record["entities"] = entities_of(Scan(message.lower())) if message else {}
+                try:
+                    self.sink.write(batch)
+                    self.written += len(batch)
+                except Exception as e:
+                    self.failed += len(batch)
+                    print(f"Turn log write failed, {len(batch)} records lost: {e}")
+
+    def close(self):
+        """Stop the writer, flush the remaining records and close the sink; later calls do nothing."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+        self.sink.close()
+
+    def stats(self):
+        return {
+            "pending": len(self._buffer),
+            "logged": self.logged,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+def create_turn_log(backend=TURN_LOG_BACKEND):
+    """The TurnLog selected by TURN_LOG_BACKEND, or None when logging is off."""
+    if backend == "mongo":
+        from car_database import get_database
+        return TurnLog(MongoSink(lambda: get_database()[TURN_LOG_COLLECTION]))
+    if backend == "file":
+        return TurnLog(JsonlSink(TURN_LOG_DIR))
+    return None
+
+
+turn_log = create_turn_log()
+
+
+def _record_turn(branch, seconds, fields):
+    turn_log.log({
+        "ts": time.time(),
+        "session": fields.get("session"),
+        "message": fields.get("message"),
+        "branch": branch,
+        "cars": fields.get("cars", []),
+        "latency_ms": round(seconds * 1000, 3),
+    })
+
+
+if turn_log is not None:
+    on_turn(_record_turn)
+    atexit.register(turn_log.close)
+
+
+def turn_log_stats():
+    if turn_log is None:
+        return {"enabled": False}
+    return {"enabled": True, "backend": TURN_LOG_BACKEND, **turn_log.stats()}
+
+
+def close_turn_log():
+    """Flush and close the turn log now (the API's lifespan) instead of at exit."""
+    if turn_log is not None:
+        turn_log.close()
+        atexit.unregister(turn_log.close)